@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import argparse
+import base64
+import binascii
+import functools
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import anyio.to_thread
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from config import API_HOST, API_MAX_PAGE_SIZE, API_PORT, API_WORKERS
+from database import (
+    PatientCursor,
+    delete_patient,
+    fetch_logs,
+    fetch_patients,
+    find_patients,
+    flush_audit_log,
+    get_patient,
+    get_user_by_username,
+    init_db,
+    insert_patient,
+    iter_patient_csv,
+    log_action,
+    patient_cursor,
+    search_patients,
+    search_terms,
+    update_patient,
+)
+from security import verify_password
+
+User = Dict[str, Any]
+Handler = Callable[[Request, User], Awaitable[Response]]
+
+# Roles allowed to create, edit and delete records, as in the dashboard's Intake / Update section.
+EDITOR_ROLES = ("admin", "receptionist")
+
+
+def _authenticate(header: str) -> Optional[User]:
+    scheme, _, encoded = header.partition(" ")
+    if scheme.lower() != "basic" or not encoded:
+        return None
+    try:
+        username, _, password = base64.b64decode(encoded, validate=True).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    user = get_user_by_username(username)
+    if not user or user.get("disabled") or not verify_password(password, user["password"]):
+        log_action(None, "unauthorized", "login_failed", f"username={username}, via=api")
+        return None
+    return user
+
+
+def requires(*roles: str) -> Callable[[Handler], Callable[[Request], Awaitable[Response]]]:
+    """HTTP Basic auth against the dashboard accounts, limited to ``roles`` (any role when empty)."""
+
+    def decorate(handler: Handler) -> Callable[[Request], Awaitable[Response]]:
+        @functools.wraps(handler)
+        async def endpoint(request: Request) -> Response:
+            header = request.headers.get("authorization")
+            user = await run_in_threadpool(_authenticate, header) if header else None
+            if user is None:
+                raise HTTPException(401, "Authentication required", {"WWW-Authenticate": 'Basic realm="hospital"'})
+            if roles and user["role"] not in roles:
+                raise HTTPException(403, f"Requires role: {', '.join(roles)}")
+            return await handler(request, user)
+
+        return endpoint
+
+    return decorate
+
+
+async def _audit(user: User, action: str, details: str) -> None:
+    # log_action may write inline (AUDIT_DURABILITY=sync) or block on a full queue.
+    await run_in_threadpool(log_action, user["user_id"], user["role"], action, details)
+
+
+def _int_param(request: Request, name: str, default: Optional[int] = None, maximum: Optional[int] = None) -> Optional[int]:
+    value = request.query_params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise HTTPException(400, f"{name} must be an integer") from None
+    if number < 1:
+        raise HTTPException(400, f"{name} must be positive")
+    return min(number, maximum) if maximum else number
+
+
+def _flag(request: Request, name: str) -> bool:
+    return request.query_params.get(name, "").lower() in ("1", "true", "yes")
+
+
+def _include_sensitive(request: Request, user: User) -> bool:
+    # Decrypted fields are opt-in even for admins, so integrations only see PII they ask for.
+    if not _flag(request, "sensitive"):
+        return False
+    if user["role"] != "admin":
+        raise HTTPException(403, "Only admins may read decrypted patient data")
+    return True
+
+
+async def _json_body(request: Request, *fields: str) -> Dict[str, str]:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Request body must be JSON") from None
+    if not isinstance(body, dict):
+        raise HTTPException(400, "Request body must be a JSON object")
+    values = {}
+    for field in fields:
+        value = body.get(field)
+        if value is None:
+            continue
+        if not isinstance(value, str) or not value.strip():
+            raise HTTPException(400, f"{field} must be a non-empty string")
+        values[field] = value.strip()
+    return values
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _cursor_param(request: Request) -> Optional[PatientCursor]:
+    # Cursors are "<date_added>,<patient_id>" as returned in "next".
+    value = request.query_params.get("after")
+    if not value:
+        return None
+    date_added, _, patient_id = value.rpartition(",")
+    if not patient_id.isdigit() or _parse_date(date_added) is None:
+        raise HTTPException(400, "after must be a cursor returned as 'next'")
+    return date_added, int(patient_id)
+
+
+async def health(request: Request) -> Response:
+    return JSONResponse({"status": "ok"})
+
+
+@requires()
+async def list_patients(request: Request, user: User) -> Response:
+    page_size = _int_param(request, "page_size", 50, API_MAX_PAGE_SIZE)
+    include_sensitive = _include_sensitive(request, user)
+    patients = await run_in_threadpool(
+        fetch_patients,
+        include_sensitive,
+        page_size=page_size,
+        after=_cursor_param(request),
+    )
+    await _audit(user, "view_patients", f"count={len(patients)}, sensitive={include_sensitive}, via=api")
+    following = None
+    if len(patients) == page_size:
+        date_added, patient_id = patient_cursor(patients[-1])
+        following = f"{date_added},{patient_id}"
+    return JSONResponse({"patients": patients, "next": following})
+
+
+@requires()
+async def read_patient(request: Request, user: User) -> Response:
+    patient_id = request.path_params["patient_id"]
+    include_sensitive = _include_sensitive(request, user)
+    patient = await run_in_threadpool(get_patient, patient_id, include_sensitive)
+    if patient is None:
+        raise HTTPException(404, "Patient not found")
+    await _audit(user, "view_patient", f"patient_id={patient_id}, sensitive={include_sensitive}, via=api")
+    return JSONResponse(patient)
+
+
+@requires()
+async def search(request: Request, user: User) -> Response:
+    query = request.query_params.get("q", "")
+    added_after = request.query_params.get("added_after")
+    added_before = request.query_params.get("added_before")
+    if not (query.strip() or added_after or added_before):
+        raise HTTPException(400, "Provide q, added_after or added_before")
+    if query.strip() and not search_terms(query):
+        raise HTTPException(400, "q must contain at least one letter or digit")
+    for name, value in (("added_after", added_after), ("added_before", added_before)):
+        if value and _parse_date(value) is None:
+            raise HTTPException(400, f"{name} must be an ISO date, e.g. 2024-01-31")
+    include_sensitive = _include_sensitive(request, user)
+    patients = await run_in_threadpool(
+        search_patients,
+        query,
+        _int_param(request, "limit", 50, API_MAX_PAGE_SIZE),
+        added_after=added_after,
+        added_before=added_before,
+        include_sensitive=include_sensitive,
+    )
+    # The query may contain PII, so only the outcome is logged
+    await _audit(user, "search_patients", f"results={len(patients)}, sensitive={include_sensitive}, via=api")
+    return JSONResponse({"patients": patients})
+
+
+@requires()
+async def find(request: Request, user: User) -> Response:
+    name = request.query_params.get("name", "").strip()
+    contact = request.query_params.get("contact", "").strip()
+    if not (name or contact):
+        raise HTTPException(400, "Provide name, contact or both")
+    matches = await run_in_threadpool(
+        find_patients,
+        name=name or None,
+        contact=contact or None,
+        include_sensitive=_include_sensitive(request, user),
+    )
+    # Search terms are PII, so only the outcome is logged
+    await _audit(user, "find_patient", f"matches={len(matches)}, via=api")
+    return JSONResponse({"patients": matches})
+
+
+@requires(*EDITOR_ROLES)
+async def create_patient(request: Request, user: User) -> Response:
+    body = await _json_body(request, "name", "contact", "diagnosis")
+    if len(body) != 3:
+        raise HTTPException(400, "name, contact and diagnosis are required")
+    patient_id = await run_in_threadpool(insert_patient, body["name"], body["contact"], body["diagnosis"])
+    await _audit(user, "add_patient", f"patient_id={patient_id}, via=api")
+    return JSONResponse({"patient_id": patient_id}, status_code=201)
+
+
+@requires(*EDITOR_ROLES)
+async def edit_patient(request: Request, user: User) -> Response:
+    patient_id = request.path_params["patient_id"]
+    body = await _json_body(request, "contact", "diagnosis")
+    if not body:
+        raise HTTPException(400, "Provide contact, diagnosis or both")
+    if not await run_in_threadpool(functools.partial(update_patient, patient_id, **body)):
+        raise HTTPException(404, "Patient not found")
+    await _audit(user, "update_patient", f"patient_id={patient_id}, via=api")
+    return Response(status_code=204)
+
+
+@requires(*EDITOR_ROLES)
+async def remove_patient(request: Request, user: User) -> Response:
+    patient_id = request.path_params["patient_id"]
+    if not await run_in_threadpool(delete_patient, patient_id):
+        raise HTTPException(404, "Patient not found")
+    await _audit(user, "delete_patient", f"patient_id={patient_id}, via=api")
+    return Response(status_code=204)
+
+
+@requires("admin")
+async def list_logs(request: Request, user: User) -> Response:
+    user_id = _int_param(request, "user_id")
+    logs = await run_in_threadpool(
+        fetch_logs,
+        _int_param(request, "limit", 200, API_MAX_PAGE_SIZE),
+        action=request.query_params.get("action") or None,
+        user_id=user_id,
+    )
+    await _audit(user, "view_logs", "Audit trail read via api")
+    return JSONResponse({"logs": logs})
+
+
+@requires("admin")
+async def export_patients(request: Request, user: User) -> Response:
+    include_sensitive = not _flag(request, "anonymized")
+    compress = _flag(request, "gzip")
+    await _audit(user, "export", f"Patient export via api, sensitive={include_sensitive}")
+    # StreamingResponse pulls each chunk on the worker pool, so one chunk is decrypted at a time.
+    return StreamingResponse(
+        iter_patient_csv(include_sensitive=include_sensitive, compress=compress),
+        media_type="application/gzip" if compress else "text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="patients.csv{".gz" if compress else ""}"',
+        },
+    )
+
+
+async def http_error(request: Request, exc: HTTPException) -> Response:
+    return JSONResponse({"error": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    # SQLite and Fernet calls block, so they run on worker threads. Capping the
+    # threads bounds concurrent connections and decrypt work; excess requests
+    # wait on the event loop instead of piling onto the database.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_WORKERS
+    await run_in_threadpool(init_db)
+    yield
+    await run_in_threadpool(flush_audit_log)
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health),
+        Route("/patients", list_patients, methods=["GET"]),
+        Route("/patients", create_patient, methods=["POST"]),
+        Route("/patients/search", search),
+        Route("/patients/find", find),
+        Route("/patients/export.csv", export_patients),
+        Route("/patients/{patient_id:int}", read_patient, methods=["GET"]),
+        Route("/patients/{patient_id:int}", edit_patient, methods=["PATCH"]),
+        Route("/patients/{patient_id:int}", remove_patient, methods=["DELETE"]),
+        Route("/logs", list_logs),
+    ],
+    exception_handlers={HTTPException: http_error},
+    lifespan=lifespan,
+)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Headless JSON API over the hospital database.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,95 @@
 # This library is for future compatibility
 from __future__ import annotations 
 
+import time
+# Script start, for the import-time / first-render startup report
+SCRIPT_STARTED = time.perf_counter()
+
+import json
+import sys
 from datetime import datetime, timedelta
-from typing import List
+from typing import TYPE_CHECKING, Optional, Tuple
 
-import pandas as pd
 import streamlit as st
+# compressed monthly audit archive (entries older than AUDIT_HOT_DAYS)
+from archive import list_segments, search_archived_logs, start_archive_job
+# hash-chained audit log with signed checkpoints
+from audit_chain import chain_status, start_verify_job, verify_audit_chain
+# online database snapshots (SQLite backup API)
+from backup import create_backup, list_backups, start_backup_job
+# Data retention period in days, background retention/backup/archive schedules and SQL profiler switch
+from config import (
+    AUDIT_ARCHIVE_INTERVAL,
+    AUDIT_HOT_DAYS,
+    AUDIT_VERIFY_INTERVAL,
+    BACKUP_INTERVAL,
+    RETENTION_DAYS,
+    RETENTION_JOB_INTERVAL,
+    RETENTION_MODE,
+    SQL_PROFILE,
+    MissingKeyError,
+)
 # database operations
 from database import (
+    change_version,
+    count_expired_patients,
+    count_stale_masks,
     delete_patient,
+    fetch_activity_rollups,
+    fetch_expired_patients,
     fetch_log_counts_by_day,
-    fetch_logs,
-    fetch_patients,
+    fetch_logs_frame,
+    fetch_patients_frame,
+    find_patients,
     get_user_by_username,
     init_db,
     insert_patient,
+    iter_patient_csv,
     log_action,
     patient_count,
+    patient_cursor,
     refresh_anonymized_fields,
+    retention_run_status,
+    run_retention_now,
+    search_patients,
+    sql_profile_report,
+    start_retention_job,
     update_patient,
 )
+# SQL statement profiler (populated only when SQL_PROFILE is on)
+from profiler import sql_profiler
 # password hashing and verification
 from security import verify_password 
+
+# pandas costs ~0.4s to import, so sections import it when they render a table or chart
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Seconds spent importing this script's dependencies on this run
+IMPORT_SECONDS = time.perf_counter() - SCRIPT_STARTED
+
+# Startup timings, kept once per server process (Streamlit re-executes this script on every rerun)
+@st.cache_resource(show_spinner=False)
+def startup_timings() -> dict:
+    return {
+        "process_started": datetime.utcnow(),
+        "import_s": IMPORT_SECONDS,
+        "init_s": None,
+        "first_render_s": None,
+    }
+
 # Application start time for uptime calculation
-APP_START = datetime.utcnow() 
-# Data retention period in days
-RETENTION_DAYS = 365 
+APP_START = startup_timings()["process_started"]
+# Patient records shown (and decrypted) per page in the Patients workspace
+PATIENT_PAGE_SIZE = 50
+# Patient pages kept by the Streamlit data cache (entries for older change versions age out)
+PATIENT_CACHE_ENTRIES = 64
+# Expired records listed per page in the retention monitor
+RETENTION_PAGE_SIZE = 20
 
 #  Application theme and session management 
-def apply_dark_theme():
-    """Apply custom dark slate theme with glassmorphism CSS"""
-    st.markdown("""
+# Dark slate theme with glassmorphism CSS (a module constant, not rebuilt per call)
+DARK_THEME_CSS = """
     <style>
         /* Import Shield Icon Font */
         @import url('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css');
@@ -464,7 +523,11 @@ def apply_dark_theme():
             filter: drop-shadow(0 2px 8px rgba(59, 130, 246, 0.5));
         }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def apply_dark_theme():
+    """Apply custom dark slate theme with glassmorphism CSS"""
+    st.markdown(DARK_THEME_CSS, unsafe_allow_html=True)
 
 # Initialize session state variables
 def init_session() -> None:
@@ -477,6 +540,9 @@ def init_session() -> None:
     # Last data sync timestamp
     if "last_sync" not in st.session_state:
         st.session_state.last_sync = None
+    # Keyset cursor of the patient page being viewed
+    if "patient_page" not in st.session_state:
+        reset_patient_page()
 
 # Render login form with GDPR consent
 def render_login() -> None:
@@ -517,7 +583,7 @@ def render_login() -> None:
             except Exception as exc:
                 st.error(f"Unable to reach the identity service: {exc}")
                 return
-            if not user or not verify_password(password, user["password"]):
+            if not user or user.get("disabled") or not verify_password(password, user["password"]):
                 log_action(None, "unauthorized", "login_failed", f"username={username}")
                 st.error("Invalid credentials or access denied.")
                 return
@@ -538,26 +604,73 @@ def logout() -> None:
     st.session_state.auth = {"logged_in": False, "user": None}
     st.rerun()
 
-@st.cache_data(ttl=60) # Cache patient data for 60 seconds
+@st.cache_data(max_entries=PATIENT_CACHE_ENTRIES) # Cache patient pages until the data changes
+
+# Cached columnar fetch of patient records (one keyset page when page_size is set).
+# `version` is the database change counter: any committed write, from any session or
+# process, produces a new cache key, so pages never outlive the data they were read from.
+def cached_patients(
+    include_sensitive: bool,
+    page_size: Optional[int] = None,
+    after: Optional[Tuple[str, int]] = None,
+    before: Optional[Tuple[str, int]] = None,
+    version: int = 0,
+) -> pd.DataFrame:
+    return fetch_patients_frame(
+        include_sensitive=include_sensitive,
+        page_size=page_size,
+        after=after,
+        before=before,
+    )
+
+# Go back to the newest page of patients
+def reset_patient_page() -> None:
+    st.session_state.patient_page = {"after": None, "before": None, "number": 1}
 
-# Cached fetch of patient records
-def cached_patients(include_sensitive: bool) -> List[dict]:
-    records = fetch_patients(include_sensitive=include_sensitive)
+# Load only the patient page selected by the stored keyset cursor
+def load_patient_page(include_sensitive: bool) -> pd.DataFrame:
+    page = st.session_state.patient_page
+    version = change_version()
+    records = cached_patients(include_sensitive, PATIENT_PAGE_SIZE, page["after"], page["before"], version)
+    # Records may have been added/removed since the cursor was taken; fall back to the first page
+    if page["number"] > 1 and (records.empty or (page["before"] and len(records) < PATIENT_PAGE_SIZE)):
+        reset_patient_page()
+        records = cached_patients(include_sensitive, PATIENT_PAGE_SIZE, None, None, version)
     return records
 
+# Previous/next controls for the patient registry
+def render_page_controls(patients: pd.DataFrame) -> None:
+    page = st.session_state.patient_page
+    col1, col2, col3 = st.columns([1, 3, 1])
+    if col1.button("◀ Previous", disabled=page["number"] <= 1, use_container_width=True):
+        if page["number"] <= 2:
+            reset_patient_page()
+        else:
+            st.session_state.patient_page = {
+                "after": None,
+                "before": patient_cursor(patients.iloc[0]),
+                "number": page["number"] - 1,
+            }
+        st.rerun()
+    col2.caption(f"Page {page['number']} · showing {len(patients)} record(s)")
+    if col3.button("Next ▶", disabled=len(patients) < PATIENT_PAGE_SIZE, use_container_width=True):
+        st.session_state.patient_page = {
+            "after": patient_cursor(patients.iloc[-1]),
+            "before": None,
+            "number": page["number"] + 1,
+        }
+        st.rerun()
+
 # Render operational overview with metrics and visualizations
-def render_overview(role: str) -> List[dict]:
+def render_overview(role: str) -> None:
     st.markdown('<div class="section-header"><i class="fas fa-chart-line section-icon"></i><h2 style="margin:0;">Operational Overview</h2></div>', unsafe_allow_html=True)
-    # Fetch patient data based on role
-    include_sensitive = role == "admin"
+    # Overview only needs aggregate counts, never the full patient list
     try:
-        patients = cached_patients(include_sensitive)
+        total_patients = patient_count()
         st.session_state.last_sync = datetime.utcnow()
     except Exception as exc:
         st.error(f"Unable to load patients: {exc}")
-        return []
-
-    total_patients = patient_count()
+        return
     
     # Metrics in columns
     col1, col2, col3 = st.columns(3)
@@ -578,63 +691,130 @@ def render_overview(role: str) -> List[dict]:
     if role == "admin":# Admin-specific controls and data access
         st.success("Admin access: raw + anonymized datasets available.")
         col1, col2 = st.columns(2)
+        stale_masks = count_stale_masks()
+        col1.caption(f"{stale_masks} record(s) masked by outdated rules")
+        force_refresh = col1.checkbox("Recompute every record", value=False)
         if col1.button("Refresh Anonymized Fields"):# Button to refresh anonymized data
             try:
-                refresh_anonymized_fields()# Clear cache and log action
-                cached_patients.clear()# Clear cached patient data
+                progress_bar = col1.progress(0.0, text="Refreshing anonymized fields...")
+                # Only out-of-date rows are re-masked unless a full recompute is requested
+                updated = refresh_anonymized_fields(
+                    force=force_refresh,
+                    progress=lambda done, total: progress_bar.progress(
+                        done / total, text=f"Re-masked {done} of {total} record(s)"
+                    ),
+                )
 
-                log_action(current_user_id(), role, "reanonymize", "Full refresh triggered")
+                log_action(
+                    current_user_id(),
+                    role,
+                    "reanonymize",
+                    f"{'Full' if force_refresh else 'Incremental'} refresh, {updated} record(s) re-masked",
+                )
                 st.success("Anonymized fields updated.")
                 st.rerun()
             except Exception as exc:
                 st.error(f"Unable to refresh anonymized data: {exc}")
         
         with col2:# Provide patient data download option
-            df = pd.DataFrame(patients)
-            csv = df.to_csv(index=False).encode("utf-8")
+            compress = st.checkbox("Compress backup (gzip)", value=True)
+            # The CSV is only generated when the button is clicked, streamed chunk by chunk
             downloaded = st.download_button(
                 "Download Patient Backup (CSV)",
-                csv,
-                file_name="patient_backup.csv",
-                mime="text/csv",
+                data=lambda: b"".join(iter_patient_csv(include_sensitive=True, compress=compress)),
+                file_name="patient_backup.csv.gz" if compress else "patient_backup.csv",
+                mime="application/gzip" if compress else "text/csv",
             )
             if downloaded:
                 log_action(current_user_id(), role, "export", "Downloaded patient backup")
+            # Restorable, still-encrypted database snapshot taken while the app keeps serving
+            if st.button("Create Database Snapshot"):
+                try:
+                    with st.spinner("Copying database..."):
+                        snapshot = create_backup()
+                    log_action(current_user_id(), role, "backup", f"Requested snapshot {snapshot['file']}")
+                    st.success(f"Snapshot {snapshot['file']} written.")
+                except Exception as exc:
+                    st.error(f"Unable to create snapshot: {exc}")
+            snapshots = list_backups()
+            if snapshots:
+                latest = snapshots[0]
+                st.caption(
+                    f"Latest snapshot {latest['created_at'][:19]} UTC: "
+                    f"{latest['size_bytes'] / 1_000_000:.1f} MB in {latest['duration_s']:.2f}s "
+                    f"({latest['throughput_mb_s']:.1f} MB/s), {len(snapshots)} kept"
+                )
 
-    display_retention_summary(patients)# Show data retention summary
+    display_retention_summary(role)# Show data retention summary
     display_activity_viz(role)# Show activity visualizations
-    return patients
 
 
-def display_retention_summary(patients: List[dict]) -> None:# Show data retention summary
-    if not patients:
+def display_retention_summary(role: str) -> None:# Show data retention summary
+    import pandas as pd
+    # Expired records are counted and listed by an indexed range query in SQLite
+    try:
+        stale_count = count_expired_patients(RETENTION_DAYS)
+    except Exception as exc:
+        st.error(f"Unable to check data retention: {exc}")
         return
-    # Identify stale records beyond retention period
-    retention_limit = datetime.utcnow() - timedelta(days=RETENTION_DAYS)
-    # Filter patients added before retention limit
-    stale = [p for p in patients if datetime.fromisoformat(p["date_added"]) < retention_limit]
     # Display in expandable section
-    with st.expander(f"Data Retention Monitor ({len(stale)} records require review)"):
+    with st.expander(f"Data Retention Monitor ({stale_count} records require review)"):
         st.write(
-            f"Records expire after {RETENTION_DAYS} days. {len(stale)} record(s) require review."
+            f"Records expire after {RETENTION_DAYS} days. {stale_count} record(s) require review."
         )
-        if stale:
-            st.table(
-                # Display stale records in a table
-                pd.DataFrame(
-                    [
-                        {
-                            "Patient": p.get("anonymized_name", p.get("name", "")),
-                            "Added": p["date_added"],
-                        }
-                        for p in stale
-                    ]
-                )
+        if not stale_count:
+            return
+        # Keyset cursors of the retention pages visited so far (oldest records first)
+        cursors = st.session_state.setdefault("retention_cursors", [None])
+        stale = fetch_expired_patients(RETENTION_DAYS, page_size=RETENTION_PAGE_SIZE, after=cursors[-1])
+        if not stale and len(cursors) > 1:
+            st.session_state.retention_cursors = [None]
+            st.rerun()
+        st.table(
+            # Display stale records in a table
+            pd.DataFrame(
+                [
+                    {
+                        "Patient": p["anonymized_name"],
+                        "Added": p["date_added"],
+                    }
+                    for p in stale
+                ]
             )
+        )
+        col1, col2, col3 = st.columns([1, 3, 1])
+        if col1.button("◀ Older", key="retention_prev", disabled=len(cursors) <= 1):
+            cursors.pop()
+            st.rerun()
+        col2.caption(f"Page {len(cursors)} of {-(-stale_count // RETENTION_PAGE_SIZE)}")
+        if col3.button("Newer ▶", key="retention_next", disabled=len(stale) < RETENTION_PAGE_SIZE):
+            cursors.append(patient_cursor(stale[-1]))
+            st.rerun()
+        if role == "admin":
+            # Manual trigger for the batched retention job (also runs on a schedule when configured);
+            # it runs on a background thread so the page stays responsive during a long purge
+            run = retention_run_status()
+            if st.button(
+                f"Run retention job now ({RETENTION_MODE})",
+                key="retention_run",
+                disabled=run["running"],
+            ):
+                if not run_retention_now(RETENTION_DAYS, RETENTION_MODE, user_id=current_user_id(), role=role):
+                    st.warning("A retention pass is already running.")
+                st.session_state.retention_cursors = [None]
+                run = retention_run_status()
+            if run["running"]:
+                st.info(f"Retention job running: {run['processed']} record(s) processed so far.")
+                st.button("Refresh progress", key="retention_refresh")
+            elif run["error"]:
+                st.error(f"Retention job failed: {run['error']}")
+            elif run["finished_at"]:
+                st.success(f"Retention job processed {run['processed']} record(s).")
 
 # Enhanced activity visualization with multiple charts
-def display_activity_viz(role: str) -> None:# Show activity visualizations
+def display_activity_viz(role: str) -> None:
     """Enhanced activity visualization with multiple charts"""
+    import pandas as pd
     if role != "admin":
         st.info("Activity visualization limited to admin role.")
         return
@@ -642,16 +822,13 @@ def display_activity_viz(role: str) -> None:# Show activity visualizations
     st.markdown('<div class="section-header"><i class="fas fa-chart-bar section-icon"></i><h2 style="margin:0;">System Analytics & Activity Insights</h2></div>', unsafe_allow_html=True)
     
     try:
-        # Fetch all logs for comprehensive analysis
-        all_logs = fetch_logs(limit=1000)
+        # Pre-aggregated rollups cover the full audit history in constant time
+        activity = fetch_activity_rollups()
         
-        if not all_logs:
+        if not activity["total_events"]:
             st.warning("No activity logs available yet.")
             return
         
-        logs_df = pd.DataFrame(all_logs)
-        logs_df['timestamp'] = pd.to_datetime(logs_df['timestamp'])
-        
         # Get daily activity stats
         log_stats = fetch_log_counts_by_day()
         
@@ -687,8 +864,7 @@ def display_activity_viz(role: str) -> None:# Show activity visualizations
             st.markdown("### Action Type Distribution")
             
             # Count actions by type
-            action_counts = logs_df['action'].value_counts().reset_index()
-            action_counts.columns = ['Action', 'Count']
+            action_counts = pd.DataFrame(list(activity["by_action"].items()), columns=['Action', 'Count'])
             
             # Display as bar chart
             st.bar_chart(action_counts.set_index('Action'), use_container_width=True)
@@ -710,8 +886,7 @@ def display_activity_viz(role: str) -> None:# Show activity visualizations
             st.markdown("### Activity by User Role")
             
             # Count actions by role
-            role_counts = logs_df['role'].value_counts().reset_index()
-            role_counts.columns = ['Role', 'Actions']
+            role_counts = pd.DataFrame(list(activity["by_role"].items()), columns=['Role', 'Actions'])
             
             # Display as bar chart
             st.bar_chart(role_counts.set_index('Role'), use_container_width=True)
@@ -732,15 +907,17 @@ def display_activity_viz(role: str) -> None:# Show activity visualizations
             
             # Cross-tab: Role vs Action Type
             st.markdown("#### Role vs Action Cross-Analysis")
-            role_action_pivot = pd.crosstab(logs_df['role'], logs_df['action'])
+            role_action_pivot = (
+                pd.DataFrame(activity["by_role_action"])
+                .pivot_table(index='role', columns='action', values='total', aggfunc='sum', fill_value=0)
+            )
             st.dataframe(role_action_pivot, use_container_width=True)
         
         with tab4:
             st.markdown("### Hourly Activity Pattern")
             
-            # Extract hour from timestamp
-            logs_df['hour'] = logs_df['timestamp'].dt.hour
-            hourly_counts = logs_df.groupby('hour').size().reset_index(name='count')
+            # Hourly totals come straight from the rollups
+            hourly_counts = pd.DataFrame(activity["by_hour"], columns=['hour', 'total']).rename(columns={'total': 'count'})
             
             # Ensure all 24 hours are represented
             all_hours = pd.DataFrame({'hour': range(24)})
@@ -771,30 +948,25 @@ def display_activity_viz(role: str) -> None:# Show activity visualizations
             col1, col2, col3, col4 = st.columns(4)
             # Total events
             with col1:
-                st.metric("Total Events", len(logs_df))
+                st.metric("Total Events", activity["total_events"])
             # Unique users
             with col2:
-                unique_users = logs_df['user_id'].nunique()
-                st.metric("Active Users", unique_users)
+                st.metric("Active Users", activity["active_users"])
             # Unique action types
             with col3:
-                unique_actions = logs_df['action'].nunique()
-                st.metric("Action Types", unique_actions)
+                st.metric("Action Types", len(activity["by_action"]))
             # Active days
             with col4:
-                # Calculate days with activity
-                days_active = logs_df['timestamp'].dt.date.nunique()
-                st.metric("Active Days", days_active)
+                st.metric("Active Days", activity["active_days"])
             # Divider
             st.divider()
             
             # Recent activity timeline
             st.markdown("#### Recent Activity Timeline")
-            recent_logs = logs_df.sort_values('timestamp', ascending=False).head(15)
+            display_logs = fetch_logs_frame(limit=15, columns=('timestamp', 'role', 'action', 'details'))
             
             # Format for display
-            display_logs = recent_logs[['timestamp', 'role', 'action', 'details']].copy()
-            display_logs['timestamp'] = display_logs['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+            display_logs['timestamp'] = pd.to_datetime(display_logs['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
             
             st.dataframe(display_logs, use_container_width=True, hide_index=True)
             
@@ -802,41 +974,108 @@ def display_activity_viz(role: str) -> None:# Show activity visualizations
             st.markdown("#### Security Insights")
             
             # Check for failed logins
-            failed_logins = logs_df[logs_df['action'] == 'login_failed']
-            unauthorized_attempts = logs_df[logs_df['role'] == 'unauthorized']
+            failed_logins = activity["by_action"].get('login_failed', 0)
+            unauthorized_attempts = activity["by_role"].get('unauthorized', 0)
             # Display security-related metrics
             col1, col2 = st.columns(2)
             with col1:
-                if len(failed_logins) > 0:
-                    st.warning(f"⚠️ {len(failed_logins)} failed login attempts detected")
+                if failed_logins > 0:
+                    st.warning(f"⚠️ {failed_logins} failed login attempts detected")
                 else:
                     st.success("✅ No failed login attempts")
             
             with col2:
-                if len(unauthorized_attempts) > 0:
-                    st.warning(f"⚠️ {len(unauthorized_attempts)} unauthorized access attempts")
+                if unauthorized_attempts > 0:
+                    st.warning(f"⚠️ {unauthorized_attempts} unauthorized access attempts")
                 else:
                     st.success("✅ No unauthorized access attempts")
             
             # Data modification tracking
-            modifications = logs_df[logs_df['action'].isin(['add_patient', 'update_patient', 'delete_patient'])]
-            st.info(f"📝 Total data modifications: **{len(modifications)}**")
+            modifications = sum(
+                activity["by_action"].get(action, 0)
+                for action in ('add_patient', 'update_patient', 'delete_patient')
+            )
+            st.info(f"📝 Total data modifications: **{modifications}**")
             
     except Exception as exc:
         st.error(f"Unable to generate visualizations: {exc}")
 
+# Exact-match lookup by name/contact through the blind indexes (no table-wide decryption)
+def render_patient_lookup(role: str) -> None:
+    import pandas as pd
+    with st.expander("Find Patient", expanded=False):
+        with st.form("find_patient"):
+            col1, col2 = st.columns(2)
+            name = col1.text_input("Full Name", placeholder="Exact name, any case")
+            contact = col2.text_input("Contact", placeholder="Digits are matched, formatting ignored")
+            submitted = st.form_submit_button("Find")
+        if not submitted:
+            return
+        if not (name.strip() or contact.strip()):
+            st.warning("Enter a name, a contact, or both.")
+            return
+        try:
+            matches = find_patients(
+                name=name.strip() or None,
+                contact=contact.strip() or None,
+                include_sensitive=role == "admin",
+            )
+        except Exception as exc:
+            st.error(f"Unable to search patients: {exc}")
+            return
+        # Search terms are PII, so only the outcome is logged
+        log_action(current_user_id(), role, "find_patient", f"matches={len(matches)}")
+        if not matches:
+            st.info("No matching patient found.")
+            return
+        columns = ["patient_id", "anonymized_name", "anonymized_contact", "anonymized_diagnosis", "date_added"]
+        if role == "admin":
+            columns = ["patient_id", "name", "contact", "diagnosis", "date_added"]
+        st.dataframe(pd.DataFrame(matches)[columns], use_container_width=True, hide_index=True)
+
+# Selectbox label -> patient_id for the records on screen (plain ints for sqlite3)
+def record_options(patients: pd.DataFrame) -> dict:
+    labels = patients["anonymized_name"] + " (ID " + patients["patient_id"].astype(str) + ")"
+    return dict(zip(labels.tolist(), patients["patient_id"].tolist()))
+
 # Render patient registry section with role-based access
-def render_patients_section(role: str, patients: List[dict]) -> None:
+def render_patients_section(role: str, patients: pd.DataFrame) -> None:
+    import pandas as pd
     st.markdown('<div class="section-header"><i class="fas fa-hospital-user section-icon"></i><h2 style="margin:0;">Patient Registry</h2></div>', unsafe_allow_html=True)
-    if not patients:
+    # Search box: filtering runs in SQLite (FTS5 over the anonymized columns)
+    col1, col2 = st.columns([3, 1])
+    search = col1.text_input(
+        "Search anonymized records",
+        placeholder="e.g. HYP, 4567, ANON_0012",
+        key="patient_search",
+    )
+    added_since = col2.date_input("Added since", value=None, key="patient_search_since")
+    searching = bool(search.strip() or added_since)
+    if searching:
+        try:
+            # At most 50 ranked matches, so the dict results are cheap to frame
+            patients = pd.DataFrame(
+                search_patients(
+                    search,
+                    added_after=added_since.isoformat() if added_since else None,
+                    include_sensitive=role == "admin",
+                )
+            )
+        except Exception as exc:
+            st.error(f"Unable to search patients: {exc}")
+            return
+        if patients.empty:
+            st.info("No records match the search.")
+            return
+    if patients.empty:
         st.warning("No patient data available.")
         return
     # View mode selection for admins
     view_mode = "Anonymized"# Default to anonymized view
     if role == "admin":# Allow admins to toggle view mode
         view_mode = st.radio("Select view", ["Anonymized", "Raw"], horizontal=True)
-    # Display patient data based on view mode and role
-    df = pd.DataFrame(patients)
+    # Display patient data based on view mode and role (already a DataFrame, no per-row dicts)
+    df = patients
     if view_mode == "Anonymized" or role != "admin":
         display_cols = [
             "patient_id",
@@ -855,6 +1094,11 @@ def render_patients_section(role: str, patients: List[dict]) -> None:
         ]
     # Highlight sensitive columns for admins
     st.dataframe(df[display_cols], use_container_width=True, hide_index=True)
+    if searching:
+        st.caption(f"{len(patients)} matching record(s) (top 50). Clear the search to browse all pages.")
+    else:
+        render_page_controls(patients)
+    render_patient_lookup(role)
     # Data modification section for admins and receptionists
     if role in {"admin", "receptionist"}:
         st.markdown('<div class="section-header"><i class="fas fa-edit section-icon"></i><h3 style="margin:0;">Intake / Update</h3></div>', unsafe_allow_html=True)
@@ -877,18 +1121,17 @@ def render_patients_section(role: str, patients: List[dict]) -> None:
                                 "add_patient",
                                 f"patient_id={pid}",
                             )
-                            cached_patients.clear()
                             st.success(f"Patient record {pid} created securely.")
                             st.rerun()
                         except Exception as exc:
                             st.error(f"Unable to add patient: {exc}")
         # Update patient records
         with st.expander("Update Patient", expanded=False):
-            if not patients:
+            if patients.empty:
                 st.info("No patients to update.")
             else:
                 # Select patient record to update
-                options = {f"{p['anonymized_name']} (ID {p['patient_id']})": p["patient_id"] for p in patients}
+                options = record_options(patients)
                 selection = st.selectbox("Select record", list(options.keys()))
                 new_contact = st.text_input("New Contact", placeholder="Leave blank to keep current")
                 new_diagnosis = st.text_input("New Diagnosis", placeholder="Leave blank to keep current")
@@ -908,18 +1151,17 @@ def render_patients_section(role: str, patients: List[dict]) -> None:
                                 "update_patient",
                                 f"patient_id={options[selection]}",
                             )
-                            cached_patients.clear()
                             st.success("Record updated and re-masked.")
                             st.rerun()
                         except Exception as exc:
                             st.error(f"Unable to update patient: {exc}")
         # Delete patient records
         with st.expander("Delete Patient (Irreversible)", expanded=False):
-            if not patients:
+            if patients.empty:
                 st.info("No patients to delete.")
             else:
                 st.warning("⚠️ Deletion is permanent and cannot be undone. This action will be logged for audit purposes.")
-                options = {f"{p['anonymized_name']} (ID {p['patient_id']})": p["patient_id"] for p in patients}
+                options = record_options(patients)
                 selection = st.selectbox("Select record to delete", list(options.keys()), key="delete_select")
                 
                 # Confirmation checkbox
@@ -935,7 +1177,6 @@ def render_patients_section(role: str, patients: List[dict]) -> None:
                             "delete_patient",
                             f"patient_id={patient_id}, anonymized_name={selection.split(' (ID')[0]}",
                         )
-                        cached_patients.clear()
                         st.success(f"Patient record {patient_id} has been permanently deleted. Action logged for GDPR accountability.")
                         st.rerun()
                     except Exception as exc:
@@ -951,12 +1192,12 @@ def render_audit_section(role: str) -> None:
         return
     st.markdown('<div class="section-header"><i class="fas fa-clipboard-check section-icon"></i><h2 style="margin:0;">Integrity Audit Log</h2></div>', unsafe_allow_html=True)
     try:
-        # Fetch audit logs
-        logs = fetch_logs(limit=250)
+        # Fetch audit logs straight into a DataFrame
+        df = fetch_logs_frame(limit=250)
     except Exception as exc:
         st.error(f"Unable to fetch logs: {exc}")
         return
-    df = pd.DataFrame(logs)
+    render_chain_status(role)
     st.dataframe(df, use_container_width=True)
     st.download_button(
         "Export Logs (CSV)",
@@ -965,11 +1206,164 @@ def render_audit_section(role: str) -> None:
         mime="text/csv",
     )
     log_action(current_user_id(), role, "view_logs", "Admin reviewed audit trail")
+    render_archived_logs(role)
+
+# Tamper-evidence of the audit trail: newest signed checkpoint and an on-demand check of newer entries
+def render_chain_status(role: str) -> None:
+    col1, col2 = st.columns([4, 1])
+    report = None
+    if col2.button("Verify audit chain"):
+        # Only entries after the newest checkpoint are re-hashed
+        try:
+            report = verify_audit_chain(min_entries=1)
+            log_action(current_user_id(), role, "verify_logs", f"ok={report['ok']}, checked={report['checked']}")
+        except MissingKeyError as exc:
+            st.error(str(exc))
+    try:
+        status = chain_status()
+    except Exception as exc:
+        st.error(f"Unable to read the audit chain: {exc}")
+        return
+    checkpoint = status["checkpoint"]
+    if checkpoint is None:
+        col1.caption("Audit chain: not verified yet")
+    else:
+        col1.caption(
+            f"Audit chain verified through entry #{checkpoint['log_id']} "
+            f"(signed {checkpoint['created_at'][:19].replace('T', ' ')} UTC), "
+            f"{status['pending']:,} newer entries unverified"
+        )
+    if report is None:
+        return
+    if report["ok"]:
+        st.success(f"Audit chain intact: {report['checked']:,} new entries verified in {report['duration_s']:.2f}s.")
+    else:
+        st.error(f"Audit chain broken: {report['error']}")
+
+# On-demand search of audit entries moved to the monthly archive segments
+def render_archived_logs(role: str) -> None:
+    import pandas as pd
+    segments = list_segments()
+    if not segments:
+        return
+    archived = sum(segment["rows"] for segment in segments)
+    with st.expander(f"Search archived logs ({archived:,} entries older than {AUDIT_HOT_DAYS} days)", expanded=False):
+        st.caption(f"Archived months: {segments[0]['month']} to {segments[-1]['month']}")
+        with st.form("search_archived_logs"):
+            col1, col2 = st.columns(2)
+            start = col1.date_input("From", value=None)
+            end = col2.date_input("To (inclusive)", value=None)
+            col1, col2, col3 = st.columns(3)
+            action = col1.selectbox(
+                "Action",
+                ["Any"] + sorted({name for segment in segments for name in segment["actions"]}),
+            )
+            user_id = col2.number_input("User ID", min_value=0, step=1, value=0, help="0 matches every user")
+            text = col3.text_input("Details contain")
+            submitted = st.form_submit_button("Search archive")
+        if not submitted:
+            return
+        try:
+            # Only segments overlapping the period (and holding the action) are decompressed
+            entries = search_archived_logs(
+                start.isoformat() if start else None,
+                (end + timedelta(days=1)).isoformat() if end else None,
+                action=None if action == "Any" else action,
+                user_id=int(user_id) or None,
+                text=text.strip() or None,
+            )
+        except Exception as exc:
+            st.error(f"Unable to search the archive: {exc}")
+            return
+        log_action(current_user_id(), role, "view_archived_logs", f"matches={len(entries)}")
+        if not entries:
+            st.info("No archived entries match.")
+            return
+        st.dataframe(pd.DataFrame(entries).drop(columns=["row_hash"], errors="ignore"), use_container_width=True, hide_index=True)
+
+# Render SQL profiler results for administrators
+def render_performance_section(role: str) -> None:
+    import pandas as pd
+    if role != "admin":
+        st.warning("Performance data restricted to administrators.")
+        return
+    st.markdown('<div class="section-header"><i class="fas fa-gauge-high section-icon"></i><h2 style="margin:0;">Query Performance</h2></div>', unsafe_allow_html=True)
+    # Cold-start timings of this server process
+    timings = startup_timings()
+    startup = {
+        key: (value.isoformat() if isinstance(value, datetime) else value)
+        for key, value in timings.items()
+    }
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Import time", f"{timings['import_s']:.3f} s")
+    col2.metric("DB initialization", f"{timings['init_s'] or 0:.3f} s")
+    col3.metric("First render", f"{timings['first_render_s'] or 0:.3f} s")
+    if not SQL_PROFILE:
+        st.info("SQL profiling is off. Start the app with `SQL_PROFILE=1` to record per-statement timings.")
+        st.download_button(
+            "Download startup timings (JSON)",
+            json.dumps({"startup": startup}, indent=2),
+            file_name="startup_timings.json",
+            mime="application/json",
+        )
+        return
+    report = {"startup": startup, **sql_profile_report()}
+    statements = report["statements"]
+    # Summary metrics since the profiler was started or last reset
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Distinct statements", len(statements))
+    col2.metric("Statements run", f"{sum(row['calls'] for row in statements):,}")
+    col3.metric("Time in SQLite", f"{sum(row['total_ms'] for row in statements) / 1000:.2f} s")
+    st.caption(f"Collecting since {report['started_at'][:19].replace('T', ' ')} UTC")
+    if statements:
+        df = pd.DataFrame(statements).drop(columns=["plan"])
+        st.dataframe(df.round(3), use_container_width=True, hide_index=True)
+        # Query plans of the slowest statements
+        for row in statements:
+            if row["plan"]:
+                with st.expander(f"{row['total_ms']:.1f} ms · {row['statement'][:90]}"):
+                    st.code("\n".join(row["plan"]), language="text")
+    action_col1, action_col2 = st.columns(2)
+    with action_col1:
+        st.download_button(
+            "Download profile (JSON)",
+            json.dumps(report, indent=2),
+            file_name=f"sql_profile_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+        )
+    with action_col2:
+        if st.button("Reset profiler"):
+            sql_profiler.reset()
+            st.rerun()
 
 # Helper to get current user ID
 def current_user_id() -> int:
     return st.session_state.auth.get("user", {}).get("user_id")
 
+# Schema migrations, seed data and the retention scheduler run once per server process,
+# not on every rerun
+@st.cache_resource(show_spinner=False)
+def initialize_backend() -> None:
+    started = time.perf_counter()
+    init_db()
+    start_retention_job(RETENTION_JOB_INTERVAL)
+    start_backup_job(BACKUP_INTERVAL)
+    start_archive_job(AUDIT_ARCHIVE_INTERVAL)
+    start_verify_job(AUDIT_VERIFY_INTERVAL)
+    startup_timings()["init_s"] = time.perf_counter() - started
+
+# Record how long the first script run of this process took to render (cold start)
+def record_first_render() -> None:
+    timings = startup_timings()
+    if timings["first_render_s"] is not None:
+        return
+    timings["first_render_s"] = time.perf_counter() - SCRIPT_STARTED
+    print(
+        f"Startup: imports {timings['import_s']:.3f}s, "
+        f"init {timings['init_s'] or 0:.3f}s, first render {timings['first_render_s']:.3f}s",
+        file=sys.stderr,
+    )
+
 # Main application function
 def main() -> None:
     st.set_page_config(
@@ -982,14 +1376,20 @@ def main() -> None:
     # Apply dark theme
     apply_dark_theme()
     
-    # Initialize database and session
-    init_db()
+    # Initialize database (once per process) and session
+    initialize_backend()
     init_session()
     if not st.session_state.auth["logged_in"]:# Render login if not authenticated
         render_login()
         return
 
-    user = st.session_state.auth["user"]
+    # Re-check the account on every rerun (served from the user cache) so role
+    # changes and disabled accounts take effect without waiting for a new login
+    user = get_user_by_username(st.session_state.auth["user"]["username"])
+    if not user or user.get("disabled"):
+        st.session_state.auth = {"logged_in": False, "user": None}
+        st.rerun()
+    st.session_state.auth["user"] = user
     role = user["role"]
     # Sidebar navigation
     st.sidebar.markdown('<div class="section-header"><i class="fas fa-bars section-icon"></i><h1 style="margin:0; font-size:1.5rem;">Navigation</h1></div>', unsafe_allow_html=True)
@@ -999,7 +1399,7 @@ def main() -> None:
 
     nav_options = ["Overview", "Patients"]
     if role == "admin":
-        nav_options.append("Audit")
+        nav_options.extend(["Audit", "Performance"])
     section = st.sidebar.radio("Workspace", nav_options)
 
     st.sidebar.divider()
@@ -1009,16 +1409,17 @@ def main() -> None:
         f"Last sync: {(st.session_state.last_sync or datetime.utcnow()).strftime('%H:%M:%S UTC')}"
     )
 
-    patients = []
     # Render selected section
     if section == "Overview":
-        patients = render_overview(role)
+        render_overview(role)
     elif section == "Patients":
         include_sensitive = role == "admin"
-        patients = cached_patients(include_sensitive)
+        patients = load_patient_page(include_sensitive)
         render_patients_section(role, patients)
     elif section == "Audit":
         render_audit_section(role)
+    elif section == "Performance":
+        render_performance_section(role)
 
     st.divider()
     # Footer with GDPR and uptime info
@@ -1035,4 +1436,5 @@ def main() -> None:
 
 # Run the application
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
+    record_first_render()
\ No newline at end of file
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import gzip
+import heapq
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+import audit_chain
+import database
+from config import AUDIT_ARCHIVE_BATCH_SIZE, AUDIT_ARCHIVE_DIR, AUDIT_HOT_DAYS
+
+# One append-only segment per calendar month of audit timestamps. Every archive
+# batch appends one gzip member per month it touches; concatenated members are a
+# valid gzip stream, so a segment is never rewritten.
+SEGMENT_PATTERN = "logs-*.jsonl.gz"
+
+
+class ArchiveError(RuntimeError):
+    pass
+
+
+def _segment_file(month: str) -> str:
+    return f"logs-{month}.jsonl.gz"
+
+
+class _Prefix(io.RawIOBase):
+    """The first ``size`` bytes of a file: the committed part of a segment."""
+
+    def __init__(self, handle: BinaryIO, size: int) -> None:
+        self._handle = handle
+        self._left = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if self._left <= 0:
+            return 0
+        view = memoryview(buffer)[: self._left]
+        read = self._handle.readinto(view) or 0
+        self._left -= read
+        return read
+
+
+def list_segments() -> List[Dict[str, Any]]:
+    """Index entries for the archived months, oldest first."""
+    with database.get_connection() as conn:
+        rows = conn.execute("SELECT * FROM log_archive_segments ORDER BY month").fetchall()
+    segments = []
+    for row in rows:
+        segment = dict(row)
+        segment["actions"] = json.loads(segment["actions"])
+        segments.append(segment)
+    return segments
+
+
+def _recover(conn: sqlite3.Connection, directory: Path) -> Dict[str, Dict[str, Any]]:
+    """Committed index entries by month, after cutting off appends a failed run never committed.
+
+    The index row and the deletion from ``logs`` commit together, so bytes past
+    an entry's ``bytes`` belong to rows that are still in the hot table.
+    """
+    segments = {row["month"]: dict(row) for row in conn.execute("SELECT * FROM log_archive_segments")}
+    for path in directory.glob(SEGMENT_PATTERN):
+        committed = segments.get(path.name[len("logs-"):-len(".jsonl.gz")], {}).get("bytes", 0)
+        size = path.stat().st_size
+        if size < committed:
+            raise ArchiveError(f"{path.name} is shorter than its index entry; it was truncated or replaced")
+        if size > committed:
+            with path.open("r+b") as handle:
+                handle.truncate(committed)
+    for month, segment in segments.items():
+        if not (directory / segment["file"]).exists():
+            raise ArchiveError(f"Archive segment {segment['file']} for {month} is missing from {directory.resolve()}")
+    return segments
+
+
+def _append(path: Path, rows: List[sqlite3.Row]) -> int:
+    with path.open("ab") as handle:
+        with gzip.GzipFile(filename="", fileobj=handle, mode="wb", mtime=0) as member:
+            for row in rows:
+                member.write(json.dumps(dict(row), separators=(",", ":")).encode("utf-8") + b"\n")
+        handle.flush()
+        os.fsync(handle.fileno())
+        return handle.tell()
+
+
+def count_archivable_logs(hot_days: int = AUDIT_HOT_DAYS) -> int:
+    cutoff = (datetime.utcnow() - timedelta(days=hot_days)).isoformat()
+    database.flush_audit_log()
+    with database.get_connection() as conn:
+        return int(conn.execute("SELECT COUNT(*) FROM logs WHERE timestamp < ?", (cutoff,)).fetchone()[0])
+
+
+def archive_logs(
+    hot_days: int = AUDIT_HOT_DAYS,
+    *,
+    directory: Path = AUDIT_ARCHIVE_DIR,
+    batch_size: int = AUDIT_ARCHIVE_BATCH_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Move audit entries older than ``hot_days`` from ``logs`` into the monthly segments.
+
+    Each batch is one write transaction: the rows are appended to their
+    segments and fsynced, then deleted from ``logs`` and the segment index is
+    updated in the same commit. A crash at any point leaves each row either in
+    the hot table or in a committed segment, never both and never neither. The
+    activity rollups are left alone, so analytics still cover the full history.
+    Only entries the audit chain has verified and checkpointed are moved, so the
+    incremental verifier never needs the archive. Returns the number of entries
+    archived.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    cutoff = (datetime.utcnow() - timedelta(days=hot_days)).isoformat()
+    database.flush_audit_log()
+    # Always checkpoint: only checkpointed entries may be moved.
+    report = audit_chain.verify_audit_chain(min_entries=1)
+    if not report["ok"]:
+        raise ArchiveError(f"Audit chain verification failed, nothing archived: {report['error']}")
+    archived = 0
+    while True:
+        with database.get_connection() as conn:
+            # Holding the write lock across the append keeps concurrent archivers
+            # (other processes) from interleaving members in a segment.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                segments = _recover(conn, directory)
+                rows = conn.execute(
+                    """
+                    SELECT * FROM logs
+                     WHERE timestamp < ?
+                       AND log_id <= (SELECT IFNULL(MAX(log_id), 0) FROM audit_checkpoints)
+                     ORDER BY timestamp, log_id
+                     LIMIT ?
+                    """,
+                    (cutoff, max(batch_size, 1)),
+                ).fetchall()
+                if not rows:
+                    conn.rollback()
+                    break
+                by_month: Dict[str, List[sqlite3.Row]] = defaultdict(list)
+                for row in rows:
+                    by_month[row["timestamp"][:7]].append(row)
+                now = datetime.utcnow().isoformat()
+                updates = []
+                for month, items in by_month.items():
+                    segment = segments.get(month) or {
+                        "file": _segment_file(month),
+                        "rows": 0,
+                        "first_timestamp": items[0]["timestamp"],
+                        "last_timestamp": items[-1]["timestamp"],
+                        "actions": "{}",
+                    }
+                    actions = Counter(json.loads(segment["actions"]))
+                    actions.update(item["action"] for item in items)
+                    updates.append(
+                        (
+                            month,
+                            segment["file"],
+                            segment["rows"] + len(items),
+                            _append(directory / segment["file"], items),
+                            min(segment["first_timestamp"], items[0]["timestamp"]),
+                            max(segment["last_timestamp"], items[-1]["timestamp"]),
+                            json.dumps(dict(actions), sort_keys=True),
+                            now,
+                        )
+                    )
+                conn.executemany("DELETE FROM logs WHERE log_id = ?", [(row["log_id"],) for row in rows])
+                conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO log_archive_segments
+                        (month, file, rows, bytes, first_timestamp, last_timestamp, actions, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    updates,
+                )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        archived += len(rows)
+        if progress is not None:
+            progress(archived)
+    if archived:
+        database.log_action(None, "system", "archive_logs", f"{archived} entries older than {hot_days} days archived")
+    return archived
+
+
+def _read_segment(directory: Path, segment: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    with (directory / segment["file"]).open("rb") as handle:
+        # Only the committed bytes: an archiver may be appending to the same file right now.
+        committed = io.BufferedReader(_Prefix(handle, segment["bytes"]))
+        with gzip.GzipFile(fileobj=committed, mode="rb") as stream:
+            for line in stream:
+                yield json.loads(line)
+
+
+def iter_archived_entries(directory: Path = AUDIT_ARCHIVE_DIR) -> Iterator[Dict[str, Any]]:
+    """Every archived entry, as stored (for full audit chain verification)."""
+    for segment in list_segments():
+        yield from _read_segment(Path(directory), segment)
+
+
+def iter_archived_logs(directory: Path = AUDIT_ARCHIVE_DIR) -> Iterator[database.LogRow]:
+    """Every archived entry as a ``LogRow`` (for rebuilding the rollups)."""
+    for entry in iter_archived_entries(directory):
+        yield entry["user_id"], entry["role"], entry["action"], entry["timestamp"], entry["details"]
+
+
+def search_archived_logs(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    *,
+    action: Optional[str] = None,
+    user_id: Optional[int] = None,
+    text: Optional[str] = None,
+    limit: int = 200,
+    directory: Path = AUDIT_ARCHIVE_DIR,
+) -> List[Dict[str, Any]]:
+    """Archived entries with ``start <= timestamp < end``, newest first.
+
+    Only segments whose index entry overlaps the period, and that contain
+    ``action`` when one is given, are decompressed. ``text`` is a
+    case-insensitive match on the details.
+    """
+    needle = text.lower() if text else None
+    candidates = [
+        segment
+        for segment in list_segments()
+        if (start is None or segment["last_timestamp"] >= start)
+        and (end is None or segment["first_timestamp"] < end)
+        and (action is None or action in segment["actions"])
+    ]
+
+    def matches() -> Iterator[Dict[str, Any]]:
+        for segment in candidates:
+            for entry in _read_segment(Path(directory), segment):
+                if start is not None and entry["timestamp"] < start:
+                    continue
+                if end is not None and entry["timestamp"] >= end:
+                    continue
+                if action is not None and entry["action"] != action:
+                    continue
+                if user_id is not None and entry["user_id"] != user_id:
+                    continue
+                if needle is not None and needle not in (entry["details"] or "").lower():
+                    continue
+                yield entry
+
+    return heapq.nlargest(max(limit, 1), matches(), key=lambda entry: (entry["timestamp"], entry["log_id"]))
+
+
+_archive_thread: Optional[threading.Thread] = None
+_archive_lock = threading.Lock()
+
+
+def start_archive_job(interval: float, hot_days: int = AUDIT_HOT_DAYS) -> None:
+    """Run archive_logs every ``interval`` seconds on a daemon thread (once per process)."""
+    global _archive_thread
+    if interval <= 0:
+        return
+
+    def run() -> None:
+        while True:
+            try:
+                archive_logs(hot_days)
+            except Exception as exc:
+                print(f"archive-job: run failed: {exc}", file=sys.stderr)
+            time.sleep(interval)
+
+    with _archive_lock:
+        if _archive_thread is not None and _archive_thread.is_alive():
+            return
+        _archive_thread = threading.Thread(target=run, name="archive-job", daemon=True)
+        _archive_thread.start()
@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import hmac
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import database
+from config import (
+    AUDIT_CHECKPOINT_MIN_AGE,
+    AUDIT_CHECKPOINT_MIN_ENTRIES,
+    AUDIT_VERIFY_BATCH_SIZE,
+    MissingKeyError,
+    get_audit_chain_key,
+)
+from security import AUDIT_CHAIN_GENESIS, audit_row_hash, sign_checkpoint
+
+# Audit entries are chained in log_id order: each row_hash covers the entry and
+# the row_hash before it, so editing or removing an entry breaks every link after
+# it. A checkpoint signs a verified (log_id, row_hash) together with the previous
+# checkpoint's signature, and routine verification starts from the newest one.
+_ENTRY_FIELDS = ("log_id", "user_id", "role", "action", "timestamp", "details", "row_hash")
+_MAX_LOG_ID = 2**63 - 1
+
+
+class _Broken(Exception):
+    def __init__(self, log_id: Optional[int], reason: str) -> None:
+        super().__init__(f"Entry #{log_id} {reason}" if log_id is not None else reason)
+        self.log_id = log_id
+
+
+def _head(conn: sqlite3.Connection) -> Dict[str, Any]:
+    return dict(conn.execute("SELECT genesis_log_id, last_log_id, last_hash FROM audit_chain WHERE id = 1").fetchone())
+
+
+def _latest_checkpoint(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+    row = conn.execute("SELECT * FROM audit_checkpoints ORDER BY log_id DESC LIMIT 1").fetchone()
+    return dict(row) if row else None
+
+
+def _signed(checkpoint: Mapping[str, Any]) -> bool:
+    expected = sign_checkpoint(
+        checkpoint["log_id"], checkpoint["row_hash"], checkpoint["created_at"], checkpoint["prev_signature"]
+    )
+    return hmac.compare_digest(expected, checkpoint["signature"])
+
+
+def _check_entries(
+    entries: Iterable[Mapping[str, Any]],
+    prev: str,
+    last_id: int,
+    checkpoints: Optional[Dict[int, str]] = None,
+) -> Tuple[int, int, str]:
+    """Re-hash ``entries`` (in log_id order) onto ``prev``; returns (checked, last log_id, last hash)."""
+    checked = 0
+    for entry in entries:
+        if entry["row_hash"] is None:
+            raise _Broken(entry["log_id"], "was written outside the chain")
+        expected = audit_row_hash(
+            prev,
+            entry["log_id"],
+            entry["user_id"],
+            entry["role"],
+            entry["action"],
+            entry["timestamp"],
+            entry["details"],
+        )
+        if not hmac.compare_digest(expected, entry["row_hash"]):
+            raise _Broken(entry["log_id"], "does not match the chain: it was modified, or an entry before it was removed")
+        if checkpoints and checkpoints.get(entry["log_id"], entry["row_hash"]) != entry["row_hash"]:
+            raise _Broken(entry["log_id"], "differs from its signed checkpoint: the chain was rewritten")
+        prev, last_id = entry["row_hash"], entry["log_id"]
+        checked += 1
+    return checked, last_id, prev
+
+
+def _hot_entries(after: int, through: int, batch_size: int) -> Iterator[sqlite3.Row]:
+    # One short read per batch, so verification never holds a lock writers wait on.
+    while True:
+        with database.get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(_ENTRY_FIELDS)} FROM logs WHERE log_id > ? AND log_id <= ? ORDER BY log_id LIMIT ?",
+                (after, through, batch_size),
+            ).fetchall()
+        if not rows:
+            return
+        yield from rows
+        after = rows[-1]["log_id"]
+
+
+def _all_entries(
+    head: Dict[str, Any],
+    archived: Iterable[Mapping[str, Any]],
+    batch_size: int,
+) -> Iterator[sqlite3.Row]:
+    """Hot and archived chain entries merged in log_id order, through a scratch database on disk."""
+    with closing(sqlite3.connect("")) as scratch:
+        scratch.row_factory = sqlite3.Row
+        scratch.execute(
+            "CREATE TABLE entries (log_id INTEGER PRIMARY KEY, user_id, role, action, timestamp, details, row_hash)"
+        )
+        insert = f"INSERT OR IGNORE INTO entries VALUES ({', '.join('?' * len(_ENTRY_FIELDS))})"
+        # The table is read before the archive: an entry archived in between is seen
+        # twice (and kept once) instead of not at all.
+        batch: List[Tuple[Any, ...]] = []
+        for row in _hot_entries(head["genesis_log_id"] - 1, head["last_log_id"], batch_size):
+            batch.append(tuple(row))
+            if len(batch) >= batch_size:
+                scratch.executemany(insert, batch)
+                batch = []
+        scratch.executemany(insert, batch)
+        scratch.executemany(
+            insert,
+            (
+                tuple(entry.get(field) for field in _ENTRY_FIELDS)
+                for entry in archived
+                if head["genesis_log_id"] <= entry["log_id"] <= head["last_log_id"]
+            ),
+        )
+        yield from scratch.execute("SELECT * FROM entries ORDER BY log_id")
+
+
+def _snapshot() -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    # Checkpoint before head: the head only moves forward, so it is never behind the checkpoint.
+    with database.get_connection() as conn:
+        latest = _latest_checkpoint(conn)
+        return _head(conn), latest
+
+
+def _checkpoint_due(latest: Optional[Mapping[str, Any]], last_id: int, min_entries: int, min_age: float) -> bool:
+    if latest is None:
+        return True
+    if last_id <= latest["log_id"]:
+        return False
+    age = (datetime.utcnow() - datetime.fromisoformat(latest["created_at"])).total_seconds()
+    return last_id - latest["log_id"] >= min_entries or age >= min_age
+
+
+def _write_checkpoint(log_id: int, row_hash: str) -> Dict[str, Any]:
+    with database.get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        latest = _latest_checkpoint(conn)
+        if latest is not None and latest["log_id"] >= log_id:
+            conn.rollback()
+            return latest
+        checkpoint = {
+            "log_id": log_id,
+            "row_hash": row_hash,
+            "created_at": datetime.utcnow().isoformat(),
+            "prev_signature": latest["signature"] if latest else "",
+        }
+        checkpoint["signature"] = sign_checkpoint(**checkpoint)
+        cursor = conn.execute(
+            """
+            INSERT INTO audit_checkpoints (log_id, row_hash, created_at, prev_signature, signature)
+            VALUES (:log_id, :row_hash, :created_at, :prev_signature, :signature)
+            """,
+            checkpoint,
+        )
+        checkpoint["checkpoint_id"] = cursor.lastrowid
+        conn.commit()
+    # Signed by this process on top of the latest one, which the caller just verified.
+    if latest is None or _trusted.get(_database_key(), {}).get("signature") == latest["signature"]:
+        _trusted[_database_key()] = checkpoint
+    return checkpoint
+
+
+def _signed_checkpoints(through: int, after: Optional[Mapping[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Checkpoints after ``after`` (from the first one when None) up to log_id ``through``,
+    each checked against its signature and its predecessor's."""
+    with database.get_connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM audit_checkpoints WHERE log_id > ? AND log_id <= ? ORDER BY log_id",
+            (after["log_id"] if after else 0, through),
+        )
+        checkpoints = [dict(row) for row in rows]
+    prev_signature = after["signature"] if after else ""
+    for checkpoint in checkpoints:
+        if not _signed(checkpoint) or checkpoint["prev_signature"] != prev_signature:
+            raise _Broken(None, f"Checkpoint #{checkpoint['checkpoint_id']} has an invalid signature")
+        prev_signature = checkpoint["signature"]
+    return checkpoints
+
+
+# Newest checkpoint whose chain back to the first one this process has checked, per database
+# file: incremental runs only check the checkpoints signed after it.
+_trusted: Dict[str, Dict[str, Any]] = {}
+
+
+def _database_key() -> str:
+    return str(Path(database.DB_PATH).resolve())
+
+
+def _verify_incremental(head: Dict[str, Any], checkpoint: Optional[Dict[str, Any]], batch_size: int) -> Tuple[int, int, str]:
+    if checkpoint is None:
+        start, prev = head["genesis_log_id"] - 1, AUDIT_CHAIN_GENESIS
+    else:
+        trusted = _trusted.get(_database_key())
+        if trusted is not None and (
+            trusted["log_id"] > checkpoint["log_id"]
+            or (trusted["log_id"] == checkpoint["log_id"] and trusted["signature"] != checkpoint["signature"])
+        ):
+            # The checkpoint table went back (e.g. a restored backup): check it from the start again.
+            trusted = None
+        if trusted is None or trusted["log_id"] < checkpoint["log_id"]:
+            checkpoints = _signed_checkpoints(checkpoint["log_id"], trusted)
+            if not checkpoints or checkpoints[-1]["signature"] != checkpoint["signature"]:
+                raise _Broken(None, f"Checkpoint #{checkpoint['checkpoint_id']} is not on the signed checkpoint chain")
+            _trusted[_database_key()] = checkpoint
+        start, prev = checkpoint["log_id"], checkpoint["row_hash"]
+    return _check_entries(_hot_entries(start, head["last_log_id"], batch_size), prev, start)
+
+
+def _verify_full(head: Dict[str, Any], archived: Iterable[Mapping[str, Any]], batch_size: int) -> Tuple[int, int, str]:
+    checkpoints = _signed_checkpoints(_MAX_LOG_ID)
+    if checkpoints:
+        _trusted[_database_key()] = checkpoints[-1]
+    # Checkpoints signed after the head was read cover entries this run does not look at.
+    signed = {
+        checkpoint["log_id"]: checkpoint["row_hash"]
+        for checkpoint in checkpoints
+        if checkpoint["log_id"] <= head["last_log_id"]
+    }
+    seen = set()
+
+    def entries() -> Iterator[sqlite3.Row]:
+        for entry in _all_entries(head, archived, batch_size):
+            if entry["log_id"] in signed:
+                seen.add(entry["log_id"])
+            yield entry
+
+    checked, last_id, prev = _check_entries(entries(), AUDIT_CHAIN_GENESIS, head["genesis_log_id"] - 1, signed)
+    missing = sorted(set(signed) - seen)
+    if missing:
+        raise _Broken(missing[0], "is covered by a signed checkpoint but no longer exists")
+    return checked, last_id, prev
+
+
+_reported: Optional[str] = None
+
+
+def verify_audit_chain(
+    *,
+    full: bool = False,
+    archived: Iterable[Mapping[str, Any]] = (),
+    batch_size: int = AUDIT_VERIFY_BATCH_SIZE,
+    checkpoint: bool = True,
+    min_entries: int = AUDIT_CHECKPOINT_MIN_ENTRIES,
+    min_age: float = AUDIT_CHECKPOINT_MIN_AGE,
+) -> Dict[str, Any]:
+    """Check the audit log's hash chain and sign a checkpoint at the newest verified entry.
+
+    By default only entries written after the newest checkpoint are re-hashed,
+    so a run costs O(new entries). Checkpoints are checked against their
+    signature and their predecessor's, but only those signed since the newest
+    one this process already checked. Entries behind the newest checkpoint are
+    not re-read, so a rewrite of checkpointed history is only caught by a
+    ``full`` run. ``full`` re-hashes the whole history, including the
+    ``archived`` entries (see archive.iter_archived_entries), and checks every
+    checkpoint against it. A new checkpoint is only signed once ``min_entries``
+    entries or ``min_age`` seconds have passed since the newest one. A break is recorded in the audit log
+    once per distinct failure. Only committed entries are checked; events still
+    queued in this process's audit writer are left for the next run. Returns a
+    report; ``ok`` is False on a break.
+    """
+    global _reported
+    started = time.perf_counter()
+    batch_size = max(batch_size, 1)
+    head, latest = _snapshot()
+    report: Dict[str, Any] = {"ok": True, "full": full, "checked": 0, "error": None, "broken_log_id": None}
+    try:
+        while True:
+            try:
+                if full:
+                    checked, last_id, last_hash = _verify_full(head, archived, batch_size)
+                else:
+                    checked, last_id, last_hash = _verify_incremental(head, latest, batch_size)
+                break
+            except _Broken:
+                # The archiver may have moved entries past our checkpoint under a newer one; start from that.
+                newer_head, newer = _snapshot()
+                if full or newer is None or (latest is not None and newer["log_id"] <= latest["log_id"]):
+                    raise
+                head, latest = newer_head, newer
+        if last_id != head["last_log_id"] or last_hash != head["last_hash"]:
+            raise _Broken(
+                last_id,
+                f"is the last entry found, but the chain head is entry #{head['last_log_id']}: newer entries were removed",
+            )
+    except _Broken as exc:
+        report.update(ok=False, error=str(exc), broken_log_id=exc.log_id)
+        if _reported != report["error"]:
+            _reported = report["error"]
+            database.log_action(None, "system", "audit_chain_broken", report["error"])
+    else:
+        report["checked"] = checked
+        if checkpoint and last_id >= head["genesis_log_id"] and _checkpoint_due(latest, last_id, min_entries, min_age):
+            latest = _write_checkpoint(last_id, last_hash)
+        _reported = None
+    report["head_log_id"] = head["last_log_id"]
+    report["checkpoint"] = latest
+    report["duration_s"] = time.perf_counter() - started
+    return report
+
+
+def chain_status() -> Dict[str, Any]:
+    """Chain head, newest checkpoint and how many entries are not yet covered by it."""
+    with database.get_connection() as conn:
+        head = _head(conn)
+        latest = _latest_checkpoint(conn)
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM logs WHERE log_id > ?",
+            (latest["log_id"] if latest else 0,),
+        ).fetchone()[0]
+        checkpoints = conn.execute("SELECT COUNT(*) FROM audit_checkpoints").fetchone()[0]
+    return {**head, "checkpoint": latest, "checkpoints": checkpoints, "pending": pending}
+
+
+_verify_thread: Optional[threading.Thread] = None
+_verify_lock = threading.Lock()
+
+
+def start_verify_job(interval: float) -> None:
+    """Run verify_audit_chain every ``interval`` seconds on a daemon thread (once per process).
+
+    Without AUDIT_CHAIN_KEY nothing could be checkpointed, so it warns once and does not start.
+    """
+    global _verify_thread
+    if interval <= 0:
+        return
+    try:
+        get_audit_chain_key()
+    except MissingKeyError as exc:
+        print(f"verify-job: not started: {exc}", file=sys.stderr)
+        return
+
+    def run() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                report = verify_audit_chain()
+                if not report["ok"]:
+                    print(f"verify-job: audit chain broken: {report['error']}", file=sys.stderr)
+            except Exception as exc:
+                print(f"verify-job: run failed: {exc}", file=sys.stderr)
+
+    with _verify_lock:
+        if _verify_thread is not None and _verify_thread.is_alive():
+            return
+        _verify_thread = threading.Thread(target=run, name="verify-job", daemon=True)
+        _verify_thread.start()
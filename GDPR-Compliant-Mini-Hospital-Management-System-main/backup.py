@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import database
+from config import BACKUP_DIR, BACKUP_KEEP, BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE
+
+# Snapshots are "<prefix><UTC timestamp>.db.gz" with a "<same stem>.json" manifest next to them.
+BACKUP_PREFIX = "hospital-"
+_COPY_CHUNK = 1024 * 1024
+# Copies restarted this many times by concurrent writes finish in a single step instead.
+_MAX_RESTARTS = 3
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy_online(source: Path, target: Path, pages: int, pause: float) -> Dict[str, int]:
+    """Copy ``source`` into ``target`` with the SQLite backup API, ``pages`` pages per step.
+
+    ``pause`` seconds between steps let other work in. SQLite restarts an
+    online backup when another connection writes to the source, so after a few
+    restarts the copy is finished in one step. The pool keeps the database in
+    WAL mode, where that step only pins a read snapshot and writers carry on.
+    The copy is switched back to a rollback journal so it is a single
+    self-contained file.
+    """
+    stats = {"steps": 0, "restarts": 0, "pages": 0}
+
+    def on_step(status: int, remaining: int, total: int) -> None:
+        # A busy step copies nothing; a successful one that did not move forward was restarted.
+        if status == sqlite3.SQLITE_OK and stats["steps"] and total - remaining <= stats["done"]:
+            stats["restarts"] += 1
+            if stats["restarts"] >= _MAX_RESTARTS:
+                raise _Restarted
+        stats["steps"] += 1
+        stats["done"] = total - remaining
+        stats["pages"] = total
+        if remaining and pause:
+            time.sleep(pause)
+
+    stats["done"] = 0
+    src = sqlite3.connect(source)
+    try:
+        while True:
+            dst = sqlite3.connect(target)
+            try:
+                step = pages if stats["restarts"] < _MAX_RESTARTS else -1
+                src.backup(dst, pages=step, progress=on_step, sleep=max(pause, 0.001))
+                dst.execute("PRAGMA journal_mode = DELETE")
+                break
+            except _Restarted:
+                continue
+            finally:
+                dst.close()
+    finally:
+        src.close()
+    del stats["done"]
+    return stats
+
+
+def _check_integrity(path: Path) -> None:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise BackupError(f"Integrity check failed for {path.name}: {result}")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(_COPY_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _manifest_path(archive: Path) -> Path:
+    return archive.with_name(archive.name[: -len(".db.gz")] + ".json")
+
+
+def list_backups(directory: Path = BACKUP_DIR) -> List[Dict[str, Any]]:
+    """Manifests of the snapshots in ``directory``, newest first."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    manifests = []
+    for path in sorted(directory.glob(f"{BACKUP_PREFIX}*.json"), reverse=True):
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+        manifest["path"] = str(path.with_name(manifest["file"]))
+        manifests.append(manifest)
+    return manifests
+
+
+def prune_backups(directory: Path = BACKUP_DIR, keep: int = BACKUP_KEEP) -> List[str]:
+    """Delete all but the ``keep`` newest snapshots; returns the removed file names."""
+    removed = []
+    for manifest in list_backups(directory)[max(keep, 1):]:
+        archive = Path(manifest["path"])
+        archive.unlink(missing_ok=True)
+        _manifest_path(archive).unlink(missing_ok=True)
+        removed.append(archive.name)
+    return removed
+
+
+def create_backup(
+    directory: Path = BACKUP_DIR,
+    *,
+    keep: int = BACKUP_KEEP,
+    pages: int = BACKUP_PAGES_PER_STEP,
+    pause: float = BACKUP_STEP_PAUSE,
+) -> Dict[str, Any]:
+    """Snapshot the live database into a gzip file with a checksummed manifest.
+
+    The copy goes through the SQLite backup API, so the app keeps reading and
+    writing while it runs, and is integrity-checked before it is compressed.
+    Patient fields stay Fernet-encrypted in the snapshot. Returns the manifest,
+    which records duration and throughput.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    database.flush_audit_log()
+    started = time.perf_counter()
+    created_at = datetime.utcnow()
+    stem = f"{BACKUP_PREFIX}{created_at.strftime('%Y%m%dT%H%M%S%fZ')}"
+    archive = directory / f"{stem}.db.gz"
+    with tempfile.TemporaryDirectory(prefix=".backup-", dir=directory) as workdir:
+        copy = Path(workdir) / "snapshot.db"
+        stats = _copy_online(Path(database.DB_PATH), copy, pages, pause)
+        copied = time.perf_counter()
+        _check_integrity(copy)
+        size = copy.stat().st_size
+        partial = Path(workdir) / archive.name
+        with copy.open("rb") as source, gzip.open(partial, "wb", compresslevel=6) as target:
+            shutil.copyfileobj(source, target, _COPY_CHUNK)
+        os.replace(partial, archive)
+    duration = time.perf_counter() - started
+    manifest = {
+        "file": archive.name,
+        "created_at": created_at.isoformat(),
+        "source": str(Path(database.DB_PATH).resolve()),
+        "schema_version": database.SCHEMA_VERSION,
+        "size_bytes": size,
+        "compressed_bytes": archive.stat().st_size,
+        "sha256": _sha256(archive),
+        "pages": stats["pages"],
+        "steps": stats["steps"],
+        "restarts": stats["restarts"],
+        "copy_s": copied - started,
+        "duration_s": duration,
+        "throughput_mb_s": size / duration / 1_000_000 if duration else 0.0,
+    }
+    _manifest_path(archive).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    manifest["path"] = str(archive)
+    manifest["pruned"] = prune_backups(directory, keep)
+    database.log_action(
+        None,
+        "system",
+        "backup",
+        f"{archive.name}, {size} bytes in {duration:.2f}s",
+    )
+    return manifest
+
+
+def _find_backup(name: Optional[str], directory: Path) -> Dict[str, Any]:
+    backups = list_backups(directory)
+    if not backups:
+        raise BackupError(f"No backups in {Path(directory).resolve()}")
+    if name is None:
+        return backups[0]
+    for manifest in backups:
+        if name in (manifest["file"], manifest["path"], manifest["file"][: -len(".db.gz")]):
+            return manifest
+    raise BackupError(f"No backup named {name!r} in {Path(directory).resolve()}")
+
+
+def verify_backup(name: Optional[str] = None, directory: Path = BACKUP_DIR, *, into: Optional[Path] = None) -> Dict[str, Any]:
+    """Check a snapshot's checksum and SQLite integrity (the newest one when ``name`` is None).
+
+    With ``into``, the verified database is left decompressed at that path.
+    """
+    manifest = _find_backup(name, directory)
+    archive = Path(manifest["path"])
+    if _sha256(archive) != manifest["sha256"]:
+        raise BackupError(f"Checksum mismatch for {archive.name}; the file is damaged or was modified")
+    with tempfile.TemporaryDirectory(prefix=".verify-", dir=archive.parent) as workdir:
+        copy = Path(workdir) / "snapshot.db"
+        with gzip.open(archive, "rb") as source, copy.open("wb") as target:
+            shutil.copyfileobj(source, target, _COPY_CHUNK)
+        _check_integrity(copy)
+        if into is not None:
+            os.replace(copy, into)
+    return manifest
+
+
+def restore_backup(
+    name: Optional[str] = None,
+    directory: Path = BACKUP_DIR,
+    *,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """Replace the live database's contents with a verified snapshot.
+
+    The snapshot is copied in through the backup API, which takes the write
+    lock, so open connections in other processes see the restored data on
+    their next query instead of a file swapped underneath them. A snapshot
+    from an older release is then migrated to the current schema.
+    """
+    target = Path(database.DB_PATH)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        version = database.change_version()
+    except sqlite3.OperationalError:
+        version = 0
+    with tempfile.TemporaryDirectory(prefix=".restore-", dir=target.parent) as workdir:
+        copy = Path(workdir) / "snapshot.db"
+        manifest = verify_backup(name, directory, into=copy)
+        database.flush_audit_log()
+        database.close_pool()
+        src = sqlite3.connect(copy)
+        dst = sqlite3.connect(target, timeout=60)
+        try:
+            src.backup(
+                dst,
+                progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None,
+            )
+        finally:
+            dst.close()
+            src.close()
+    database.init_db(seed=False)
+    with database.get_connection() as conn:
+        # The restored counter is older than the live one; move it past every value
+        # dashboards may have cached pages under, so none of them is served again.
+        conn.execute(
+            "UPDATE change_versions SET version = MAX(version, ?) + 1 WHERE name = 'patients'",
+            (version,),
+        )
+        conn.commit()
+    database.log_action(None, "system", "restore", f"Restored {manifest['file']}")
+    database.flush_audit_log()
+    return manifest
+
+
+_backup_thread: Optional[threading.Thread] = None
+_backup_lock = threading.Lock()
+
+
+def start_backup_job(interval: float, directory: Path = BACKUP_DIR, keep: int = BACKUP_KEEP) -> None:
+    """Take a snapshot every ``interval`` seconds on a daemon thread (once per process)."""
+    global _backup_thread
+    if interval <= 0:
+        return
+
+    def run() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                manifest = create_backup(directory, keep=keep)
+                print(
+                    f"backup-job: {manifest['file']} in {manifest['duration_s']:.2f}s "
+                    f"({manifest['throughput_mb_s']:.1f} MB/s)",
+                    file=sys.stderr,
+                )
+            except Exception as exc:
+                print(f"backup-job: run failed: {exc}", file=sys.stderr)
+
+    with _backup_lock:
+        if _backup_thread is not None and _backup_thread.is_alive():
+            return
+        _backup_thread = threading.Thread(target=run, name="backup-job", daemon=True)
+        _backup_thread.start()
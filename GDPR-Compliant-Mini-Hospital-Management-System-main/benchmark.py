@@ -0,0 +1,582 @@
+from __future__ import annotations
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import database
+from config import (
+    API_WORKERS,
+    AUDIT_DURABILITY,
+    DB_POOL_SIZE,
+    DECRYPT_CACHE_SIZE,
+    DECRYPT_CHUNK_SIZE,
+    DECRYPT_EXECUTOR,
+    DECRYPT_WORKERS,
+    IMPORT_BATCH_SIZE,
+)
+from db_setup import DIAGNOSES, ensure_synthetic_staff, synthetic_logs, synthetic_patients
+from security import decrypt_many, encrypt_many, shutdown_executor
+
+SUITE_OPERATIONS = (
+    "insert_patient",
+    "update_patient",
+    "fetch_patients",
+    "fetch_patients_sensitive",
+    "fetch_patients_frame_sensitive",
+    "fetch_patients_all",
+    "fetch_patients_all_sensitive",
+    "refresh_anonymized_fields",
+    "log_action",
+    "fetch_logs",
+)
+LOG_ACTIONS = ("login", "find_patient", "add_patient", "update_patient", "view_logs", "logout")
+
+
+def _timed(func: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def bench_decrypt(args: argparse.Namespace) -> List[Dict[str, float]]:
+    # Three Fernet tokens per patient row, mirroring fetch_patients(include_sensitive=True).
+    largest = max(args.rows)
+    print(f"Encrypting {largest * 3:,} tokens for {largest:,} rows...")
+    tokens = encrypt_many(
+        ["Hypertension", "+92-300-1234567", "Fatima Khan"] * largest,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        executor=args.executor,
+    )
+    # Start the pool before timing so worker spawn cost is not billed to the first size.
+    decrypt_many(tokens[: args.chunk_size * 2], workers=args.workers, chunk_size=args.chunk_size, executor=args.executor)
+
+    results = []
+    print(f"{'rows':>10} {'sequential s':>13} {'parallel s':>11} {'speed-up':>9}")
+    for rows in sorted(args.rows):
+        sample = tokens[: rows * 3]
+        sequential = _timed(lambda: decrypt_many(sample, workers=0))
+        parallel = _timed(
+            lambda: decrypt_many(sample, workers=args.workers, chunk_size=args.chunk_size, executor=args.executor)
+        )
+        results.append({"rows": rows, "sequential_s": sequential, "parallel_s": parallel})
+        print(f"{rows:>10,} {sequential:>13.3f} {parallel:>11.3f} {sequential / parallel:>8.2f}x")
+    return results
+
+
+def _synthetic_patient(rng: random.Random) -> Tuple[str, str, str]:
+    return next(synthetic_patients(rng, 1, days=1))[:3]
+
+
+def _table_count(table: str) -> int:
+    with database.get_connection() as conn:
+        return int(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+
+
+def _grow_to(rows: int, rng: random.Random) -> None:
+    """Top the patients and logs tables up to ``rows`` rows each."""
+    missing = rows - database.patient_count()
+    if missing > 0:
+        database.insert_patients_many(synthetic_patients(rng, missing), batch_size=IMPORT_BATCH_SIZE)
+    database.flush_audit_log()
+    missing = rows - _table_count("logs")
+    if missing > 0:
+        database.insert_logs_many(
+            synthetic_logs(rng, missing, ensure_synthetic_staff(), max_patient_id=rows),
+            batch_size=IMPORT_BATCH_SIZE * 10,
+        )
+
+
+def _summarize(operation: str, rows: int, latencies: List[float], items: int, total: float) -> Dict[str, Any]:
+    # quantiles() needs two points; a single sample is its own percentile.
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "operation": operation,
+        "rows": rows,
+        "samples": len(latencies),
+        "items": items,
+        "total_s": total,
+        "throughput_per_s": items / total if total else 0.0,
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+    }
+
+
+def _sample(func: Callable[[int], Any], samples: int) -> Tuple[List[float], float]:
+    func(-1)  # warm-up call: first-use costs (pool, page cache, statements) are not measured
+    latencies = []
+    started = time.perf_counter()
+    for index in range(samples):
+        begun = time.perf_counter()
+        func(index)
+        latencies.append(time.perf_counter() - begun)
+    return latencies, time.perf_counter() - started
+
+
+def _run_operation(operation: str, rows: int, args: argparse.Namespace, rng: random.Random) -> Optional[Dict[str, Any]]:
+    samples = args.samples
+    if operation == "insert_patient":
+        latencies, total = _sample(lambda _: database.insert_patient(*_synthetic_patient(rng)), samples)
+        return _summarize(operation, rows, latencies, samples, total)
+
+    if operation == "update_patient":
+        def update(index: int) -> None:
+            patient_id = rng.randint(1, rows)
+            if index % 2:
+                database.update_patient(patient_id, diagnosis=rng.choice(DIAGNOSES))
+            else:
+                database.update_patient(patient_id, contact=_synthetic_patient(rng)[1])
+
+        latencies, total = _sample(update, samples)
+        return _summarize(operation, rows, latencies, samples, total)
+
+    if operation in ("fetch_patients", "fetch_patients_sensitive", "fetch_patients_frame_sensitive"):
+        # Keyset pages starting at random depths, as the dashboard pages through the registry.
+        with database.get_connection() as conn:
+            cursors = [
+                tuple(conn.execute("SELECT date_added, patient_id FROM patients WHERE patient_id = ?", (patient_id,)).fetchone())
+                for patient_id in (rng.randint(1, rows) for _ in range(samples + 1))
+            ]
+        sensitive = operation != "fetch_patients"
+        fetch = database.fetch_patients_frame if operation == "fetch_patients_frame_sensitive" else database.fetch_patients
+        latencies, total = _sample(
+            lambda index: fetch(sensitive, page_size=args.page_size, after=cursors[index]),
+            samples,
+        )
+        return _summarize(operation, rows, latencies, samples * args.page_size, total)
+
+    if operation in ("fetch_patients_all", "fetch_patients_all_sensitive"):
+        if rows > args.full_scan_max:
+            return None
+        sensitive = operation == "fetch_patients_all_sensitive"
+        runs = max(1, min(samples, 5))
+        latencies, total = _sample(lambda _: database.fetch_patients(sensitive), runs)
+        return _summarize(operation, rows, latencies, runs * rows, total)
+
+    if operation == "refresh_anonymized_fields":
+        # One forced pass over the whole table; each batch commit is a latency sample.
+        latencies: List[float] = []
+        last = [time.perf_counter()]
+
+        def on_batch(done: int, total_rows: int) -> None:
+            now = time.perf_counter()
+            latencies.append(now - last[0])
+            last[0] = now
+
+        started = time.perf_counter()
+        done = database.refresh_anonymized_fields(force=True, progress=on_batch)
+        return _summarize(operation, rows, latencies, done, time.perf_counter() - started)
+
+    if operation == "log_action":
+        database.flush_audit_log()
+        latencies, total = _sample(
+            lambda index: database.log_action(1, "admin", "benchmark", f"sample {index}"),
+            samples,
+        )
+        # Throughput includes draining the write-behind queue, not just enqueueing.
+        started = time.perf_counter()
+        database.flush_audit_log()
+        return _summarize(operation, rows, latencies, samples, total + time.perf_counter() - started)
+
+    if operation == "fetch_logs":
+        def fetch(index: int) -> None:
+            if index % 2:
+                database.fetch_logs(args.page_size, action=rng.choice(LOG_ACTIONS))
+            else:
+                database.fetch_logs(args.page_size)
+
+        latencies, total = _sample(fetch, samples)
+        return _summarize(operation, rows, latencies, samples * args.page_size, total)
+
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).resolve().parent,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def bench_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the database/security hot paths at each size against one growing temp database."""
+    rng = random.Random(args.seed)
+    operations = args.operations or list(SUITE_OPERATIONS)
+    report: Dict[str, Any] = {
+        "created_at": datetime.utcnow().isoformat(),
+        "revision": _git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": {
+            "seed": args.seed,
+            "samples": args.samples,
+            "page_size": args.page_size,
+            "DB_POOL_SIZE": DB_POOL_SIZE,
+            "AUDIT_DURABILITY": AUDIT_DURABILITY,
+            "DECRYPT_WORKERS": DECRYPT_WORKERS,
+            "DECRYPT_CACHE_SIZE": DECRYPT_CACHE_SIZE,
+        },
+        "results": [],
+    }
+
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory(prefix="hospital-bench-", dir=args.tmp_dir) as workdir:
+        database.DB_PATH = Path(workdir) / "bench.db"
+        try:
+            database.init_db(seed=False)
+            database.seed_users()  # log_action samples are attributed to user 1
+            print(f"{'rows':>10} {'operation':<30} {'items/s':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+            for rows in sorted(args.rows):
+                started = time.perf_counter()
+                _grow_to(rows, rng)
+                print(f"{rows:>10,} {'(populate)':<30} {'':>12} {'':>9} {'':>9} {'':>9}  {time.perf_counter() - started:.1f}s")
+                for operation in operations:
+                    result = _run_operation(operation, rows, args, rng)
+                    if result is None:
+                        print(f"{rows:>10,} {operation:<30} {'skipped (--full-scan-max)':>12}")
+                        continue
+                    report["results"].append(result)
+                    print(
+                        f"{rows:>10,} {operation:<30} {result['throughput_per_s']:>12,.0f} "
+                        f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+                    )
+        finally:
+            database.flush_audit_log()
+            database.close_pool()
+            database.DB_PATH = original_path
+
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {args.output.resolve()}")
+    return report
+
+
+STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+from streamlit.testing.v1 import AppTest
+test = AppTest.from_file(app.__file__, default_timeout=300)
+started = time.perf_counter()
+test.run()
+print(json.dumps({
+    "import_s": imported,
+    "first_render_s": time.perf_counter() - started,
+    "errors": [str(element.value) for element in test.exception],
+}))
+"""
+
+
+def bench_startup(args: argparse.Namespace) -> Dict[str, Any]:
+    """Cold-start cost of the dashboard: each run is a fresh interpreter and a fresh database."""
+    app_dir = Path(__file__).resolve().parent
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(app_dir), os.environ.get("PYTHONPATH")])))
+    runs = []
+    for run in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="hospital-startup-", dir=args.tmp_dir) as workdir:
+            result = subprocess.run(
+                [sys.executable, "-c", STARTUP_PROBE],
+                cwd=workdir,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        if sample["errors"]:
+            raise SystemExit(f"App raised during startup: {sample['errors'][0]}")
+        runs.append(sample)
+        print(f"run {run + 1}: import {sample['import_s']:.3f}s, first render {sample['first_render_s']:.3f}s")
+
+    report: Dict[str, Any] = {
+        "created_at": datetime.utcnow().isoformat(),
+        "revision": _git_revision(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "runs": runs,
+    }
+    for metric in ("import_s", "first_render_s"):
+        values = [sample[metric] for sample in runs]
+        report[metric] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+        print(f"{metric:>15}: median {report[metric]['median']:.3f}s (min {min(values):.3f}s, max {max(values):.3f}s)")
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {args.output.resolve()}")
+    return report
+
+
+# Request mix for the API load test: (name, weight). Weights roughly follow a
+# kiosk/EHR integration: mostly reads, one write in five.
+API_MIX = (
+    ("list_patients", 35),
+    ("get_patient", 25),
+    ("search_patients", 10),
+    ("find_patient", 10),
+    ("create_patient", 10),
+    ("update_patient", 10),
+)
+# Receptionists may read and write patients, which covers the whole mix.
+API_CREDENTIALS = "Basic " + base64.b64encode(b"Alice_recep:rec123").decode()
+
+
+def _api_request(rng: random.Random, operation: str, patients: int) -> Tuple[str, str, Optional[bytes]]:
+    if operation == "list_patients":
+        return "GET", "/patients?page_size=50", None
+    if operation == "get_patient":
+        return "GET", f"/patients/{rng.randint(1, patients)}", None
+    if operation == "search_patients":
+        return "GET", f"/patients/search?q={rng.choice(DIAGNOSES)[:3]}", None
+    if operation == "find_patient":
+        name = _synthetic_patient(rng)[0]
+        return "GET", "/patients/find?name=" + name.replace(" ", "%20"), None
+    if operation == "create_patient":
+        name, contact, diagnosis = _synthetic_patient(rng)
+        return "POST", "/patients", json.dumps({"name": name, "contact": contact, "diagnosis": diagnosis}).encode()
+    return "PATCH", f"/patients/{rng.randint(1, patients)}", json.dumps({"diagnosis": rng.choice(DIAGNOSES)}).encode()
+
+
+def _api_client(
+    port: int,
+    seed: int,
+    patients: int,
+    measure_from: float,
+    deadline: float,
+    samples: Dict[str, List[float]],
+    errors: List[str],
+) -> None:
+    """One keep-alive connection issuing requests back to back until ``deadline``."""
+    rng = random.Random(seed)
+    names = [name for name, _ in API_MIX]
+    weights = [weight for _, weight in API_MIX]
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        while True:
+            operation = rng.choices(names, weights)[0]
+            method, path, body = _api_request(rng, operation, patients)
+            headers = {"Authorization": API_CREDENTIALS}
+            if body is not None:
+                headers["Content-Type"] = "application/json"
+            started = time.perf_counter()
+            if started >= deadline:
+                return
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            finished = time.perf_counter()
+            if response.status >= 400 and response.status != 404:
+                errors.append(f"{operation}: HTTP {response.status}")
+            elif started >= measure_from:
+                samples[operation].append(finished - started)
+    finally:
+        conn.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def bench_api(args: argparse.Namespace) -> Dict[str, Any]:
+    """Sustained requests per second against api.py on a synthetic database, server and clients on one box."""
+    rng = random.Random(args.seed)
+    app_dir = Path(__file__).resolve().parent
+    report: Dict[str, Any] = {
+        "created_at": datetime.utcnow().isoformat(),
+        "revision": _git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": {
+            "patients": args.patients,
+            "clients": args.clients,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "API_WORKERS": args.api_workers,
+            "seed": args.seed,
+        },
+    }
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory(prefix="hospital-api-", dir=args.tmp_dir) as workdir:
+        # The server runs in workdir, so it opens the database at its default relative path.
+        database.DB_PATH = Path(workdir) / original_path
+        try:
+            database.init_db(seed=False)
+            database.seed_users()
+            print(f"Populating {args.patients:,} patients...")
+            database.insert_patients_many(synthetic_patients(rng, args.patients), batch_size=IMPORT_BATCH_SIZE)
+        finally:
+            database.flush_audit_log()
+            database.close_pool()
+            database.DB_PATH = original_path
+
+        port = _free_port()
+        # Keys were loaded (or generated) into os.environ by importing security, so the server can decrypt.
+        env = dict(os.environ, API_WORKERS=str(args.api_workers))
+        server = subprocess.Popen(
+            [sys.executable, str(app_dir / "api.py"), "--port", str(port)],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            for _ in range(300):
+                if server.poll() is not None:
+                    raise SystemExit(f"API server exited during start-up:\n{server.stderr.read()}")
+                try:
+                    probe = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                    probe.request("GET", "/health")
+                    if probe.getresponse().status == 200:
+                        break
+                except OSError:
+                    time.sleep(0.1)
+            else:
+                raise SystemExit("API server did not become ready")
+
+            samples: Dict[str, List[float]] = {name: [] for name, _ in API_MIX}
+            errors: List[str] = []
+            measure_from = time.perf_counter() + args.warmup
+            deadline = measure_from + args.duration
+            print(f"Running {args.clients} clients for {args.warmup:g}s warm-up + {args.duration:g}s...")
+            clients = [
+                threading.Thread(
+                    target=_api_client,
+                    args=(port, args.seed + index, args.patients, measure_from, deadline, samples, errors),
+                )
+                for index in range(args.clients)
+            ]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    total = sum(len(latencies) for latencies in samples.values())
+    everything = [latency for latencies in samples.values() for latency in latencies]
+    report["results"] = [
+        _summarize(operation, args.patients, latencies, len(latencies), args.duration)
+        for operation, latencies in samples.items()
+        if latencies
+    ]
+    if everything:
+        report["overall"] = _summarize("all", args.patients, everything, total, args.duration)
+    report["errors"] = len(errors)
+    print(f"{'operation':<18} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for result in report["results"] + ([report["overall"]] if everything else []):
+        print(
+            f"{result['operation']:<18} {result['throughput_per_s']:>9,.1f} "
+            f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+        )
+    if errors:
+        print(f"{len(errors)} failed request(s), e.g. {errors[0]}")
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {args.output.resolve()}")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark database and crypto hot paths.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    decrypt_parser = subcommands.add_parser(
+        "decrypt",
+        help="Compare sequential and parallel Fernet decryption of patient rows.",
+    )
+    decrypt_parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    decrypt_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    decrypt_parser.add_argument("--chunk-size", type=int, default=DECRYPT_CHUNK_SIZE)
+    decrypt_parser.add_argument("--executor", choices=["process", "thread"], default=DECRYPT_EXECUTOR)
+
+    suite_parser = subcommands.add_parser(
+        "suite",
+        help="Time the patient and audit-log hot paths at growing table sizes on a temporary database.",
+    )
+    suite_parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    suite_parser.add_argument("--samples", type=int, default=200, help="Timed calls per operation and size.")
+    suite_parser.add_argument("--page-size", type=int, default=50, help="Page size for fetch_patients / fetch_logs.")
+    suite_parser.add_argument(
+        "--operations",
+        nargs="+",
+        choices=SUITE_OPERATIONS,
+        help="Only run these operations (default: all).",
+    )
+    suite_parser.add_argument(
+        "--full-scan-max",
+        type=int,
+        default=100_000,
+        help="Largest table size at which the unpaginated fetch_patients() variants are run.",
+    )
+    suite_parser.add_argument("--seed", type=int, default=42, help="Seed for generated data and sampling.")
+    suite_parser.add_argument("--tmp-dir", help="Directory for the temporary database (default: system temp).")
+    suite_parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+
+    startup_parser = subcommands.add_parser(
+        "startup",
+        help="Measure app.py import time and first render in fresh interpreters on empty databases.",
+    )
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--tmp-dir", help="Directory for the temporary working directories.")
+    startup_parser.add_argument("--output", type=Path, default=Path("startup-results.json"))
+
+    api_parser = subcommands.add_parser(
+        "api",
+        help="Load-test api.py with concurrent keep-alive clients and report sustained requests per second.",
+    )
+    api_parser.add_argument("--patients", type=int, default=10_000, help="Synthetic patients loaded before the run.")
+    api_parser.add_argument("--clients", type=int, default=16, help="Concurrent client connections.")
+    api_parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds.")
+    api_parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of load before measuring.")
+    api_parser.add_argument("--api-workers", type=int, default=API_WORKERS, help="API_WORKERS for the server.")
+    api_parser.add_argument("--seed", type=int, default=42)
+    api_parser.add_argument("--tmp-dir", help="Directory for the temporary database (default: system temp).")
+    api_parser.add_argument("--output", type=Path, default=Path("api-results.json"))
+    args = parser.parse_args()
+
+    try:
+        if args.command == "decrypt":
+            bench_decrypt(args)
+        elif args.command == "suite":
+            bench_suite(args)
+        elif args.command == "startup":
+            bench_startup(args)
+        elif args.command == "api":
+            bench_api(args)
+    finally:
+        shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,194 @@
+import hashlib
 import os
+import re
+import secrets
 from pathlib import Path
+from typing import Dict, Tuple
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from dotenv import load_dotenv
 
 _ENV_PATH = Path(".env")
 load_dotenv(dotenv_path=_ENV_PATH if _ENV_PATH.exists() else None)
 
 
-def _persist_key(key: str) -> None:
+def _persist_key(key: str, name: str = "FERNET_KEY") -> None:
     if _ENV_PATH.exists():
         content = _ENV_PATH.read_text(encoding="utf-8")
-        if "FERNET_KEY" in content:
+        if f"{name}=" in content:
             return
-        _ENV_PATH.write_text(content.rstrip() + f"\nFERNET_KEY={key}\n", encoding="utf-8")
+        _ENV_PATH.write_text(content.rstrip() + f"\n{name}={key}\n", encoding="utf-8")
     else:
-        _ENV_PATH.write_text(f"FERNET_KEY={key}\n", encoding="utf-8")
+        _ENV_PATH.write_text(f"{name}={key}\n", encoding="utf-8")
 
 
-def get_fernet() -> Fernet:
+def _fernet_key() -> str:
     key = os.getenv("FERNET_KEY")
     if not key:
         key = Fernet.generate_key().decode()
         _persist_key(key)
         os.environ["FERNET_KEY"] = key
-    return Fernet(key.encode())
+    return key
+
+
+def get_fernet() -> Fernet:
+    return Fernet(_fernet_key().encode())
+
+
+_KEY_ID = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+def key_fingerprint(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+
+
+def get_keyring() -> Tuple[str, Dict[str, Fernet], MultiFernet]:
+    """Return (primary key id, {key id: Fernet}, fallback for untagged legacy tokens).
+
+    FERNET_KEYS lists ``id:key`` pairs separated by commas, newest (primary)
+    first; older keys stay in the list until a rotation has re-encrypted
+    everything under the primary. Without FERNET_KEYS, FERNET_KEY is the only
+    key and its id is a fingerprint of the key. Every key is also reachable by
+    its fingerprint, so tokens written before FERNET_KEYS was set keep
+    decrypting. Untagged tokens written before key ids existed are decrypted
+    with FERNET_KEY (or, failing that, any key).
+    """
+    spec = os.getenv("FERNET_KEYS", "").strip()
+    if not spec:
+        key = _fernet_key()
+        fernet = Fernet(key.encode())
+        return key_fingerprint(key), {key_fingerprint(key): fernet}, MultiFernet([fernet])
+    ring: Dict[str, Fernet] = {}
+    fingerprints: Dict[str, Fernet] = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key_id, sep, key = entry.partition(":")
+        if not sep or not _KEY_ID.match(key_id):
+            raise ValueError(f"FERNET_KEYS entries must look like id:key (id: letters, digits, - or _), got {key_id!r}")
+        if key_id in ring:
+            raise ValueError(f"Duplicate key id {key_id!r} in FERNET_KEYS")
+        ring[key_id] = fingerprints[key_fingerprint(key.strip())] = Fernet(key.strip().encode())
+    legacy_key = os.getenv("FERNET_KEY")
+    if legacy_key:
+        fingerprints.setdefault(key_fingerprint(legacy_key), Fernet(legacy_key.encode()))
+    legacy = MultiFernet([Fernet(legacy_key.encode())] if legacy_key else list(ring.values()))
+    primary = next(iter(ring))
+    for key_id, fernet in fingerprints.items():
+        ring.setdefault(key_id, fernet)
+    return primary, ring, legacy
+
+
+def get_blind_index_key() -> bytes:
+    # Kept separate from FERNET_KEY so search tokens never share key material with encryption.
+    key = os.getenv("BLIND_INDEX_KEY")
+    if not key:
+        key = secrets.token_urlsafe(32)
+        _persist_key(key, "BLIND_INDEX_KEY")
+        os.environ["BLIND_INDEX_KEY"] = key
+    return key.encode()
+
+
+class MissingKeyError(RuntimeError):
+    pass
+
+
+def get_audit_chain_key() -> bytes:
+    # Signs audit-chain checkpoints; whoever can rewrite the database should not also hold this,
+    # so it is never generated into the .env next to the database and must come from outside.
+    key = os.getenv("AUDIT_CHAIN_KEY")
+    if not key:
+        raise MissingKeyError(
+            "AUDIT_CHAIN_KEY is not set, so audit-chain checkpoints cannot be signed or checked. "
+            "Provision it from a secret store or the service environment, not a file the database host can "
+            "write; generate one with: python -c \"import secrets; print(secrets.token_urlsafe(32))\""
+        )
+    return key.encode()
+
+
+def _int_setting(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
+def _float_setting(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+# Maximum number of idle SQLite connections kept for reuse.
+DB_POOL_SIZE = _int_setting("DB_POOL_SIZE", 4)
+# Seconds a connection may sit idle before it is health-checked on checkout.
+DB_POOL_CHECK_AFTER = _float_setting("DB_POOL_CHECK_AFTER", 30.0)
+# Rows encrypted and written per transaction by database.insert_patients_many.
+IMPORT_BATCH_SIZE = _int_setting("IMPORT_BATCH_SIZE", 1000)
+# Worker count for parallel Fernet decryption (0 or 1 keeps decryption in-line).
+DECRYPT_WORKERS = _int_setting("DECRYPT_WORKERS", 0)
+# Tokens handed to a worker per task.
+DECRYPT_CHUNK_SIZE = _int_setting("DECRYPT_CHUNK_SIZE", 2000)
+# "process" sidesteps the GIL; "thread" avoids worker start-up cost.
+DECRYPT_EXECUTOR = os.getenv("DECRYPT_EXECUTOR", "process").strip().lower()
+# Patient rows read, decrypted and written per chunk by the streaming CSV export.
+EXPORT_CHUNK_SIZE = _int_setting("EXPORT_CHUNK_SIZE", 1000)
+# Rows re-masked and committed per transaction by database.refresh_anonymized_fields.
+REFRESH_BATCH_SIZE = _int_setting("REFRESH_BATCH_SIZE", 500)
+# "batched" hands audit events to a background group-commit writer; "sync" commits each one inline.
+AUDIT_DURABILITY = os.getenv("AUDIT_DURABILITY", "batched").strip().lower()
+# Pending audit events held in memory before log_action blocks (back-pressure, never drops).
+AUDIT_QUEUE_SIZE = _int_setting("AUDIT_QUEUE_SIZE", 10000)
+# Maximum audit events written per group commit.
+AUDIT_BATCH_SIZE = _int_setting("AUDIT_BATCH_SIZE", 500)
+# Seconds the background writer waits for more events before committing what it has.
+AUDIT_FLUSH_INTERVAL = _float_setting("AUDIT_FLUSH_INTERVAL", 0.5)
+# Attempts the writer makes at a batch while the database is locked or busy before setting it aside.
+AUDIT_WRITE_ATTEMPTS = _int_setting("AUDIT_WRITE_ATTEMPTS", 8)
+# JSON-lines file for audit events that could not be committed; `db_setup.py audit-replay` re-inserts them.
+AUDIT_DEAD_LETTER = Path(os.getenv("AUDIT_DEAD_LETTER", "data/audit_dead_letter.jsonl"))
+# Users kept in the in-process login/session lookup cache, and how long (seconds) an entry is trusted.
+USER_CACHE_SIZE = _int_setting("USER_CACHE_SIZE", 256)
+USER_CACHE_TTL = _float_setting("USER_CACHE_TTL", 30.0)
+# Decrypted values kept in the in-process LRU cache (0 disables it) and their lifetime in seconds.
+DECRYPT_CACHE_SIZE = _int_setting("DECRYPT_CACHE_SIZE", 0)
+DECRYPT_CACHE_TTL = _float_setting("DECRYPT_CACHE_TTL", 300.0)
+# Records older than this many days are due for retention processing.
+RETENTION_DAYS = _int_setting("RETENTION_DAYS", 365)
+# "anonymize" strips identifiers but keeps the record for statistics; "erase" deletes it.
+RETENTION_MODE = os.getenv("RETENTION_MODE", "anonymize").strip().lower()
+# Records processed per retention transaction, and seconds between background runs (0 disables).
+RETENTION_BATCH_SIZE = _int_setting("RETENTION_BATCH_SIZE", 200)
+RETENTION_JOB_INTERVAL = _float_setting("RETENTION_JOB_INTERVAL", 0.0)
+# Record per-statement SQL timings on every pooled connection (off by default; adds overhead).
+SQL_PROFILE = os.getenv("SQL_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+# Slowest statements the profiler report runs EXPLAIN QUERY PLAN for.
+SQL_PROFILE_EXPLAIN = _int_setting("SQL_PROFILE_EXPLAIN", 5)
+# Patient rows re-encrypted and committed per batch by the key rotation job.
+ROTATION_BATCH_SIZE = _int_setting("ROTATION_BATCH_SIZE", 2000)
+# Address the headless API (api.py) listens on.
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = _int_setting("API_PORT", 8000)
+# Worker threads for the API's blocking SQLite and Fernet calls; further requests wait their turn.
+API_WORKERS = _int_setting("API_WORKERS", 8)
+# Largest page, search result or audit-log batch a single API request may ask for.
+API_MAX_PAGE_SIZE = _int_setting("API_MAX_PAGE_SIZE", 500)
+# Directory for database snapshots, and how many of the newest snapshots to keep.
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", "backups"))
+BACKUP_KEEP = _int_setting("BACKUP_KEEP", 7)
+# Database pages copied per backup step, and seconds between steps so writers get the lock.
+BACKUP_PAGES_PER_STEP = _int_setting("BACKUP_PAGES_PER_STEP", 1024)
+BACKUP_STEP_PAUSE = _float_setting("BACKUP_STEP_PAUSE", 0.01)
+# Seconds between snapshots taken by the app process (0 disables; cron `db_setup.py backup` also works).
+BACKUP_INTERVAL = _float_setting("BACKUP_INTERVAL", 0.0)
+# Audit entries older than this many days are moved out of the logs table into monthly archive segments.
+AUDIT_HOT_DAYS = _int_setting("AUDIT_HOT_DAYS", 90)
+AUDIT_ARCHIVE_DIR = Path(os.getenv("AUDIT_ARCHIVE_DIR", "archive"))
+# Entries archived per transaction, and seconds between background archive runs in the app (0 disables).
+AUDIT_ARCHIVE_BATCH_SIZE = _int_setting("AUDIT_ARCHIVE_BATCH_SIZE", 2000)
+AUDIT_ARCHIVE_INTERVAL = _float_setting("AUDIT_ARCHIVE_INTERVAL", 0.0)
+# Audit entries hashed per read by the chain verifier, and seconds between background verifications (0 disables).
+AUDIT_VERIFY_BATCH_SIZE = _int_setting("AUDIT_VERIFY_BATCH_SIZE", 5000)
+AUDIT_VERIFY_INTERVAL = _float_setting("AUDIT_VERIFY_INTERVAL", 0.0)
+# A verification signs a new checkpoint once this many entries, or this many seconds, have passed since the last one.
+AUDIT_CHECKPOINT_MIN_ENTRIES = _int_setting("AUDIT_CHECKPOINT_MIN_ENTRIES", 10_000)
+AUDIT_CHECKPOINT_MIN_AGE = _float_setting("AUDIT_CHECKPOINT_MIN_AGE", 3600.0)
@@ -1,63 +1,560 @@
 from __future__ import annotations
 
+import atexit
+import csv
+import io
+import json
+import os
+import queue
+import re
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from config import (
+    AUDIT_BATCH_SIZE,
+    AUDIT_DEAD_LETTER,
+    AUDIT_DURABILITY,
+    AUDIT_FLUSH_INTERVAL,
+    AUDIT_QUEUE_SIZE,
+    AUDIT_WRITE_ATTEMPTS,
+    DB_POOL_CHECK_AFTER,
+    DB_POOL_SIZE,
+    EXPORT_CHUNK_SIZE,
+    IMPORT_BATCH_SIZE,
+    REFRESH_BATCH_SIZE,
+    RETENTION_BATCH_SIZE,
+    RETENTION_DAYS,
+    RETENTION_MODE,
+    ROTATION_BATCH_SIZE,
+    SQL_PROFILE,
+    SQL_PROFILE_EXPLAIN,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+)
+from cryptography.fernet import InvalidToken
+
+from profiler import ProfiledConnection, sql_profiler
 
 from security import (
+    AUDIT_CHAIN_GENESIS,
+    MASK_RULES_VERSION,
+    audit_row_hash,
+    contact_index,
+    decrypt_many,
     decrypt_value,
+    encrypt_many,
     encrypt_value,
     hash_password,
+    key_id_of,
     mask_contact,
     mask_name,
     mask_text,
+    name_index,
+    primary_key_id,
+    reencrypt_many,
 )
 
 DB_PATH = Path("data/hospital.db")
 
 
-def get_connection() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
 
+class ConnectionPool:
+    """Thread-aware pool of SQLite connections bound to a single database file.
 
-def init_db(seed: bool = True) -> None:
-    with get_connection() as conn:
-        conn.executescript(
+    Idle connections are kept in a LIFO stack of at most ``size`` entries so the
+    hottest connection is reused first. A thread that re-enters
+    ``get_connection`` while it already holds a connection receives the same
+    one, which keeps nested helpers (e.g. ``seed_patients`` -> ``insert_patient``)
+    inside a single connection.
+    """
+
+    def __init__(self, path: Path, size: int = DB_POOL_SIZE, check_after: float = DB_POOL_CHECK_AFTER) -> None:
+        self.path = Path(path)
+        self.size = max(size, 0)
+        self.check_after = check_after
+        self._idle: List[Tuple[sqlite3.Connection, float]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        factory = ProfiledConnection if SQL_PROFILE else sqlite3.Connection
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=factory)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers (dashboards, online backups) run alongside the writer instead of blocking it.
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _checkout(self) -> sqlite3.Connection:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+            if time.monotonic() - released_at < self.check_after or self._is_healthy(conn):
+                return conn
+            _close_quietly(conn)
+        return self._connect()
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._closed and len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        _close_quietly(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            conn, depth = held
+            self._local.held = (conn, depth + 1)
+            try:
+                yield conn
+            finally:
+                self._local.held = (conn, depth)
+            return
+
+        conn = self._checkout()
+        self._local.held = (conn, 0)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                _close_quietly(conn)
+                conn = None
+            raise
+        finally:
+            self._local.held = None
+            if conn is not None:
+                self._release(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    path = Path(DB_PATH)
+    pool = _pool
+    if pool is not None and pool.path == path:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.path != path:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(path)
+        return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+atexit.register(close_pool)
+
+
+def get_connection() -> ContextManager[sqlite3.Connection]:
+    """Borrow a pooled connection; commits on success and rolls back on error."""
+    return get_pool().connection()
+
+
+Migration = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+def _add_blind_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE patients ADD COLUMN name_bidx TEXT")
+    conn.execute("ALTER TABLE patients ADD COLUMN contact_bidx TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_patients_name_bidx ON patients(name_bidx)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_patients_contact_bidx ON patients(contact_bidx)")
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT patient_id, name, contact FROM patients WHERE patient_id > ? ORDER BY patient_id LIMIT 1000",
+            (last_id,),
+        ).fetchall()
+        if not rows:
+            return
+        updates = []
+        for row in rows:
+            try:
+                name, contact = decrypt_value(row["name"]), decrypt_value(row["contact"])
+            except InvalidToken:
+                # Rows written under a key we do not hold stay unindexed rather than blocking the upgrade.
+                continue
+            updates.append((name_index(name), contact_index(contact), row["patient_id"]))
+        conn.executemany("UPDATE patients SET name_bidx = ?, contact_bidx = ? WHERE patient_id = ?", updates)
+        last_id = rows[-1]["patient_id"]
+
+
+def _add_patient_search(conn: sqlite3.Connection) -> None:
+    try:
+        conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('admin','doctor','receptionist'))
-            );
-
-            CREATE TABLE IF NOT EXISTS patients (
-                patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact TEXT NOT NULL,
-                diagnosis TEXT NOT NULL,
-                anonymized_name TEXT,
-                anonymized_contact TEXT,
-                anonymized_diagnosis TEXT,
-                date_added TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS logs (
-                log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                role TEXT NOT NULL,
-                action TEXT NOT NULL,
-                timestamp TEXT NOT NULL,
-                details TEXT,
-                FOREIGN KEY(user_id) REFERENCES users(user_id)
-            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+                anonymized_name,
+                anonymized_contact,
+                anonymized_diagnosis,
+                content='patients',
+                content_rowid='patient_id'
+            )
             """
         )
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: search_patients falls back to LIKE scans.
+        return
+    for statement in _split_sql(
+        """
+        CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+            INSERT INTO patients_fts (rowid, anonymized_name, anonymized_contact, anonymized_diagnosis)
+            VALUES (new.patient_id, new.anonymized_name, new.anonymized_contact, new.anonymized_diagnosis);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+            INSERT INTO patients_fts (patients_fts, rowid, anonymized_name, anonymized_contact, anonymized_diagnosis)
+            VALUES ('delete', old.patient_id, old.anonymized_name, old.anonymized_contact, old.anonymized_diagnosis);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS patients_fts_au
+        AFTER UPDATE OF anonymized_name, anonymized_contact, anonymized_diagnosis ON patients BEGIN
+            INSERT INTO patients_fts (patients_fts, rowid, anonymized_name, anonymized_contact, anonymized_diagnosis)
+            VALUES ('delete', old.patient_id, old.anonymized_name, old.anonymized_contact, old.anonymized_diagnosis);
+            INSERT INTO patients_fts (rowid, anonymized_name, anonymized_contact, anonymized_diagnosis)
+            VALUES (new.patient_id, new.anonymized_name, new.anonymized_contact, new.anonymized_diagnosis);
+        END;
+
+        INSERT INTO patients_fts (patients_fts) VALUES ('rebuild');
+        """
+    ):
+        conn.execute(statement)
+
+
+def _add_audit_chain(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE logs ADD COLUMN row_hash TEXT")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS audit_chain (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            genesis_log_id INTEGER NOT NULL,
+            last_log_id INTEGER NOT NULL,
+            last_hash TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS audit_checkpoints (
+            checkpoint_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            log_id INTEGER NOT NULL UNIQUE,
+            row_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            prev_signature TEXT NOT NULL,
+            signature TEXT NOT NULL
+        )
+        """
+    )
+    # The chain starts at the oldest entry still in the table; entries archived
+    # before this migration stay outside it.
+    first = conn.execute("SELECT MIN(log_id) FROM logs").fetchone()[0]
+    genesis = first if first is not None else _last_log_id(conn) + 1
+    last_id, prev = genesis - 1, AUDIT_CHAIN_GENESIS
+    while True:
+        rows = conn.execute(
+            "SELECT * FROM logs WHERE log_id > ? ORDER BY log_id LIMIT 1000",
+            (last_id,),
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            prev = audit_row_hash(
+                prev, row["log_id"], row["user_id"], row["role"], row["action"], row["timestamp"], row["details"]
+            )
+            updates.append((prev, row["log_id"]))
+        conn.executemany("UPDATE logs SET row_hash = ? WHERE log_id = ?", updates)
+        last_id = rows[-1]["log_id"]
+    conn.execute(
+        "INSERT INTO audit_chain (id, genesis_log_id, last_log_id, last_hash) VALUES (1, ?, ?, ?)",
+        (genesis, last_id, prev),
+    )
+
+
+# Append-only: every entry runs once per database, in order, inside its own
+# transaction. Never edit a migration that has shipped; add a new one instead.
+MIGRATIONS: List[Tuple[int, str, Migration]] = [
+    (
+        1,
+        "initial schema",
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('admin','doctor','receptionist'))
+        );
+
+        CREATE TABLE IF NOT EXISTS patients (
+            patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact TEXT NOT NULL,
+            diagnosis TEXT NOT NULL,
+            anonymized_name TEXT,
+            anonymized_contact TEXT,
+            anonymized_diagnosis TEXT,
+            date_added TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS logs (
+            log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            role TEXT NOT NULL,
+            action TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            details TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT PRIMARY KEY,
+            rows_done INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """,
+    ),
+    (
+        2,
+        "indexes for ordered patient and log reads",
+        """
+        CREATE INDEX IF NOT EXISTS idx_patients_date_added ON patients(date_added);
+        CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_logs_action_timestamp ON logs(action, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_logs_user_timestamp ON logs(user_id, timestamp);
+        """,
+    ),
+    (
+        3,
+        "track the masking-rule version behind each patient's masks",
+        """
+        ALTER TABLE patients ADD COLUMN mask_version INTEGER NOT NULL DEFAULT 0;
+        CREATE INDEX IF NOT EXISTS idx_patients_mask_version ON patients(mask_version);
+        """,
+    ),
+    (
+        4,
+        "audit activity rollups",
+        """
+        CREATE TABLE IF NOT EXISTS log_rollups (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            role TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (day, hour, action, role)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS log_user_rollups (
+            user_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL
+        );
+
+        INSERT INTO log_rollups (day, hour, action, role, total)
+        SELECT substr(timestamp, 1, 10), CAST(substr(timestamp, 12, 2) AS INTEGER), action, role, COUNT(*)
+          FROM logs
+         GROUP BY 1, 2, 3, 4;
+
+        INSERT INTO log_user_rollups (user_id, total)
+        SELECT user_id, COUNT(*) FROM logs WHERE user_id IS NOT NULL GROUP BY user_id;
+        """,
+    ),
+    (
+        5,
+        "allow user accounts to be disabled",
+        """
+        ALTER TABLE users ADD COLUMN disabled INTEGER NOT NULL DEFAULT 0;
+        """,
+    ),
+    (6, "blind indexes for exact-match patient lookups", _add_blind_indexes),
+    (7, "full-text search over the anonymized patient columns", _add_patient_search),
+    (
+        8,
+        "retention processing marker and index",
+        """
+        ALTER TABLE patients ADD COLUMN anonymized_at TEXT;
+        CREATE INDEX IF NOT EXISTS idx_patients_retention ON patients(date_added) WHERE anonymized_at IS NULL;
+        """,
+    ),
+    (
+        9,
+        "change counter for cross-session cache invalidation",
+        """
+        CREATE TABLE IF NOT EXISTS change_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID;
+
+        INSERT OR IGNORE INTO change_versions (name, version) VALUES ('patients', 0);
+
+        CREATE TRIGGER IF NOT EXISTS patients_version_ai AFTER INSERT ON patients BEGIN
+            UPDATE change_versions SET version = version + 1 WHERE name = 'patients';
+        END;
+        CREATE TRIGGER IF NOT EXISTS patients_version_au AFTER UPDATE ON patients BEGIN
+            UPDATE change_versions SET version = version + 1 WHERE name = 'patients';
+        END;
+        CREATE TRIGGER IF NOT EXISTS patients_version_ad AFTER DELETE ON patients BEGIN
+            UPDATE change_versions SET version = version + 1 WHERE name = 'patients';
+        END;
+        """,
+    ),
+    (
+        10,
+        "resumable encryption key rotation progress",
+        """
+        CREATE TABLE IF NOT EXISTS key_rotation (
+            target_key_id TEXT PRIMARY KEY,
+            last_patient_id INTEGER NOT NULL DEFAULT 0,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            completed_at TEXT
+        );
+        """,
+    ),
+    (
+        11,
+        "index of archived audit log segments",
+        """
+        CREATE TABLE IF NOT EXISTS log_archive_segments (
+            month TEXT PRIMARY KEY,
+            file TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            first_timestamp TEXT NOT NULL,
+            last_timestamp TEXT NOT NULL,
+            actions TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """,
+    ),
+    (12, "hash chain and signed checkpoints for the audit log", _add_audit_chain),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _split_sql(script: str) -> List[str]:
+    statements: List[str] = []
+    pending = ""
+    for piece in script.split(";"):
+        pending += piece + ";"
+        if sqlite3.complete_statement(pending):
+            if pending.strip(" \n;"):
+                statements.append(pending.strip())
+            pending = ""
+    return statements
+
+
+def _current_schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return int(row[0] or 0)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations in place and return the resulting schema version."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.commit()
+    current = _current_schema_version(conn)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the write lock.
+            current = _current_schema_version(conn)
+            if version <= current:
+                conn.rollback()
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for statement in _split_sql(step):
+                    conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.utcnow().isoformat()),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        current = version
+    return current
+
+
+def schema_version() -> int:
+    with get_connection() as conn:
+        return migrate(conn)
+
+
+def init_db(seed: bool = True) -> None:
+    with get_connection() as conn:
+        # One indexed read when the file is already current; migrate() only for new or older files.
+        try:
+            current = _current_schema_version(conn)
+        except sqlite3.OperationalError:
+            current = 0
+        if current < SCHEMA_VERSION:
+            migrate(conn)
     if seed:
         seed_users()
         seed_patients()
@@ -76,6 +573,7 @@ def seed_users() -> None:
                 (username, hash_password(raw_password), role),
             )
         conn.commit()
+    _user_cache.clear()
 
 
 def seed_patients() -> None:
@@ -90,19 +588,108 @@ def seed_patients() -> None:
             ("Muhammad Ali", "+92-345-2468135", "Seasonal Allergies"),
             ("Pervaiz Ahmed", "+92-312-3691357", "Migraine"),
         ]
-        for name, contact, diagnosis in demo_patients:
-            insert_patient(name, contact, diagnosis)
+        insert_patients_many(demo_patients)
+
+
+ROLES = ("admin", "doctor", "receptionist")
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire ``ttl`` seconds after being stored."""
+
+    _MISSING = object()
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max(max_size, 0)
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self._MISSING
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return self._MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any) -> None:
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Any) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Keyed by username; unknown usernames are cached as None so failed-login bursts stay cheap too.
+_user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
 
 
 def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
+    cached = _user_cache.get(username)
+    if cached is not TTLCache._MISSING:
+        return dict(cached) if cached is not None else None
     with get_connection() as conn:
         row = conn.execute(
-            "SELECT user_id, username, password, role FROM users WHERE username = ?",
+            "SELECT user_id, username, password, role, disabled FROM users WHERE username = ?",
             (username,),
         ).fetchone()
-        if not row:
-            return None
-        return dict(row)
+    user = dict(row) if row else None
+    _user_cache.set(username, user)
+    return dict(user) if user is not None else None
+
+
+def _check_role(role: str) -> None:
+    if role not in ROLES:
+        raise ValueError(f"Unknown role {role!r}; expected one of {', '.join(ROLES)}")
+
+
+def create_user(username: str, password: str, role: str) -> int:
+    _check_role(role)
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+            (username, hash_password(password), role),
+        )
+        conn.commit()
+    _user_cache.invalidate(username)
+    return int(cursor.lastrowid)
+
+
+def _update_user(username: str, assignment: str, value: Any) -> None:
+    with get_connection() as conn:
+        cursor = conn.execute(f"UPDATE users SET {assignment} = ? WHERE username = ?", (value, username))
+        conn.commit()
+    _user_cache.invalidate(username)
+    if cursor.rowcount == 0:
+        raise KeyError(username)
+
+
+def set_role(username: str, role: str) -> None:
+    _check_role(role)
+    _update_user(username, "role", role)
+
+
+def disable_user(username: str) -> None:
+    _update_user(username, "disabled", 1)
+
+
+def enable_user(username: str) -> None:
+    _update_user(username, "disabled", 0)
 
 
 def insert_patient(name: str, contact: str, diagnosis: str) -> int:
@@ -113,10 +700,17 @@ def insert_patient(name: str, contact: str, diagnosis: str) -> int:
     with get_connection() as conn:
         cursor = conn.execute(
             """
-            INSERT INTO patients (name, contact, diagnosis, date_added)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO patients (name, contact, diagnosis, name_bidx, contact_bidx, date_added)
+            VALUES (?, ?, ?, ?, ?, ?)
             """,
-            (encrypted_name, encrypted_contact, encrypted_diagnosis, now),
+            (
+                encrypted_name,
+                encrypted_contact,
+                encrypted_diagnosis,
+                name_index(name),
+                contact_index(contact),
+                now,
+            ),
         )
         patient_id = cursor.lastrowid
         conn.execute(
@@ -124,13 +718,15 @@ def insert_patient(name: str, contact: str, diagnosis: str) -> int:
             UPDATE patients
                SET anonymized_name = ?,
                    anonymized_contact = ?,
-                   anonymized_diagnosis = ?
+                   anonymized_diagnosis = ?,
+                   mask_version = ?
              WHERE patient_id = ?
             """,
             (
                 mask_name(patient_id),
                 mask_contact(contact),
                 mask_text(diagnosis),
+                MASK_RULES_VERSION,
                 patient_id,
             ),
         )
@@ -138,14 +734,152 @@ def insert_patient(name: str, contact: str, diagnosis: str) -> int:
         return patient_id
 
 
-def update_patient(patient_id: int, *, contact: Optional[str] = None, diagnosis: Optional[str] = None) -> None:
+def _next_patient_id(conn: sqlite3.Connection) -> int:
+    row = conn.execute(
+        """
+        SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'patients'), 0),
+            COALESCE((SELECT MAX(patient_id) FROM patients), 0)
+        ) + 1
+        """
+    ).fetchone()
+    return int(row[0])
+
+
+def insert_patients_many(
+    rows: Iterable[Sequence[str]],
+    *,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    source: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> int:
+    """Insert (name, contact, diagnosis[, date_added]) rows in batches, one transaction per batch.
+
+    Patient ids are reserved up front inside the write transaction so the masks
+    can be computed before the INSERT. Rows without a date_added are stamped
+    with the current time. When ``source`` is given, the number of rows
+    committed for it is recorded in ``import_progress`` in the same
+    transaction, which lets an interrupted import resume without duplicates.
+    Called inside a transaction the caller opened (see bulk_patient_load),
+    the batches are left for the caller to commit. ``workers`` overrides
+    DECRYPT_WORKERS for the encryption.
+    """
+    iterator = iter(rows)
+    inserted = 0
+    while True:
+        batch = list(islice(iterator, max(batch_size, 1)))
+        if not batch:
+            break
+        # One encrypt_many call per batch so DECRYPT_WORKERS can spread the Fernet work.
+        tokens = encrypt_many([value for row in batch for value in row[:3]], workers=workers)
+        now = datetime.utcnow().isoformat()
+        with get_connection() as conn:
+            owned = not conn.in_transaction
+            if owned:
+                conn.execute("BEGIN IMMEDIATE")
+            first_id = _next_patient_id(conn)
+            conn.executemany(
+                """
+                INSERT INTO patients (
+                    patient_id, name, contact, diagnosis, name_bidx, contact_bidx,
+                    anonymized_name, anonymized_contact, anonymized_diagnosis, mask_version, date_added
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        first_id + offset,
+                        *tokens[offset * 3 : offset * 3 + 3],
+                        name_index(row[0]),
+                        contact_index(row[1]),
+                        mask_name(first_id + offset),
+                        mask_contact(row[1]),
+                        mask_text(row[2]),
+                        MASK_RULES_VERSION,
+                        row[3] if len(row) > 3 else now,
+                    )
+                    for offset, row in enumerate(batch)
+                ],
+            )
+            if source is not None:
+                conn.execute(
+                    """
+                    INSERT INTO import_progress (source, rows_done, updated_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(source) DO UPDATE
+                       SET rows_done = rows_done + excluded.rows_done,
+                           updated_at = excluded.updated_at
+                    """,
+                    (source, len(batch), now),
+                )
+            if owned:
+                conn.commit()
+        inserted += len(batch)
+    return inserted
+
+
+@contextmanager
+def bulk_patient_load() -> Iterator[sqlite3.Connection]:
+    """One write transaction for a large load into ``patients``, with the per-row upkeep deferred.
+
+    The patients indexes and triggers (FTS sync, change counter) are dropped,
+    recreated from their own SQL once the body is done, the FTS index is
+    rebuilt in one pass and the change counter bumped once. Fsyncs are skipped
+    until the commit. Schema changes and rows commit together, so other
+    connections see either the old table or the new, fully indexed one, and an
+    error rolls everything back. Other writers wait for the whole load.
+    """
+    with get_connection() as conn:
+        synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        conn.execute("PRAGMA synchronous = OFF")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            deferred = conn.execute(
+                """
+                SELECT type, name, sql FROM sqlite_master
+                 WHERE tbl_name = 'patients' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+                """
+            ).fetchall()
+            for kind, name, _ in deferred:
+                conn.execute(f'DROP {kind.upper()} "{name}"')
+            yield conn
+            for _, _, sql in deferred:
+                conn.execute(sql)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'patients_fts'").fetchone():
+                conn.execute("INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')")
+            conn.execute("UPDATE change_versions SET version = version + 1 WHERE name = 'patients'")
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute(f"PRAGMA synchronous = {int(synchronous)}")
+
+
+def get_import_progress(source: str) -> int:
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT rows_done FROM import_progress WHERE source = ?",
+            (source,),
+        ).fetchone()
+        return int(row["rows_done"]) if row else 0
+
+
+def clear_import_progress(source: str) -> None:
+    with get_connection() as conn:
+        conn.execute("DELETE FROM import_progress WHERE source = ?", (source,))
+        conn.commit()
+
+
+def update_patient(patient_id: int, *, contact: Optional[str] = None, diagnosis: Optional[str] = None) -> bool:
+    """Re-encrypt and re-mask the given fields; returns False when no such patient exists."""
     if contact is None and diagnosis is None:
-        return
+        return get_patient(patient_id) is not None
     columns = []
     params: List[Any] = []
     if contact is not None:
         columns.append("contact = ?")
         params.append(encrypt_value(contact))
+        columns.append("contact_bidx = ?")
+        params.append(contact_index(contact))
     if diagnosis is not None:
         columns.append("diagnosis = ?")
         params.append(encrypt_value(diagnosis))
@@ -165,112 +899,1210 @@ def update_patient(patient_id: int, *, contact: Optional[str] = None, diagnosis:
             conn.execute(
                 """
                 UPDATE patients
-                   SET anonymized_contact = ?,
-                       anonymized_diagnosis = ?
+                   SET anonymized_name = ?,
+                       anonymized_contact = ?,
+                       anonymized_diagnosis = ?,
+                       mask_version = ?
                  WHERE patient_id = ?
                 """,
                 (
+                    mask_name(patient_id),
                     mask_contact(dec_contact),
                     mask_text(dec_diag),
+                    MASK_RULES_VERSION,
                     patient_id,
                 ),
             )
         conn.commit()
+    return row is not None
+
+
+PatientCursor = Tuple[str, int]
 
 
-def fetch_patients(include_sensitive: bool = False) -> List[Dict[str, Any]]:
+def patient_cursor(record: Any) -> PatientCursor:
+    """Keyset cursor of a record dict or DataFrame row (numpy scalars are converted for sqlite3)."""
+    return str(record["date_added"]), int(record["patient_id"])
+
+
+def _patient_page_query(
+    select: str,
+    page_size: Optional[int],
+    after: Optional[PatientCursor],
+    before: Optional[PatientCursor],
+) -> Tuple[str, List[Any], bool]:
+    where = ""
+    params: List[Any] = []
+    order = "DESC"
+    if after is not None:
+        where = "WHERE (date_added, patient_id) < (?, ?)"
+        params.extend(after)
+    elif before is not None:
+        where = "WHERE (date_added, patient_id) > (?, ?)"
+        params.extend(before)
+        order = "ASC"
+    params.append(page_size if page_size is not None else -1)
+    sql = f"""
+        SELECT {select} FROM patients
+        {where}
+        ORDER BY date_added {order}, patient_id {order}
+        LIMIT ?
+    """
+    return sql, params, order == "ASC"
+
+
+def fetch_patients(
+    include_sensitive: bool = False,
+    *,
+    page_size: Optional[int] = None,
+    after: Optional[PatientCursor] = None,
+    before: Optional[PatientCursor] = None,
+    decrypt_workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Return patients newest first, optionally one keyset page at a time.
+
+    ``after`` continues past the last record of a page and ``before`` walks back
+    from the first one; both take the ``patient_cursor`` of that record.
+    """
+    sql, params, reverse = _patient_page_query("*", page_size, after, before)
     with get_connection() as conn:
-        rows = conn.execute(
-            "SELECT * FROM patients ORDER BY datetime(date_added) DESC"
-        ).fetchall()
-    patients: List[Dict[str, Any]] = []
-    for row in rows:
-        record: Dict[str, Any] = {
+        rows = conn.execute(sql, params).fetchall()
+    if reverse:
+        rows.reverse()
+    return _patient_records(rows, include_sensitive, decrypt_workers)
+
+
+PATIENT_FRAME_COLUMNS = (
+    "patient_id",
+    "anonymized_name",
+    "anonymized_contact",
+    "anonymized_diagnosis",
+    "date_added",
+)
+SENSITIVE_PATIENT_COLUMNS = ("name", "contact", "diagnosis")
+LOG_COLUMNS = ("log_id", "user_id", "role", "action", "timestamp", "details")
+
+
+def _read_columns(conn: sqlite3.Connection, sql: str, params: List[Any], columns: Sequence[str]) -> Dict[str, List[Any]]:
+    """Run ``sql`` and return its result transposed into one list per column."""
+    cursor = conn.cursor()
+    cursor.row_factory = None  # plain tuples; sqlite3.Row is not needed to transpose
+    rows = cursor.execute(sql, params).fetchall()
+    if not rows:
+        return {column: [] for column in columns}
+    return {column: list(values) for column, values in zip(columns, zip(*rows))}
+
+
+def _to_frame(data: Dict[str, List[Any]], as_arrow: bool) -> Any:
+    # pandas (and optionally pyarrow) are only needed by the UI, not by the CLI tools.
+    if as_arrow:
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pass
+        else:
+            return pa.table(data)
+    import pandas as pd
+
+    if not any(data.values()):
+        return pd.DataFrame(columns=list(data))  # object dtype rather than float64 for empty results
+    return pd.DataFrame(data, columns=list(data))
+
+
+def fetch_patients_frame(
+    include_sensitive: bool = False,
+    *,
+    columns: Optional[Sequence[str]] = None,
+    page_size: Optional[int] = None,
+    after: Optional[PatientCursor] = None,
+    before: Optional[PatientCursor] = None,
+    decrypt_workers: Optional[int] = None,
+    as_arrow: bool = False,
+) -> Any:
+    """Columnar ``fetch_patients``: a pandas DataFrame (a pyarrow Table with ``as_arrow``
+    when pyarrow is installed) holding only ``columns``.
+
+    Defaults to the anonymized columns, plus name/contact/diagnosis when
+    ``include_sensitive``; those are decrypted one column at a time.
+    """
+    if columns is None:
+        columns = PATIENT_FRAME_COLUMNS + (SENSITIVE_PATIENT_COLUMNS if include_sensitive else ())
+    unknown = set(columns) - set(PATIENT_FRAME_COLUMNS) - set(SENSITIVE_PATIENT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown patient column(s): {', '.join(sorted(unknown))}")
+    if not include_sensitive and set(columns) & set(SENSITIVE_PATIENT_COLUMNS):
+        raise ValueError("Encrypted columns require include_sensitive=True")
+    sql, params, reverse = _patient_page_query(", ".join(columns), page_size, after, before)
+    with get_connection() as conn:
+        data = _read_columns(conn, sql, params, columns)
+    for column, values in data.items():
+        if reverse:
+            values.reverse()
+        if column in SENSITIVE_PATIENT_COLUMNS:
+            data[column] = decrypt_many(values, workers=decrypt_workers)
+    return _to_frame(data, as_arrow)
+
+
+def _patient_records(
+    rows: List[sqlite3.Row],
+    include_sensitive: bool,
+    decrypt_workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    patients: List[Dict[str, Any]] = [
+        {
             "patient_id": row["patient_id"],
             "date_added": row["date_added"],
             "anonymized_name": row["anonymized_name"],
             "anonymized_contact": row["anonymized_contact"],
             "anonymized_diagnosis": row["anonymized_diagnosis"],
         }
-        if include_sensitive:
-            record.update(
-                {
-                    "name": decrypt_value(row["name"]),
-                    "contact": decrypt_value(row["contact"]),
-                    "diagnosis": decrypt_value(row["diagnosis"]),
-                }
-            )
-        patients.append(record)
+        for row in rows
+    ]
+    if include_sensitive and rows:
+        tokens = [row[column] for row in rows for column in ("name", "contact", "diagnosis")]
+        plain = decrypt_many(tokens, workers=decrypt_workers)
+        for index, record in enumerate(patients):
+            record["name"], record["contact"], record["diagnosis"] = plain[index * 3:index * 3 + 3]
     return patients
 
 
-def delete_patient(patient_id: int) -> None:
+def get_patient(patient_id: int, include_sensitive: bool = False) -> Optional[Dict[str, Any]]:
     with get_connection() as conn:
-        conn.execute("DELETE FROM patients WHERE patient_id = ?", (patient_id,))
-        conn.commit()
+        row = conn.execute("SELECT * FROM patients WHERE patient_id = ?", (patient_id,)).fetchone()
+    return _patient_records([row], include_sensitive)[0] if row else None
+
 
+def find_patients(
+    *,
+    name: Optional[str] = None,
+    contact: Optional[str] = None,
+    include_sensitive: bool = False,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """Exact-match lookup by normalized name and/or contact via their blind indexes.
 
-def refresh_anonymized_fields() -> None:
+    Only the matching rows are read (and decrypted, when ``include_sensitive``).
+    """
+    filters = []
+    params: List[Any] = []
+    if name:
+        filters.append("name_bidx = ?")
+        params.append(name_index(name))
+    if contact:
+        filters.append("contact_bidx = ?")
+        params.append(contact_index(contact))
+    if not filters or None in params:
+        return []
+    params.append(limit)
     with get_connection() as conn:
         rows = conn.execute(
-            "SELECT patient_id, contact, diagnosis FROM patients"
+            f"""
+            SELECT * FROM patients
+             WHERE {' AND '.join(filters)}
+             ORDER BY date_added DESC, patient_id DESC
+             LIMIT ?
+            """,
+            params,
         ).fetchall()
-        for row in rows:
-            contact = decrypt_value(row["contact"])
-            diagnosis = decrypt_value(row["diagnosis"])
-            conn.execute(
+    return _patient_records(rows, include_sensitive)
+
+
+def _has_patient_fts(conn: sqlite3.Connection) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'"
+    ).fetchone()
+    return row is not None
+
+
+def search_terms(query: str) -> List[str]:
+    """The words search_patients matches on; punctuation and FTS syntax are dropped."""
+    return re.findall(r"\w+", query.lower())
+
+
+def search_patients(
+    query: str,
+    limit: int = 50,
+    *,
+    added_after: Optional[str] = None,
+    added_before: Optional[str] = None,
+    include_sensitive: bool = False,
+) -> List[Dict[str, Any]]:
+    """Search the anonymized columns (prefix match per word), optionally within a date range.
+
+    Every word must match; results are ranked by relevance, or newest first when
+    only a date range is given. A query with no words in it (only punctuation)
+    matches nothing rather than everything.
+    """
+    terms = search_terms(query)
+    if query.strip() and not terms:
+        return []
+    filters = []
+    params: List[Any] = []
+    if added_after:
+        filters.append("p.date_added >= ?")
+        params.append(added_after)
+    if added_before:
+        filters.append("p.date_added < ?")
+        params.append(added_before)
+    with get_connection() as conn:
+        if terms and _has_patient_fts(conn):
+            match = " ".join(f'"{term}"*' for term in terms)
+            where = " AND ".join(["patients_fts MATCH ?", *filters])
+            rows = conn.execute(
+                f"""
+                SELECT p.* FROM patients_fts
+                  JOIN patients AS p ON p.patient_id = patients_fts.rowid
+                 WHERE {where}
+                 ORDER BY patients_fts.rank
+                 LIMIT ?
+                """,
+                [match, *params, limit],
+            ).fetchall()
+        else:
+            for term in terms:
+                filters.append(
+                    "(lower(p.anonymized_name) LIKE ? OR lower(p.anonymized_contact) LIKE ?"
+                    " OR lower(p.anonymized_diagnosis) LIKE ?)"
+                )
+                params.extend([f"%{term}%"] * 3)
+            where = f"WHERE {' AND '.join(filters)}" if filters else ""
+            rows = conn.execute(
+                f"""
+                SELECT p.* FROM patients AS p
+                {where}
+                ORDER BY p.date_added DESC, p.patient_id DESC
+                LIMIT ?
+                """,
+                [*params, limit],
+            ).fetchall()
+    return _patient_records(rows, include_sensitive)
+
+
+PATIENT_EXPORT_COLUMNS = (
+    "patient_id",
+    "date_added",
+    "anonymized_name",
+    "anonymized_contact",
+    "anonymized_diagnosis",
+    "name",
+    "contact",
+    "diagnosis",
+)
+
+
+def iter_patient_pages(
+    include_sensitive: bool = False,
+    *,
+    page_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[List[Dict[str, Any]]]:
+    after: Optional[PatientCursor] = None
+    while True:
+        page = fetch_patients(include_sensitive, page_size=page_size, after=after)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after = patient_cursor(page[-1])
+
+
+def iter_patient_csv(
+    include_sensitive: bool = True,
+    *,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    compress: bool = False,
+) -> Iterator[bytes]:
+    """Yield the patient registry as CSV (optionally gzip) bytes, one chunk at a time.
+
+    Only one chunk of rows is decrypted and buffered at any point, so memory stays
+    flat however large the registry grows.
+    """
+    columns = PATIENT_EXPORT_COLUMNS if include_sensitive else PATIENT_EXPORT_COLUMNS[:5]
+    gzip_stream = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+
+    def drain() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return gzip_stream.compress(data) if gzip_stream else data
+
+    writer.writeheader()
+    header = drain()
+    if header:
+        yield header
+    for page in iter_patient_pages(include_sensitive, page_size=chunk_size):
+        writer.writerows(page)
+        chunk = drain()
+        if chunk:
+            yield chunk
+    if gzip_stream:
+        yield gzip_stream.flush()
+
+
+def delete_patient(patient_id: int) -> bool:
+    with get_connection() as conn:
+        cursor = conn.execute("DELETE FROM patients WHERE patient_id = ?", (patient_id,))
+        conn.commit()
+    return cursor.rowcount > 0
+
+
+def count_stale_masks() -> int:
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM patients WHERE mask_version < ?",
+            (MASK_RULES_VERSION,),
+        ).fetchone()
+        return int(row[0])
+
+
+def refresh_anonymized_fields(
+    *,
+    force: bool = False,
+    batch_size: int = REFRESH_BATCH_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """Recompute masks produced by an older MASK_RULES_VERSION (every row when ``force``).
+
+    Rows are walked in patient_id order and written back in ``batch_size``
+    executemany batches, each committed on its own so the write lock is only held
+    briefly. ``progress(done, total)`` is called after every batch. Returns the
+    number of rows re-masked.
+    """
+    with get_connection() as conn:
+        if force:
+            total = int(conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0])
+        else:
+            total = int(
+                conn.execute(
+                    "SELECT COUNT(*) FROM patients WHERE mask_version < ?",
+                    (MASK_RULES_VERSION,),
+                ).fetchone()[0]
+            )
+    if not total:
+        return 0
+
+    done = 0
+    last_id = 0
+    while True:
+        with get_connection() as conn:
+            # The unary + keeps SQLite on the primary key so the keyset walk stays O(n).
+            rows = conn.execute(
+                """
+                SELECT patient_id, contact, diagnosis
+                  FROM patients
+                 WHERE patient_id > ? AND (? OR +mask_version < ?)
+                 ORDER BY patient_id
+                 LIMIT ?
+                """,
+                (last_id, int(force), MASK_RULES_VERSION, max(batch_size, 1)),
+            ).fetchall()
+            if not rows:
+                break
+            plain = decrypt_many([row[column] for row in rows for column in ("contact", "diagnosis")])
+            # Matching on the ciphertexts skips rows that update_patient rewrote
+            # (and re-masked) after this batch was read.
+            conn.executemany(
                 """
                 UPDATE patients
                    SET anonymized_name = ?,
                        anonymized_contact = ?,
-                       anonymized_diagnosis = ?
-                 WHERE patient_id = ?
+                       anonymized_diagnosis = ?,
+                       mask_version = ?
+                 WHERE patient_id = ? AND contact = ? AND diagnosis = ?
                 """,
-                (
-                    mask_name(row["patient_id"]),
-                    mask_contact(contact),
-                    mask_text(diagnosis),
-                    row["patient_id"],
-                ),
+                [
+                    (
+                        mask_name(row["patient_id"]),
+                        mask_contact(plain[index * 2]),
+                        mask_text(plain[index * 2 + 1]),
+                        MASK_RULES_VERSION,
+                        row["patient_id"],
+                        row["contact"],
+                        row["diagnosis"],
+                    )
+                    for index, row in enumerate(rows)
+                ],
             )
+            conn.commit()
+        last_id = rows[-1]["patient_id"]
+        done += len(rows)
+        if progress is not None:
+            progress(min(done, total), total)
+    return done
+
+
+# A row needs rotating while any of its ciphertexts is not under the target key.
+_STALE_KEY_FILTER = """
+    NOT (IFNULL(name GLOB :prefix, 1) AND IFNULL(contact GLOB :prefix, 1) AND IFNULL(diagnosis GLOB :prefix, 1))
+"""
+
+
+def count_unrotated_patients() -> int:
+    with get_connection() as conn:
+        row = conn.execute(
+            f"SELECT COUNT(*) FROM patients WHERE {_STALE_KEY_FILTER}",
+            {"prefix": f"{primary_key_id()}:*"},
+        ).fetchone()
+        return int(row[0])
+
+
+def get_rotation_progress(key_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM key_rotation WHERE target_key_id = ?",
+            (key_id or primary_key_id(),),
+        ).fetchone()
+        return dict(row) if row else None
+
+
+def key_usage() -> Dict[str, int]:
+    """Number of patient ciphertexts per key id ("legacy" for untagged tokens)."""
+    usage: Counter = Counter()
+    with get_connection() as conn:
+        for row in conn.execute("SELECT name, contact, diagnosis FROM patients"):
+            for value in row:
+                if value is not None:
+                    usage[key_id_of(value) or "legacy"] += 1
+    return dict(usage)
+
+
+def rotate_patient_keys(
+    *,
+    batch_size: int = ROTATION_BATCH_SIZE,
+    workers: Optional[int] = None,
+    restart: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """Re-encrypt patient rows still under an older key with the primary key.
+
+    Rows are walked in patient_id order; each batch is decrypted and
+    re-encrypted by the DECRYPT_EXECUTOR pool (``workers`` overrides
+    DECRYPT_WORKERS) outside any transaction, then written back in one short
+    transaction that also records how far the walk got in ``key_rotation``, so
+    an interrupted run resumes after the last committed batch. The UPDATE only
+    matches rows whose ciphertexts are unchanged since they were read; a batch
+    with rows the app rewrote in the meantime is read again, which returns only
+    the rows that still hold older-key ciphertexts. Returns the number of rows
+    re-encrypted by this call.
+    """
+    target = primary_key_id()
+    prefix = {"prefix": f"{target}:*"}
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        if restart:
+            conn.execute("DELETE FROM key_rotation WHERE target_key_id = ?", (target,))
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO key_rotation (target_key_id, started_at, updated_at)
+            VALUES (?, ?, ?)
+            """,
+            (target, now, now),
+        )
         conn.commit()
+        last_id = int(
+            conn.execute(
+                "SELECT last_patient_id FROM key_rotation WHERE target_key_id = ?",
+                (target,),
+            ).fetchone()[0]
+        )
+        total = int(
+            conn.execute(
+                f"SELECT COUNT(*) FROM patients WHERE patient_id > :after AND {_STALE_KEY_FILTER}",
+                {"after": last_id, **prefix},
+            ).fetchone()[0]
+        )
 
+    done = 0
+    while True:
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT patient_id, name, contact, diagnosis
+                  FROM patients
+                 WHERE patient_id > :after AND {_STALE_KEY_FILTER}
+                 ORDER BY patient_id
+                 LIMIT :limit
+                """,
+                {"after": last_id, "limit": max(batch_size, 1), **prefix},
+            ).fetchall()
+        if not rows:
+            break
+        tokens = reencrypt_many(
+            [row[column] for row in rows for column in ("name", "contact", "diagnosis")],
+            workers=workers,
+        )
+        with get_connection() as conn:
+            cursor = conn.executemany(
+                """
+                UPDATE patients
+                   SET name = ?, contact = ?, diagnosis = ?
+                 WHERE patient_id = ? AND name = ? AND contact IS ? AND diagnosis IS ?
+                """,
+                [
+                    (
+                        *tokens[index * 3:index * 3 + 3],
+                        row["patient_id"],
+                        row["name"],
+                        row["contact"],
+                        row["diagnosis"],
+                    )
+                    for index, row in enumerate(rows)
+                ],
+            )
+            rotated = cursor.rowcount
+            # A row the app rewrote meanwhile may still hold older-key columns it did not
+            # touch; stay on this batch so the next read picks up whatever is still stale.
+            if rotated == len(rows):
+                last_id = rows[-1]["patient_id"]
+            conn.execute(
+                """
+                UPDATE key_rotation
+                   SET last_patient_id = ?, rows_done = rows_done + ?, updated_at = ?
+                 WHERE target_key_id = ?
+                """,
+                (last_id, rotated, datetime.utcnow().isoformat(), target),
+            )
+            conn.commit()
+        done += rotated
+        if progress is not None:
+            progress(min(done, total), total)
 
-def log_action(user_id: Optional[int], role: str, action: str, details: str = "") -> None:
-    timestamp = datetime.utcnow().isoformat()
     with get_connection() as conn:
         conn.execute(
-            "INSERT INTO logs (user_id, role, action, timestamp, details) VALUES (?, ?, ?, ?, ?)",
-            (user_id, role, action, timestamp, details[:250]),
+            "UPDATE key_rotation SET completed_at = ?, updated_at = ? WHERE target_key_id = ?",
+            (datetime.utcnow().isoformat(), datetime.utcnow().isoformat(), target),
         )
         conn.commit()
+    return done
+
+
+LogRow = Tuple[Optional[int], str, str, str, str]
 
 
-def fetch_logs(limit: int = 200) -> List[Dict[str, Any]]:
+def _last_log_id(conn: sqlite3.Connection) -> int:
+    # AUTOINCREMENT's high-water mark: archived entries keep their ids reserved.
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'logs'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _insert_logs(conn: sqlite3.Connection, rows: List[LogRow]) -> None:
+    if not conn.in_transaction:
+        # Reading the chain head and appending to it must happen under one write lock.
+        conn.execute("BEGIN IMMEDIATE")
+    log_id = _last_log_id(conn)
+    prev = conn.execute("SELECT last_hash FROM audit_chain WHERE id = 1").fetchone()[0]
+    chained = []
+    for user_id, role, action, timestamp, details in rows:
+        log_id += 1
+        prev = audit_row_hash(prev, log_id, user_id, role, action, timestamp, details)
+        chained.append((log_id, user_id, role, action, timestamp, details, prev))
+    conn.executemany(
+        "INSERT INTO logs (log_id, user_id, role, action, timestamp, details, row_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        chained,
+    )
+    conn.execute("UPDATE audit_chain SET last_log_id = ?, last_hash = ? WHERE id = 1", (log_id, prev))
+    # Keep the analytics rollups in step with the rows just written, in the same transaction.
+    _add_log_rollups(conn, rows)
+
+
+def _add_log_rollups(conn: sqlite3.Connection, rows: Iterable[LogRow]) -> None:
+    buckets: Counter = Counter()
+    users: Counter = Counter()
+    for user_id, role, action, timestamp, _ in rows:
+        buckets[(timestamp[:10], int(timestamp[11:13]), action, role)] += 1
+        if user_id is not None:
+            users[user_id] += 1
+    conn.executemany(
+        """
+        INSERT INTO log_rollups (day, hour, action, role, total) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(day, hour, action, role) DO UPDATE SET total = total + excluded.total
+        """,
+        [(*bucket, total) for bucket, total in buckets.items()],
+    )
+    conn.executemany(
+        """
+        INSERT INTO log_user_rollups (user_id, total) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET total = total + excluded.total
+        """,
+        users.items(),
+    )
+
+
+def insert_logs_many(rows: Iterable[LogRow], *, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Write pre-built audit rows synchronously, one transaction per batch (bulk loads and tooling)."""
+    flush_audit_log()
+    iterator = iter(rows)
+    inserted = 0
+    while True:
+        batch = list(islice(iterator, max(batch_size, 1)))
+        if not batch:
+            break
+        with get_connection() as conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            _insert_logs(conn, batch)
+            conn.commit()
+        inserted += len(batch)
+    return inserted
+
+
+def rebuild_log_rollups(archived: Iterable[LogRow] = ()) -> None:
+    """Recompute the activity rollups from the logs table (backfill or repair).
+
+    Rows moved out of the table by the audit archive are passed as ``archived``
+    so the rebuilt rollups still cover the full history.
+    """
+    flush_audit_log()
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM log_rollups")
+        conn.execute("DELETE FROM log_user_rollups")
+        conn.execute(
+            """
+            INSERT INTO log_rollups (day, hour, action, role, total)
+            SELECT substr(timestamp, 1, 10), CAST(substr(timestamp, 12, 2) AS INTEGER), action, role, COUNT(*)
+              FROM logs
+             GROUP BY 1, 2, 3, 4
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO log_user_rollups (user_id, total)
+            SELECT user_id, COUNT(*) FROM logs WHERE user_id IS NOT NULL GROUP BY user_id
+            """
+        )
+        archived = iter(archived)
+        while True:
+            batch = list(islice(archived, IMPORT_BATCH_SIZE * 10))
+            if not batch:
+                break
+            _add_log_rollups(conn, batch)
+        conn.commit()
+
+
+def _is_transient(exc: BaseException) -> bool:
+    # Another connection holding the lock; anything else will fail the same way on a retry.
+    message = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def _dead_letter(rows: List[LogRow], exc: BaseException, path: Path = AUDIT_DEAD_LETTER) -> None:
+    error = f"{type(exc).__name__}: {exc}"
+    lines = "".join(
+        json.dumps({"row": list(row), "error": error, "failed_at": datetime.utcnow().isoformat()}) + "\n"
+        for row in rows
+    )
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as handle:
+            handle.write(lines)
+            handle.flush()
+            os.fsync(handle.fileno())
+    except OSError as write_error:
+        # Last resort: the events end up in the process log rather than nowhere.
+        print(f"audit-writer: cannot write {path} ({write_error}); lost events follow", file=sys.stderr)
+        print(lines, end="", file=sys.stderr)
+        return
+    print(f"audit-writer: {len(rows)} event(s) set aside in {path} after error: {error}", file=sys.stderr)
+
+
+def replay_audit_dead_letter(path: Path = AUDIT_DEAD_LETTER) -> int:
+    """Re-insert events the audit writer set aside; the file is removed once they are committed."""
+    path = Path(path)
+    if not path.exists():
+        return 0
+    rows: List[LogRow] = []
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                user_id, role, action, timestamp, details = json.loads(line)["row"]
+                rows.append((user_id, role, action, timestamp, details))
+    inserted = insert_logs_many(rows)
+    path.unlink()
+    return inserted
+
+
+class AuditWriter:
+    """Write-behind audit logger that group-commits queued events on a background thread.
+
+    The queue is bounded: when it is full ``submit`` blocks instead of dropping
+    events, so audit completeness is never traded for latency. A batch that
+    still fails after ``max_attempts`` lock/busy retries, or fails for any other
+    reason, is retried row by row (so one bad event cannot hold back the rest)
+    and whatever still fails goes to the ``dead_letter`` file. The writer itself
+    never stops, so ``flush`` always returns.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        max_attempts: int = AUDIT_WRITE_ATTEMPTS,
+        dead_letter: Path = AUDIT_DEAD_LETTER,
+    ) -> None:
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_attempts = max(max_attempts, 1)
+        self.dead_letter = Path(dead_letter)
+        self._queue: "queue.Queue[Optional[LogRow]]" = queue.Queue(maxsize=max(max_queue, 1))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row: LogRow) -> None:
+        self._ensure_started()
+        self._queue.put(row)
+
+    def flush(self) -> None:
+        """Block until every event submitted so far has been committed."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch: List[LogRow] = []
+            taken = 1
+            if first is None:
+                stopping = True
+            else:
+                batch.append(first)
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+            try:
+                if batch:
+                    self._write(batch)
+            except BaseException as exc:
+                _dead_letter(batch, exc, self.dead_letter)
+            finally:
+                # Always settle the queue, or flush() would wait forever.
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    @staticmethod
+    def _commit(rows: List[LogRow]) -> None:
+        with get_connection() as conn:
+            _insert_logs(conn, rows)
+            conn.commit()
+
+    def _write(self, batch: List[LogRow]) -> None:
+        delay = 0.1
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._commit(batch)
+                return
+            except Exception as exc:
+                if not _is_transient(exc):
+                    error = exc
+                    break
+                if attempt == self.max_attempts:
+                    # Still locked: row-by-row would wait on the same lock, so set the batch aside.
+                    _dead_letter(batch, exc, self.dead_letter)
+                    return
+                print(f"audit-writer: retrying {len(batch)} event(s) after error: {exc}", file=sys.stderr)
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+        if len(batch) == 1:
+            _dead_letter(batch, error, self.dead_letter)
+            return
+        for row in batch:
+            try:
+                self._commit([row])
+            except Exception as exc:
+                _dead_letter([row], exc, self.dead_letter)
+
+
+_audit_writer = AuditWriter()
+atexit.register(_audit_writer.close)
+
+
+def flush_audit_log() -> None:
+    _audit_writer.flush()
+
+
+def log_action(user_id: Optional[int], role: str, action: str, details: str = "") -> None:
+    timestamp = datetime.utcnow().isoformat()
+    row: LogRow = (user_id, role, action, timestamp, details[:250])
+    if AUDIT_DURABILITY == "sync":
+        with get_connection() as conn:
+            _insert_logs(conn, [row])
+            conn.commit()
+        return
+    _audit_writer.submit(row)
+
+
+def _log_filters(action: Optional[str], user_id: Optional[int]) -> Tuple[str, List[Any]]:
+    filters = []
+    params: List[Any] = []
+    if action is not None:
+        filters.append("action = ?")
+        params.append(action)
+    if user_id is not None:
+        filters.append("user_id = ?")
+        params.append(user_id)
+    return (f"WHERE {' AND '.join(filters)}" if filters else ""), params
+
+
+def fetch_logs(
+    limit: int = 200,
+    *,
+    action: Optional[str] = None,
+    user_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    where, params = _log_filters(action, user_id)
+    flush_audit_log()
+    # Timestamps are ISO-8601 strings, so ordering the raw column is chronological
+    # and lets SQLite walk idx_logs_timestamp (or the action/user composites).
     with get_connection() as conn:
         rows = conn.execute(
-            "SELECT * FROM logs ORDER BY datetime(timestamp) DESC LIMIT ?",
-            (limit,),
+            f"SELECT * FROM logs {where} ORDER BY timestamp DESC, log_id DESC LIMIT ?",
+            [*params, limit],
         ).fetchall()
     return [dict(row) for row in rows]
 
 
+def fetch_logs_frame(
+    limit: int = 200,
+    *,
+    columns: Sequence[str] = LOG_COLUMNS,
+    action: Optional[str] = None,
+    user_id: Optional[int] = None,
+    as_arrow: bool = False,
+) -> Any:
+    """Columnar ``fetch_logs``: the newest ``limit`` entries as a DataFrame (or pyarrow Table)."""
+    unknown = set(columns) - set(LOG_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown log column(s): {', '.join(sorted(unknown))}")
+    where, params = _log_filters(action, user_id)
+    flush_audit_log()
+    with get_connection() as conn:
+        data = _read_columns(
+            conn,
+            f"SELECT {', '.join(columns)} FROM logs {where} ORDER BY timestamp DESC, log_id DESC LIMIT ?",
+            [*params, limit],
+            columns,
+        )
+    return _to_frame(data, as_arrow)
+
+
 def fetch_log_counts_by_day(days: int = 14) -> List[Dict[str, Any]]:
+    since = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+    flush_audit_log()
     with get_connection() as conn:
         rows = conn.execute(
             """
-            SELECT substr(timestamp, 1, 10) AS day, COUNT(*) AS total
-              FROM logs
-             WHERE timestamp >= datetime('now', ?)
+            SELECT day, SUM(total) AS total
+              FROM log_rollups
+             WHERE day >= ?
              GROUP BY day
              ORDER BY day
             """,
-            (f"-{days} days",),
+            (since,),
         ).fetchall()
     return [dict(row) for row in rows]
 
 
+def fetch_activity_rollups() -> Dict[str, Any]:
+    """Pre-aggregated activity over the full audit history for the analytics tabs."""
+    flush_audit_log()
+    with get_connection() as conn:
+        role_action = [
+            dict(row)
+            for row in conn.execute(
+                "SELECT role, action, SUM(total) AS total FROM log_rollups GROUP BY role, action"
+            )
+        ]
+        by_hour = [
+            dict(row)
+            for row in conn.execute(
+                "SELECT hour, SUM(total) AS total FROM log_rollups GROUP BY hour ORDER BY hour"
+            )
+        ]
+        active_days = conn.execute("SELECT COUNT(DISTINCT day) FROM log_rollups").fetchone()[0]
+        active_users = conn.execute("SELECT COUNT(*) FROM log_user_rollups").fetchone()[0]
+    by_action: Counter = Counter()
+    by_role: Counter = Counter()
+    for row in role_action:
+        by_action[row["action"]] += row["total"]
+        by_role[row["role"]] += row["total"]
+    return {
+        "total_events": sum(by_action.values()),
+        "active_users": int(active_users),
+        "active_days": int(active_days),
+        "by_action": dict(by_action.most_common()),
+        "by_role": dict(by_role.most_common()),
+        "by_role_action": role_action,
+        "by_hour": by_hour,
+    }
+
+
+def _retention_cutoff(retention_days: int) -> str:
+    return (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+
+
+def count_expired_patients(retention_days: int = RETENTION_DAYS) -> int:
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM patients WHERE anonymized_at IS NULL AND date_added < ?",
+            (_retention_cutoff(retention_days),),
+        ).fetchone()
+        return int(row[0])
+
+
+def fetch_expired_patients(
+    retention_days: int = RETENTION_DAYS,
+    *,
+    page_size: int = 50,
+    after: Optional[PatientCursor] = None,
+) -> List[Dict[str, Any]]:
+    """Oldest-first page of records past retention that have not been processed yet."""
+    params: List[Any] = [_retention_cutoff(retention_days)]
+    keyset = ""
+    if after is not None:
+        keyset = "AND (date_added, patient_id) > (?, ?)"
+        params.extend(after)
+    params.append(page_size)
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT * FROM patients
+             WHERE anonymized_at IS NULL AND date_added < ? {keyset}
+             ORDER BY date_added, patient_id
+             LIMIT ?
+            """,
+            params,
+        ).fetchall()
+    return _patient_records(rows, include_sensitive=False)
+
+
+def purge_expired_patients(
+    retention_days: int = RETENTION_DAYS,
+    *,
+    mode: str = RETENTION_MODE,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+    pause: float = 0.05,
+    user_id: Optional[int] = None,
+    role: str = "system",
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Anonymize or erase expired records, ``batch_size`` rows per short transaction.
+
+    Every batch is audited. ``pause`` seconds between batches gives interactive
+    writers a chance at the lock. Anonymized records get masks derived from the
+    redacted values and the current MASK_RULES_VERSION, so a later
+    refresh_anonymized_fields reproduces them. ``progress(processed)`` is called
+    after every batch. Returns the number of records processed.
+    """
+    if mode not in ("anonymize", "erase"):
+        raise ValueError(f"Unknown retention mode {mode!r}; expected 'anonymize' or 'erase'")
+    cutoff = _retention_cutoff(retention_days)
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with get_connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT patient_id, anonymized_diagnosis FROM patients
+                 WHERE anonymized_at IS NULL AND date_added < ?
+                 ORDER BY date_added, patient_id
+                 LIMIT ?
+                """,
+                (cutoff, max(batch_size, 1)),
+            ).fetchall()
+            if not rows:
+                break
+            ids = [row["patient_id"] for row in rows]
+            if mode == "erase":
+                conn.executemany("DELETE FROM patients WHERE patient_id = ?", [(pid,) for pid in ids])
+            else:
+                now = datetime.utcnow().isoformat()
+                redacted = encrypt_value("[redacted]")
+                updates = []
+                for row in rows:
+                    diagnosis = row["anonymized_diagnosis"] or "REDACTED"
+                    updates.append(
+                        (
+                            redacted,
+                            redacted,
+                            encrypt_value(diagnosis),
+                            mask_name(row["patient_id"]),
+                            mask_contact("[redacted]"),
+                            mask_text(diagnosis),
+                            MASK_RULES_VERSION,
+                            now,
+                            row["patient_id"],
+                        )
+                    )
+                conn.executemany(
+                    """
+                    UPDATE patients
+                       SET name = ?,
+                           contact = ?,
+                           diagnosis = ?,
+                           name_bidx = NULL,
+                           contact_bidx = NULL,
+                           anonymized_name = ?,
+                           anonymized_contact = ?,
+                           anonymized_diagnosis = ?,
+                           mask_version = ?,
+                           anonymized_at = ?
+                     WHERE patient_id = ? AND anonymized_at IS NULL
+                    """,
+                    updates,
+                )
+            conn.commit()
+        log_action(
+            user_id,
+            role,
+            f"retention_{mode}",
+            f"{len(ids)} record(s) older than {retention_days} days, patient_id {ids[0]}-{ids[-1]}",
+        )
+        processed += len(ids)
+        batches += 1
+        if progress is not None:
+            progress(processed)
+        if pause:
+            time.sleep(pause)
+    return processed
+
+
+_retention_thread: Optional[threading.Thread] = None
+_retention_lock = threading.Lock()
+# State of the retention pass in progress or last finished, whether started by
+# start_retention_job or run_retention_now. Guarded by _retention_lock; the
+# shared "running" flag keeps the two from purging the same rows at once.
+_retention_run: Dict[str, Any] = {"running": False, "processed": 0, "error": None, "finished_at": None}
+
+
+def _claim_retention_run() -> bool:
+    with _retention_lock:
+        if _retention_run["running"]:
+            return False
+        _retention_run.update(running=True, processed=0, error=None, finished_at=None)
+        return True
+
+
+def _retention_pass(retention_days: int, mode: str, user_id: Optional[int], role: str, label: str) -> None:
+    """Run one purge after _claim_retention_run() succeeded, then release the claim."""
+
+    def report(processed: int) -> None:
+        with _retention_lock:
+            _retention_run["processed"] = processed
+
+    error = None
+    try:
+        purge_expired_patients(retention_days, mode=mode, user_id=user_id, role=role, progress=report)
+    except Exception as exc:
+        error = str(exc)
+        print(f"{label}: run failed: {exc}", file=sys.stderr)
+    finally:
+        with _retention_lock:
+            _retention_run.update(running=False, error=error, finished_at=datetime.utcnow().isoformat())
+
+
+def start_retention_job(
+    interval: float,
+    retention_days: int = RETENTION_DAYS,
+    mode: str = RETENTION_MODE,
+) -> None:
+    """Run purge_expired_patients every ``interval`` seconds on a daemon thread (once per process).
+
+    A tick is skipped while a run_retention_now pass is still going.
+    """
+    global _retention_thread
+    if interval <= 0:
+        return
+
+    def run() -> None:
+        while True:
+            if _claim_retention_run():
+                _retention_pass(retention_days, mode, None, "system", "retention-job")
+            time.sleep(interval)
+
+    with _retention_lock:
+        if _retention_thread is not None and _retention_thread.is_alive():
+            return
+        _retention_thread = threading.Thread(target=run, name="retention-job", daemon=True)
+        _retention_thread.start()
+
+
+def run_retention_now(
+    retention_days: int = RETENTION_DAYS,
+    mode: str = RETENTION_MODE,
+    *,
+    user_id: Optional[int] = None,
+    role: str = "system",
+) -> bool:
+    """Start one retention pass on a background thread; False if one is already running.
+
+    That includes the scheduled pass of start_retention_job. Follow it with
+    retention_run_status() instead of blocking the caller (a dashboard rerun)
+    for the whole purge.
+    """
+    if not _claim_retention_run():
+        return False
+    threading.Thread(
+        target=_retention_pass,
+        args=(retention_days, mode, user_id, role, "retention-run"),
+        name="retention-run",
+        daemon=True,
+    ).start()
+    return True
+
+
+def retention_run_status() -> Dict[str, Any]:
+    with _retention_lock:
+        return dict(_retention_run)
+
+
+def change_version(name: str = "patients") -> int:
+    """Counter bumped by triggers on every committed write to ``name``, from any connection or process.
+
+    Cheap enough to read on every rerun; caches keyed on it stay valid until
+    the data actually changes. (PRAGMA data_version would miss writes made on
+    the same pooled connection.)
+    """
+    with get_connection() as conn:
+        row = conn.execute("SELECT version FROM change_versions WHERE name = ?", (name,)).fetchone()
+    return int(row[0]) if row else 0
+
+
 def patient_count() -> int:
     with get_connection() as conn:
         row = conn.execute("SELECT COUNT(*) AS total FROM patients").fetchone()
         return int(row["total"]) if row else 0
+
+
+def sql_profile_report(explain: int = SQL_PROFILE_EXPLAIN) -> Dict[str, Any]:
+    """Per-statement timings gathered since start-up (or the last reset) when SQL_PROFILE is on."""
+    with get_connection() as conn:
+        return sql_profiler.report(conn, explain)
@@ -1,9 +1,416 @@
 from __future__ import annotations
 
 import argparse
+import csv
+import getpass
+import random
+import secrets
+import time
+from datetime import date, timedelta
+from itertools import accumulate, islice
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
-from database import DB_PATH, init_db
+from archive import (
+    ArchiveError,
+    archive_logs,
+    count_archivable_logs,
+    iter_archived_entries,
+    iter_archived_logs,
+    list_segments,
+)
+from audit_chain import chain_status, verify_audit_chain
+from backup import BackupError, create_backup, list_backups, restore_backup, verify_backup
+from config import (
+    AUDIT_ARCHIVE_BATCH_SIZE,
+    AUDIT_ARCHIVE_DIR,
+    AUDIT_HOT_DAYS,
+    AUDIT_VERIFY_BATCH_SIZE,
+    BACKUP_DIR,
+    BACKUP_KEEP,
+    EXPORT_CHUNK_SIZE,
+    IMPORT_BATCH_SIZE,
+    RETENTION_BATCH_SIZE,
+    RETENTION_DAYS,
+    RETENTION_MODE,
+    ROTATION_BATCH_SIZE,
+    MissingKeyError,
+)
+from database import (
+    DB_PATH,
+    ROLES,
+    bulk_patient_load,
+    clear_import_progress,
+    count_expired_patients,
+    create_user,
+    disable_user,
+    enable_user,
+    get_import_progress,
+    get_connection,
+    get_rotation_progress,
+    init_db,
+    insert_logs_many,
+    insert_patients_many,
+    iter_patient_csv,
+    key_usage,
+    purge_expired_patients,
+    rebuild_log_rollups,
+    replay_audit_dead_letter,
+    rotate_patient_keys,
+    set_role,
+)
+from security import hash_password, primary_key_id
+
+IMPORT_COLUMNS = ("name", "contact", "diagnosis")
+
+FIRST_NAMES = (
+    "Fatima", "Ali", "Ayesha", "Hassan", "Zainab", "Omar", "Sara", "Bilal", "Hina", "Usman",
+    "Maryam", "Imran", "Sana", "Hamza", "Noor", "Kamran", "Amna", "Faisal", "Rabia", "Tariq",
+)
+LAST_NAMES = (
+    "Khan", "Ahmed", "Malik", "Hussain", "Raza", "Siddiqui", "Qureshi", "Sheikh", "Butt", "Iqbal",
+    "Chaudhry", "Mirza", "Aslam", "Javed", "Farooq", "Rehman", "Akhtar", "Baig", "Nawaz", "Zaidi",
+)
+DIAGNOSES = (
+    "Hypertension", "Type 2 Diabetes", "Asthma", "Migraine", "Influenza", "Iron-deficiency anemia",
+    "Osteoarthritis", "Gastritis", "Hypothyroidism", "Urinary tract infection", "Dengue fever",
+    "Chronic kidney disease", "Seasonal allergies", "Lower back pain", "Major depressive disorder",
+)
+# Relative load per hour of day (UTC) and per weekday (Mon..Sun): a clinic that is busiest late morning.
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 2, 4, 8, 14, 18, 20, 19, 15, 16, 17, 15, 12, 9, 6, 4, 3, 2, 2, 1)
+WEEKDAY_WEIGHTS = (10, 10, 10, 10, 9, 5, 3)
+SYNTH_STAFF = {"admin": 2, "doctor": 12, "receptionist": 6}
+ROLE_ACTIONS: Dict[str, Tuple[Tuple[str, int], ...]] = {
+    "admin": (("login", 20), ("view_logs", 25), ("export", 5), ("reanonymize", 1), ("delete_patient", 2), ("logout", 15)),
+    "doctor": (("login", 20), ("find_patient", 45), ("update_patient", 30), ("logout", 15)),
+    "receptionist": (("login", 20), ("find_patient", 30), ("add_patient", 35), ("update_patient", 10), ("logout", 15)),
+}
+FAILED_LOGIN_RATE = 0.02
+
+
+def read_patient_csv(path: Path) -> Iterator[Tuple[str, str, str]]:
+    with path.open(newline="", encoding="utf-8") as handle:
+        reader = csv.DictReader(handle)
+        missing = [column for column in IMPORT_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise SystemExit(f"{path}: missing column(s): {', '.join(missing)}")
+        for record in reader:
+            values = tuple((record.get(column) or "").strip() for column in IMPORT_COLUMNS)
+            if not all(values):
+                raise SystemExit(f"{path}:{reader.line_num}: name, contact and diagnosis are required")
+            yield values
+
+
+def import_patients(path: Path, batch_size: int, restart: bool) -> None:
+    init_db(seed=False)
+    source = str(path.resolve())
+    if restart:
+        clear_import_progress(source)
+    done = get_import_progress(source)
+    if done:
+        print(f"Resuming {path.name}: {done} row(s) already imported.")
+
+    rows = islice(read_patient_csv(path), done, None)
+    total = done
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        total += insert_patients_many(batch, batch_size=batch_size, source=source)
+        print(f"Imported {total} row(s)...", end="\r", flush=True)
+    print(f"Import complete: {total} row(s) from {path.name}.")
+
+
+def export_patients(path: Path, anonymized_only: bool, chunk_size: int) -> None:
+    init_db(seed=False)
+    with path.open("wb") as handle:
+        for chunk in iter_patient_csv(
+            include_sensitive=not anonymized_only,
+            chunk_size=chunk_size,
+            compress=path.suffix == ".gz",
+        ):
+            handle.write(chunk)
+    print(f"Patient export written to {path.resolve()}")
+
+
+def _spread(total: int, weights: Sequence[float]) -> List[int]:
+    """Split ``total`` into integer shares proportional to ``weights`` (largest remainder)."""
+    scale = sum(weights)
+    exact = [total * weight / scale for weight in weights]
+    shares = [int(value) for value in exact]
+    by_remainder = sorted(range(len(weights)), key=lambda index: exact[index] - shares[index], reverse=True)
+    for index in by_remainder[: total - sum(shares)]:
+        shares[index] += 1
+    return shares
+
+
+def synthetic_days(rng: random.Random, total: int, days: int, until: date) -> Iterator[List[str]]:
+    """Yield one sorted list of ISO timestamps per day for the ``days`` days before ``until``,
+    ``total`` in all, shaped by WEEKDAY_WEIGHTS and HOUR_WEIGHTS."""
+    first = until - timedelta(days=max(days, 1))
+    calendar = [first + timedelta(days=offset) for offset in range(max(days, 1))]
+    hours = range(24)
+    hour_weights = list(accumulate(HOUR_WEIGHTS))
+    random_ = rng.random
+    for day, count in zip(calendar, _spread(total, [WEEKDAY_WEIGHTS[day.weekday()] for day in calendar])):
+        if not count:
+            continue
+        stamps = sorted(
+            hour * 3_600_000_000 + int(random_() * 3_600_000_000)
+            for hour in rng.choices(hours, cum_weights=hour_weights, k=count)
+        )
+        # Formatting by hand is several times faster than datetime arithmetic at millions of rows.
+        prefix = day.isoformat()
+        formatted = []
+        for stamp in stamps:
+            seconds, micros = divmod(stamp, 1_000_000)
+            minutes, second = divmod(seconds, 60)
+            hour, minute = divmod(minutes, 60)
+            formatted.append(f"{prefix}T{hour:02d}:{minute:02d}:{second:02d}.{micros:06d}")
+        yield formatted
+
+
+def synthetic_patients(
+    rng: random.Random,
+    count: int,
+    days: int = 365,
+    until: Optional[date] = None,
+) -> Iterator[Tuple[str, str, str, str]]:
+    """Yield (name, contact, diagnosis, date_added) rows in admission order."""
+    for stamps in synthetic_days(rng, count, days, until or date.today()):
+        for added in stamps:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            contact = f"+92-3{rng.randrange(50):02d}-{rng.randrange(10_000_000):07d}"
+            yield name, contact, rng.choice(DIAGNOSES), added
+
+
+LOG_DETAILS = {
+    "add_patient": "Created new patient record",
+    "login": "Successful authentication",
+    "logout": "User initiated logout",
+    "export": "Downloaded patient backup",
+    "reanonymize": "Refreshed anonymized fields",
+    "view_logs": "Admin reviewed audit trail",
+}
+
+
+def synthetic_logs(
+    rng: random.Random,
+    count: int,
+    staff: Sequence[Tuple[int, str, str]],
+    days: int = 30,
+    until: Optional[date] = None,
+    max_patient_id: int = 1,
+) -> Iterator[Tuple[Optional[int], str, str, str, str]]:
+    """Yield audit rows (user_id, role, action, timestamp, details) for ``staff`` (user_id, username, role)."""
+    actions = {role: [action for action, _ in choices] for role, choices in ROLE_ACTIONS.items()}
+    weights = {role: list(accumulate(weight for _, weight in choices)) for role, choices in ROLE_ACTIONS.items()}
+    random_ = rng.random
+    patients = max(max_patient_id, 1)
+    for stamps in synthetic_days(rng, count, days, until or date.today()):
+        # Draw a whole day's users and per-role actions at once; per-row choices() calls dominate otherwise.
+        people = rng.choices(staff, k=len(stamps))
+        picks = {role: rng.choices(actions[role], cum_weights=weights[role], k=len(stamps)) for role in actions}
+        for index, (timestamp, (user_id, username, role)) in enumerate(zip(stamps, people)):
+            if random_() < FAILED_LOGIN_RATE:
+                yield None, "unauthorized", "login_failed", timestamp, f"username={username}"
+                continue
+            action = picks[role][index]
+            if action in ("update_patient", "delete_patient"):
+                details = f"patient_id={int(random_() * patients) + 1}"
+            elif action == "find_patient":
+                details = f"matches={int(random_() * 4)}"
+            else:
+                details = LOG_DETAILS[action]
+            yield user_id, role, action, timestamp, details
+
+
+def ensure_synthetic_staff() -> List[Tuple[int, str, str]]:
+    """Create the SYNTH_STAFF accounts (with unusable passwords) and return (user_id, username, role)."""
+    with get_connection() as conn:
+        for role, count in SYNTH_STAFF.items():
+            for number in range(1, count + 1):
+                conn.execute(
+                    "INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, ?)",
+                    (f"synth_{role}_{number:02d}", hash_password(secrets.token_hex(16)), role),
+                )
+        conn.commit()
+        rows = conn.execute(
+            "SELECT user_id, username, role FROM users WHERE username LIKE 'synth\\_%' ESCAPE '\\' ORDER BY user_id"
+        ).fetchall()
+    return [(row["user_id"], row["username"], row["role"]) for row in rows]
+
+
+def synthesize(
+    patients: int,
+    logs: int,
+    days: int,
+    seed: int,
+    batch_size: int,
+    until: Optional[date] = None,
+    workers: Optional[int] = None,
+) -> None:
+    init_db(seed=False)
+    rng = random.Random(seed)
+    until = until or date.today()
+    started = time.perf_counter()
+    # One transaction with the patients indexes and triggers rebuilt once at the end.
+    with bulk_patient_load():
+        inserted = insert_patients_many(
+            synthetic_patients(rng, patients, days, until),
+            batch_size=batch_size,
+            workers=workers,
+        )
+    print(f"Inserted {inserted:,} patient(s) in {time.perf_counter() - started:.1f}s.")
+
+    started = time.perf_counter()
+    with get_connection() as conn:
+        max_patient_id = int(conn.execute("SELECT COALESCE(MAX(patient_id), 0) FROM patients").fetchone()[0])
+    staff = ensure_synthetic_staff()
+    written = insert_logs_many(
+        synthetic_logs(rng, logs, staff, days, until, max_patient_id),
+        batch_size=batch_size * 10,
+    )
+    print(f"Inserted {written:,} audit log row(s) in {time.perf_counter() - started:.1f}s.")
+
+
+def rotate_keys(batch_size: int, workers: Optional[int], restart: bool, status: bool) -> None:
+    init_db(seed=False)
+    target = primary_key_id()
+    if status:
+        state = get_rotation_progress(target)
+        usage = ", ".join(f"{key_id}: {count}" for key_id, count in sorted(key_usage().items())) or "none"
+        print(f"Primary key: {target}. Ciphertexts per key: {usage}.")
+        if state:
+            finished = f"completed {state['completed_at']}" if state["completed_at"] else "in progress"
+            print(f"Rotation to {target}: {state['rows_done']} row(s) re-encrypted, {finished}.")
+        return
+    state = None if restart else get_rotation_progress(target)
+    if state and state["last_patient_id"] and not state["completed_at"]:
+        print(f"Resuming rotation to {target} after patient {state['last_patient_id']}.")
+
+    def report(done: int, total: int) -> None:
+        print(f"Re-encrypted {done}/{total} row(s)...", end="\r", flush=True)
+
+    started = time.perf_counter()
+    rotated = rotate_patient_keys(batch_size=batch_size, workers=workers, restart=restart, progress=report)
+    print(f"Rotation to {target} complete: {rotated} row(s) re-encrypted in {time.perf_counter() - started:.1f}s.")
+
+
+def run_backup(args: argparse.Namespace) -> None:
+    if args.list:
+        backups = list_backups(args.dir)
+        if not backups:
+            print(f"No backups in {args.dir.resolve()}.")
+        for manifest in backups:
+            print(
+                f"{manifest['file']}  {manifest['size_bytes'] / 1_000_000:.1f} MB "
+                f"-> {manifest['compressed_bytes'] / 1_000_000:.1f} MB gz, {manifest['duration_s']:.2f}s"
+            )
+        return
+    if args.verify is not None:
+        manifest = verify_backup(args.verify or None, args.dir)
+        print(f"{manifest['file']}: checksum and integrity check OK.")
+        return
+    init_db(seed=False)
+    manifest = create_backup(args.dir, keep=max(args.keep, 1))
+    print(
+        f"Backup written to {manifest['path']}: {manifest['size_bytes'] / 1_000_000:.1f} MB "
+        f"({manifest['compressed_bytes'] / 1_000_000:.1f} MB compressed) in {manifest['duration_s']:.2f}s, "
+        f"{manifest['throughput_mb_s']:.1f} MB/s, {manifest['steps']} step(s), {manifest['restarts']} restart(s)."
+    )
+    for name in manifest["pruned"]:
+        print(f"Removed old backup {name}.")
+
+
+def run_restore(args: argparse.Namespace) -> None:
+    if not args.yes:
+        answer = input(f"Replace the contents of {Path(DB_PATH).resolve()} with a backup? [y/N] ")
+        if answer.strip().lower() not in ("y", "yes"):
+            print("Restore cancelled.")
+            return
+
+    def report(done: int, total: int) -> None:
+        print(f"Restored {done}/{total} page(s)...", end="\r", flush=True)
+
+    manifest = restore_backup(args.name, args.dir, progress=report)
+    print(f"Restored {manifest['file']} (taken {manifest['created_at']}) into {Path(DB_PATH).resolve()}.")
+
+
+def run_archive(args: argparse.Namespace) -> None:
+    init_db(seed=False)
+    if args.status:
+        segments = list_segments()
+        if not segments:
+            print("No archived audit entries.")
+        for segment in segments:
+            print(
+                f"{segment['month']}  {segment['rows']:>9,} entries  {segment['bytes'] / 1000:>9,.0f} kB  "
+                f"{segment['first_timestamp'][:10]} .. {segment['last_timestamp'][:10]}  {segment['file']}"
+            )
+        return
+    due = count_archivable_logs(args.days)
+    if args.dry_run:
+        print(f"{due} audit entr(ies) older than {args.days} days are due for archiving.")
+        return
+
+    def report(done: int) -> None:
+        print(f"Archived {done}/{due} entr(ies)...", end="\r", flush=True)
+
+    started = time.perf_counter()
+    archived = archive_logs(args.days, batch_size=max(args.batch_size, 1), progress=report)
+    print(f"Archived {archived} audit entr(ies) older than {args.days} days in {time.perf_counter() - started:.1f}s.")
+
+
+def verify_logs(args: argparse.Namespace) -> None:
+    init_db(seed=False)
+    if args.status:
+        status = chain_status()
+        checkpoint = status["checkpoint"]
+        print(f"Chain: entries #{status['genesis_log_id']} to #{status['last_log_id']}, head {status['last_hash']}")
+        if checkpoint is None:
+            print("No checkpoint yet; the next verification checks the whole chain.")
+        else:
+            print(
+                f"Checkpoint {status['checkpoints']}: entry #{checkpoint['log_id']} at {checkpoint['created_at'][:19]}, "
+                f"signature {checkpoint['signature']}"
+            )
+        print(f"{status['pending']} entr(ies) written since the last checkpoint.")
+        return
+    report = verify_audit_chain(
+        full=args.full,
+        archived=iter_archived_entries(args.dir) if args.full else (),
+        batch_size=max(args.batch_size, 1),
+        # An explicit run always signs a checkpoint, e.g. to record its signature elsewhere.
+        min_entries=1,
+    )
+    if not report["ok"]:
+        raise SystemExit(f"Audit chain broken: {report['error']}")
+    checkpoint = report["checkpoint"]
+    print(
+        f"Audit chain intact: {report['checked']} entr(ies) verified in {report['duration_s']:.2f}s"
+        + (f", checkpoint at entry #{checkpoint['log_id']}." if checkpoint else ".")
+    )
+
+
+def manage_user(args: argparse.Namespace) -> None:
+    init_db(seed=False)
+    try:
+        if args.user_command == "add":
+            password = args.password or getpass.getpass(f"Password for {args.username}: ")
+            user_id = create_user(args.username, password, args.role)
+            print(f"Created {args.role} account {args.username!r} (user_id={user_id}).")
+        elif args.user_command == "role":
+            set_role(args.username, args.role)
+            print(f"{args.username!r} is now {args.role}.")
+        elif args.user_command == "disable":
+            disable_user(args.username)
+            print(f"Disabled {args.username!r}.")
+        elif args.user_command == "enable":
+            enable_user(args.username)
+            print(f"Enabled {args.username!r}.")
+    except KeyError:
+        raise SystemExit(f"No such user: {args.username!r}")
 
 
 def main() -> None:
@@ -13,12 +420,221 @@ def main() -> None:
         action="store_true",
         help="Delete the existing database file before re-initializing.",
     )
+    subcommands = parser.add_subparsers(dest="command")
+
+    import_parser = subcommands.add_parser(
+        "import",
+        help="Bulk-import patients from a CSV file with name, contact and diagnosis columns.",
+    )
+    import_parser.add_argument("file", type=Path, help="CSV file to import.")
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=IMPORT_BATCH_SIZE,
+        help="Rows encrypted and committed per transaction.",
+    )
+    import_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore any saved checkpoint and import the file from the first row.",
+    )
+
+    export_parser = subcommands.add_parser(
+        "export",
+        help="Stream the patient registry to CSV (gzip-compressed when the file ends in .gz).",
+    )
+    export_parser.add_argument("file", type=Path, help="Destination .csv or .csv.gz file.")
+    export_parser.add_argument(
+        "--anonymized-only",
+        action="store_true",
+        help="Leave out the decrypted name, contact and diagnosis columns.",
+    )
+    export_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=EXPORT_CHUNK_SIZE,
+        help="Rows decrypted and written per chunk.",
+    )
+
+    user_parser = subcommands.add_parser("user", help="Manage dashboard accounts.")
+    user_commands = user_parser.add_subparsers(dest="user_command", required=True)
+    add_parser = user_commands.add_parser("add", help="Create an account.")
+    add_parser.add_argument("username")
+    add_parser.add_argument("--role", choices=ROLES, required=True)
+    add_parser.add_argument("--password", help="Prompted for when omitted.")
+    role_parser = user_commands.add_parser("role", help="Change an account's role.")
+    role_parser.add_argument("username")
+    role_parser.add_argument("role", choices=ROLES)
+    for name, help_text in (("disable", "Block an account from signing in."), ("enable", "Re-enable an account.")):
+        user_commands.add_parser(name, help=help_text).add_argument("username")
+
+    retention_parser = subcommands.add_parser(
+        "retention",
+        help="Anonymize or erase records past the retention period in small batches (cron-friendly).",
+    )
+    retention_parser.add_argument("--days", type=int, default=RETENTION_DAYS)
+    retention_parser.add_argument("--mode", choices=["anonymize", "erase"], default=RETENTION_MODE)
+    retention_parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    retention_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report how many records are due.",
+    )
+
+    synth_parser = subcommands.add_parser(
+        "synth",
+        help="Generate deterministic synthetic patients and audit history for load testing.",
+    )
+    synth_parser.add_argument("--patients", type=int, default=10_000)
+    synth_parser.add_argument("--logs", type=int, default=100_000)
+    synth_parser.add_argument("--days", type=int, default=90, help="Spread records over this many days.")
+    synth_parser.add_argument("--seed", type=int, default=0, help="Same seed and dates give the same data.")
+    synth_parser.add_argument(
+        "--until",
+        type=date.fromisoformat,
+        help="Last day (exclusive) of the generated history, YYYY-MM-DD (default: today).",
+    )
+    synth_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=IMPORT_BATCH_SIZE,
+        help="Patients encrypted per batch (audit rows are committed ten times this many at a time).",
+    )
+    synth_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes for encryption (default: DECRYPT_WORKERS).",
+    )
+
+    rotate_parser = subcommands.add_parser(
+        "rotate-keys",
+        help="Re-encrypt patient data under the primary FERNET_KEYS key; resumable and safe while the app runs.",
+    )
+    rotate_parser.add_argument("--batch-size", type=int, default=ROTATION_BATCH_SIZE)
+    rotate_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes for re-encryption (default: DECRYPT_WORKERS).",
+    )
+    rotate_parser.add_argument("--restart", action="store_true", help="Ignore saved progress and walk every row.")
+    rotate_parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Only report ciphertexts per key and rotation progress.",
+    )
+
+    backup_parser = subcommands.add_parser(
+        "backup",
+        help="Take a compressed, checksummed online snapshot while the app keeps running (cron-friendly).",
+    )
+    backup_parser.add_argument("--dir", type=Path, default=BACKUP_DIR)
+    backup_parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="Newest snapshots to keep.")
+    backup_parser.add_argument("--list", action="store_true", help="List snapshots, newest first.")
+    backup_parser.add_argument(
+        "--verify",
+        nargs="?",
+        const="",
+        metavar="NAME",
+        help="Check a snapshot's checksum and integrity (default: the newest).",
+    )
+
+    restore_parser = subcommands.add_parser(
+        "restore",
+        help="Verify a snapshot and copy it over the live database.",
+    )
+    restore_parser.add_argument("name", nargs="?", help="Snapshot file name (default: the newest).")
+    restore_parser.add_argument("--dir", type=Path, default=BACKUP_DIR)
+    restore_parser.add_argument("--yes", action="store_true", help="Do not ask for confirmation.")
+
+    archive_parser = subcommands.add_parser(
+        "archive-logs",
+        help="Move old audit entries into compressed monthly archive segments (cron-friendly).",
+    )
+    archive_parser.add_argument("--days", type=int, default=AUDIT_HOT_DAYS, help="Entries newer than this stay in the table.")
+    archive_parser.add_argument("--batch-size", type=int, default=AUDIT_ARCHIVE_BATCH_SIZE)
+    archive_parser.add_argument("--dry-run", action="store_true", help="Only report how many entries are due.")
+    archive_parser.add_argument("--status", action="store_true", help="List the archived months.")
+
+    subcommands.add_parser(
+        "audit-replay",
+        help="Re-insert audit events the background writer could not commit (AUDIT_DEAD_LETTER).",
+    )
+
+    verify_parser = subcommands.add_parser(
+        "verify-logs",
+        help="Verify the audit log hash chain from the last signed checkpoint (cron-friendly).",
+    )
+    verify_parser.add_argument("--full", action="store_true", help="Re-hash the whole history, archive included.")
+    verify_parser.add_argument("--dir", type=Path, default=AUDIT_ARCHIVE_DIR, help="Audit archive directory (with --full).")
+    verify_parser.add_argument("--batch-size", type=int, default=AUDIT_VERIFY_BATCH_SIZE)
+    verify_parser.add_argument("--status", action="store_true", help="Show the chain head and newest checkpoint.")
+
+    subcommands.add_parser(
+        "backfill-rollups",
+        help="Rebuild the audit activity rollups from the full logs table.",
+    )
     args = parser.parse_args()
 
     if args.reset and DB_PATH.exists():
         DB_PATH.unlink()
         print("Existing database removed.")
 
+    if args.command == "import":
+        import_patients(args.file, max(args.batch_size, 1), args.restart)
+        return
+    if args.command == "export":
+        export_patients(args.file, args.anonymized_only, max(args.chunk_size, 1))
+        return
+
+    if args.command == "user":
+        manage_user(args)
+        return
+    if args.command == "retention":
+        init_db(seed=False)
+        due = count_expired_patients(args.days)
+        if args.dry_run:
+            print(f"{due} record(s) older than {args.days} days are due for retention.")
+            return
+        processed = purge_expired_patients(args.days, mode=args.mode, batch_size=max(args.batch_size, 1))
+        print(f"Retention ({args.mode}) processed {processed} of {due} due record(s).")
+        return
+    if args.command == "synth":
+        synthesize(args.patients, args.logs, args.days, args.seed, max(args.batch_size, 1), args.until, args.workers)
+        return
+    if args.command == "rotate-keys":
+        rotate_keys(max(args.batch_size, 1), args.workers, args.restart, args.status)
+        return
+    if args.command in ("backup", "restore"):
+        try:
+            if args.command == "backup":
+                run_backup(args)
+            else:
+                run_restore(args)
+        except BackupError as exc:
+            raise SystemExit(str(exc)) from None
+        return
+    if args.command == "archive-logs":
+        try:
+            run_archive(args)
+        except (ArchiveError, MissingKeyError) as exc:
+            raise SystemExit(str(exc)) from None
+        return
+    if args.command == "audit-replay":
+        init_db(seed=False)
+        print(f"Re-inserted {replay_audit_dead_letter()} audit event(s).")
+        return
+    if args.command == "verify-logs":
+        try:
+            verify_logs(args)
+        except MissingKeyError as exc:
+            raise SystemExit(str(exc)) from None
+        return
+    if args.command == "backfill-rollups":
+        init_db(seed=False)
+        rebuild_log_rollups(iter_archived_logs())
+        print("Audit activity rollups rebuilt.")
+        return
+
     init_db(seed=True)
     print(f"Database ready at {Path(DB_PATH).resolve()}")
 
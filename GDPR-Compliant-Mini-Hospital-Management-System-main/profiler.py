@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import SQL_PROFILE_EXPLAIN
+
+_STRING_LITERAL = re.compile(r"[xX]?'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+# Only NULLs in value position (where a None parameter was expanded), not IS NULL / NOT NULL.
+_NULL_LITERAL = re.compile(r"([=(,<>]\s*)NULL\b", re.IGNORECASE)
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def _normalize(sql: str) -> str:
+    """Collapse literals and whitespace so a statement and its traced, parameter-expanded
+    form (as passed to ``set_trace_callback``) share one key."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _NULL_LITERAL.sub(r"\1?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?, ...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip().rstrip(";")
+
+
+# Only placeholder statements are cached: traced statements carry their (encrypted)
+# parameter values, which are unique per call and should not linger in memory.
+normalize_sql = lru_cache(maxsize=1024)(_normalize)
+
+
+class StatementStats:
+    __slots__ = ("traced", "calls", "timed", "total", "max", "rows", "sql", "params")
+
+    def __init__(self) -> None:
+        self.traced = 0
+        self.calls = 0
+        self.timed = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.sql: Optional[str] = None
+        self.params: Any = ()
+
+
+class SQLProfiler:
+    """Per-statement counters fed by profiled connections.
+
+    The cursor wrappers count application statements (every parameter set of
+    an executemany) and add their wall time, execute plus fetch, and the rows
+    returned. The trace callback sees everything SQLite runs on the
+    connection, which is how statements the wrappers never see, such as the
+    implicit BEGIN, show up; its counts are only used for those, because
+    SQLite re-traces a statement for each trigger it fires.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats: Dict[str, StatementStats] = {}
+        self.started_at = datetime.utcnow()
+
+    def _entry(self, key: str) -> StatementStats:
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats.setdefault(key, StatementStats())
+        return entry
+
+    @property
+    def paused(self) -> bool:
+        return getattr(self._local, "paused", False)
+
+    @contextmanager
+    def pause(self) -> Iterator[None]:
+        previous = self.paused
+        self._local.paused = True
+        try:
+            yield
+        finally:
+            self._local.paused = previous
+
+    def trace(self, statement: str) -> None:
+        if self.paused:
+            return
+        key = _normalize(statement)
+        with self._lock:
+            self._entry(key).traced += 1
+
+    def record(
+        self,
+        key: str,
+        elapsed: float,
+        calls: int = 1,
+        sql: Optional[str] = None,
+        params: Any = None,
+    ) -> None:
+        if self.paused:
+            return
+        with self._lock:
+            entry = self._entry(key)
+            entry.calls += calls
+            entry.timed += 1
+            entry.total += elapsed
+            entry.max = max(entry.max, elapsed)
+            if sql is not None:
+                entry.sql = sql
+                entry.params = params if params is not None else ()
+
+    def add_fetch(self, key: str, elapsed: float, rows: int) -> None:
+        if self.paused:
+            return
+        with self._lock:
+            entry = self._entry(key)
+            entry.total += elapsed
+            entry.rows += rows
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self.started_at = datetime.utcnow()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Statements ordered by total time spent in them, slowest first.
+
+        ``calls`` counts parameter sets and ``executions`` the execute or
+        executemany calls that ran them, so an executemany of five rows is five
+        calls in one execution. ``mean_ms`` is per call (mean_ms * calls ==
+        total_ms); ``max_ms`` is the slowest single execution.
+        """
+        with self._lock:
+            rows = [
+                {
+                    "statement": key,
+                    "calls": entry.calls if entry.timed else entry.traced,
+                    "executions": entry.timed if entry.timed else entry.traced,
+                    "total_ms": entry.total * 1000,
+                    "mean_ms": entry.total * 1000 / entry.calls if entry.calls else 0.0,
+                    "max_ms": entry.max * 1000,
+                    "rows": entry.rows,
+                    "plan": None,
+                    "_sql": entry.sql,
+                    "_params": entry.params,
+                }
+                for key, entry in self._stats.items()
+            ]
+        rows.sort(key=lambda row: (row["total_ms"], row["calls"]), reverse=True)
+        return rows
+
+    def report(self, conn: sqlite3.Connection, explain: int = SQL_PROFILE_EXPLAIN) -> Dict[str, Any]:
+        """Snapshot plus EXPLAIN QUERY PLAN for the ``explain`` slowest DML/query statements."""
+        statements = self.snapshot()
+        remaining = max(explain, 0)
+        with self.pause():
+            for row in statements:
+                if not remaining:
+                    break
+                sql = row["_sql"]
+                if not sql or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+                    continue
+                # Plain INSERT ... VALUES has no plan; keep the slot for a statement that does.
+                plan = explain_query_plan(conn, sql, row["_params"])
+                if plan:
+                    row["plan"] = plan
+                    remaining -= 1
+        for row in statements:
+            del row["_sql"], row["_params"]
+        return {
+            "started_at": self.started_at.isoformat(),
+            "generated_at": datetime.utcnow().isoformat(),
+            "statements": statements,
+        }
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str, params: Any = ()) -> List[str]:
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as exc:
+        return [f"(unavailable: {exc})"]
+    depth: Dict[int, int] = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+sql_profiler = SQLProfiler()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    _profile_key: Optional[str] = None
+
+    def execute(self, sql: str, parameters: Any = ()) -> "ProfiledCursor":
+        self._profile_key = normalize_sql(sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            sql_profiler.record(self._profile_key, time.perf_counter() - started, sql=sql, params=parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> "ProfiledCursor":
+        self._profile_key = normalize_sql(sql)
+        batch = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, batch)
+        finally:
+            sample = batch[0] if batch else ()
+            sql_profiler.record(
+                self._profile_key, time.perf_counter() - started, calls=len(batch), sql=sql, params=sample
+            )
+
+    def _fetched(self, started: float, rows: int) -> None:
+        if self._profile_key is not None:
+            sql_profiler.add_fetch(self._profile_key, time.perf_counter() - started, rows)
+
+    def fetchone(self) -> Any:
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size: Optional[int] = None) -> List[Any]:
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self) -> Any:
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3.Connection whose statements, commits and fetches are reported to ``sql_profiler``.
+
+    ``Connection.execute`` does not go through an overridden ``cursor()`` in
+    C, so the shortcut methods are re-implemented on top of ProfiledCursor.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(sql_profiler.trace)
+
+    def cursor(self, factory: Any = ProfiledCursor) -> sqlite3.Cursor:
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> sqlite3.Cursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _timed(self, statement: str, operation: Any) -> None:
+        started = time.perf_counter()
+        try:
+            operation()
+        finally:
+            sql_profiler.record(statement, time.perf_counter() - started)
+
+    def commit(self) -> None:
+        if self.in_transaction:
+            self._timed("COMMIT", super().commit)
+        else:
+            super().commit()
+
+    def rollback(self) -> None:
+        if self.in_transaction:
+            self._timed("ROLLBACK", super().rollback)
+        else:
+            super().rollback()
@@ -1,11 +1,106 @@
 from __future__ import annotations
 
+import atexit
 import hashlib
-from typing import Optional
+import hmac
+import json
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
-from config import get_fernet
+from cryptography.fernet import InvalidToken
 
-_fernet = get_fernet()
+from config import (
+    DECRYPT_CACHE_SIZE,
+    DECRYPT_CACHE_TTL,
+    DECRYPT_CHUNK_SIZE,
+    DECRYPT_EXECUTOR,
+    DECRYPT_WORKERS,
+    get_audit_chain_key,
+    get_blind_index_key,
+    get_keyring,
+)
+
+# Ciphertexts are stored as "<key id>:<Fernet token>" so decryption picks its key with one
+# dict lookup. Fernet tokens are URL-safe base64 and never contain ":", so untagged tokens
+# written before key ids existed are recognised and sent to the legacy key.
+_primary_key_id, _keyring, _legacy_fernet = get_keyring()
+_blind_index_key = get_blind_index_key()
+_executor: Optional[Executor] = None
+_executor_spec: Optional[Tuple[str, int]] = None
+_executor_lock = threading.Lock()
+
+
+class DecryptCache:
+    """Size- and age-bounded LRU of plaintexts keyed by the SHA-256 of their ciphertext.
+
+    Plaintexts are held in bytearrays so evicted or cleared entries can be
+    overwritten with zeros; the str handed back to callers is a copy Python
+    cannot scrub, so this narrows rather than eliminates plaintext residue.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max(max_size, 0)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Tuple[float, bytearray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def _zero(buffer: bytearray) -> None:
+        buffer[:] = bytes(len(buffer))
+
+    def get(self, digest: bytes) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[digest]
+                self._zero(entry[1])
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[1].decode("utf-8")
+
+    def put(self, digest: bytes, plaintext: str) -> None:
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._zero(previous[1])
+            self._entries[digest] = (time.monotonic(), bytearray(plaintext.encode("utf-8")))
+            while len(self._entries) > self.max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._zero(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, buffer in self._entries.values():
+                self._zero(buffer)
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+_decrypt_cache = DecryptCache(DECRYPT_CACHE_SIZE, DECRYPT_CACHE_TTL)
 
 
 def hash_password(password: str) -> str:
@@ -16,16 +111,238 @@ def verify_password(password: str, hashed: str) -> bool:
     return hash_password(password) == hashed
 
 
+def primary_key_id() -> str:
+    return _primary_key_id
+
+
+def key_id_of(value: str) -> Optional[str]:
+    """Key id a ciphertext was written with, or None for an untagged legacy token."""
+    key_id, sep, _ = value.partition(":")
+    return key_id if sep else None
+
+
 def encrypt_value(value: Optional[str]) -> Optional[str]:
     if value is None:
         return None
-    return _fernet.encrypt(value.encode("utf-8")).decode("utf-8")
+    token = _keyring[_primary_key_id].encrypt(value.encode("utf-8")).decode("utf-8")
+    return f"{_primary_key_id}:{token}"
 
 
-def decrypt_value(value: Optional[str]) -> Optional[str]:
+def _decrypt_token(value: Optional[str]) -> Optional[str]:
     if value is None:
         return None
-    return _fernet.decrypt(value.encode("utf-8")).decode("utf-8")
+    key_id, sep, token = value.partition(":")
+    if not sep:
+        return _legacy_fernet.decrypt(value.encode("utf-8")).decode("utf-8")
+    fernet = _keyring.get(key_id)
+    if fernet is None:
+        raise InvalidToken(f"No key with id {key_id!r} in the keyring")
+    return fernet.decrypt(token.encode("utf-8")).decode("utf-8")
+
+
+def _token_digest(value: str) -> bytes:
+    return hashlib.sha256(value.encode("utf-8")).digest()
+
+
+def decrypt_value(value: Optional[str]) -> Optional[str]:
+    if value is None or not _decrypt_cache.enabled:
+        return _decrypt_token(value)
+    digest = _token_digest(value)
+    plaintext = _decrypt_cache.get(digest)
+    if plaintext is None:
+        plaintext = _decrypt_token(value)
+        _decrypt_cache.put(digest, plaintext)
+    return plaintext
+
+
+def decrypt_cache_stats() -> Dict[str, int]:
+    return _decrypt_cache.stats()
+
+
+def clear_decrypt_cache() -> None:
+    _decrypt_cache.clear()
+
+
+def reload_keys() -> None:
+    """Re-read the keyring after it changed; drops cached plaintexts and workers."""
+    global _primary_key_id, _keyring, _legacy_fernet
+    _primary_key_id, _keyring, _legacy_fernet = get_keyring()
+    _decrypt_cache.clear()
+    shutdown_executor()
+
+
+def _encrypt_chunk(values: Sequence[Optional[str]]) -> List[Optional[str]]:
+    return [encrypt_value(value) for value in values]
+
+
+def _decrypt_chunk(values: Sequence[Optional[str]]) -> List[Optional[str]]:
+    return [_decrypt_token(value) for value in values]
+
+
+def _reencrypt_chunk(values: Sequence[Optional[str]]) -> List[Optional[str]]:
+    prefix = f"{_primary_key_id}:"
+    return [
+        value if value is None or value.startswith(prefix) else encrypt_value(_decrypt_token(value))
+        for value in values
+    ]
+
+
+def _get_executor(kind: str, workers: int) -> Executor:
+    global _executor, _executor_spec
+    with _executor_lock:
+        if _executor is None or _executor_spec != (kind, workers):
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            if kind == "thread":
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fernet")
+            else:
+                # Spawned workers re-read the keyring from the inherited environment and
+                # avoid forking a process that already runs Streamlit's threads.
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            _executor_spec = (kind, workers)
+        return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor, _executor_spec
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _executor_spec = None
+
+
+atexit.register(shutdown_executor)
+
+
+def _map_chunks(
+    func: Callable[[Sequence[Optional[str]]], List[Optional[str]]],
+    values: Sequence[Optional[str]],
+    workers: Optional[int],
+    chunk_size: Optional[int],
+    executor: Optional[str],
+) -> List[Optional[str]]:
+    workers = DECRYPT_WORKERS if workers is None else workers
+    chunk_size = max(DECRYPT_CHUNK_SIZE if chunk_size is None else chunk_size, 1)
+    if workers <= 1 or len(values) <= chunk_size:
+        return func(values)
+    chunks = [values[start:start + chunk_size] for start in range(0, len(values), chunk_size)]
+    pool = _get_executor(executor or DECRYPT_EXECUTOR, workers)
+    results: List[Optional[str]] = []
+    # Executor.map yields in submission order, so row order is preserved.
+    for part in pool.map(func, chunks):
+        results.extend(part)
+    return results
+
+
+def encrypt_many(
+    values: Sequence[Optional[str]],
+    *,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    executor: Optional[str] = None,
+) -> List[Optional[str]]:
+    return _map_chunks(_encrypt_chunk, list(values), workers, chunk_size, executor)
+
+
+def decrypt_many(
+    values: Sequence[Optional[str]],
+    *,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    executor: Optional[str] = None,
+) -> List[Optional[str]]:
+    """Decrypt tokens in order, fanning chunks out to a worker pool when configured."""
+    values = list(values)
+    if not _decrypt_cache.enabled:
+        return _map_chunks(_decrypt_chunk, values, workers, chunk_size, executor)
+    results: List[Optional[str]] = [None] * len(values)
+    missing: List[int] = []
+    digests: Dict[int, bytes] = {}
+    for index, value in enumerate(values):
+        if value is None:
+            continue
+        digests[index] = _token_digest(value)
+        cached = _decrypt_cache.get(digests[index])
+        if cached is None:
+            missing.append(index)
+        else:
+            results[index] = cached
+    if missing:
+        plain = _map_chunks(_decrypt_chunk, [values[index] for index in missing], workers, chunk_size, executor)
+        for index, plaintext in zip(missing, plain):
+            results[index] = plaintext
+            _decrypt_cache.put(digests[index], plaintext)
+    return results
+
+
+def reencrypt_many(
+    values: Sequence[Optional[str]],
+    *,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    executor: Optional[str] = None,
+) -> List[Optional[str]]:
+    """Re-encrypt tokens under the primary key (tokens already under it are returned as-is)."""
+    return _map_chunks(_reencrypt_chunk, list(values), workers, chunk_size, executor)
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+def normalize_contact(contact: str) -> str:
+    return "".join(ch for ch in contact if ch.isdigit())
+
+
+def _blind_index(kind: str, normalized: str) -> Optional[str]:
+    if not normalized:
+        return None
+    message = f"{kind}:{normalized}".encode("utf-8")
+    return hmac.new(_blind_index_key, message, hashlib.sha256).hexdigest()
+
+
+def name_index(name: Optional[str]) -> Optional[str]:
+    """Keyed HMAC of the normalized name, for exact-match lookups without decryption."""
+    return _blind_index("name", normalize_name(name)) if name else None
+
+
+def contact_index(contact: Optional[str]) -> Optional[str]:
+    return _blind_index("contact", normalize_contact(contact)) if contact else None
+
+
+# Previous hash of the first entry in the audit chain.
+AUDIT_CHAIN_GENESIS = "0" * 64
+# Built once: json.dumps with options constructs a new encoder on every call.
+_chain_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def audit_row_hash(
+    prev_hash: str,
+    log_id: int,
+    user_id: Optional[int],
+    role: str,
+    action: str,
+    timestamp: str,
+    details: Optional[str],
+) -> str:
+    """SHA-256 over an audit entry and the hash of the entry before it."""
+    payload = _chain_encoder.encode([log_id, user_id, role, action, timestamp, details])
+    return hashlib.sha256(f"{prev_hash}\n{payload}".encode("utf-8")).hexdigest()
+
+
+def sign_checkpoint(log_id: int, row_hash: str, created_at: str, prev_signature: str) -> str:
+    # The key is read per call: only checkpointing needs it, so the app runs without it.
+    message = f"{log_id}|{row_hash}|{created_at}|{prev_signature}".encode("utf-8")
+    return hmac.new(get_audit_chain_key(), message, hashlib.sha256).hexdigest()
+
+
+# Bump whenever mask_name/mask_contact/mask_text change so that
+# refresh_anonymized_fields recomputes the masks produced by older rules.
+MASK_RULES_VERSION = 1
 
 
 def mask_name(patient_id: int) -> str:
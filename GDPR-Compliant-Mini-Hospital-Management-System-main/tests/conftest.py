@@ -0,0 +1,26 @@
+import os
+
+from cryptography.fernet import Fernet
+
+# Keys must exist before config is imported, or it would generate them into a .env file
+# (and refuse to sign audit-chain checkpoints without AUDIT_CHAIN_KEY).
+os.environ.setdefault("FERNET_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("BLIND_INDEX_KEY", "test-blind-index-key")
+os.environ.setdefault("AUDIT_CHAIN_KEY", "test-audit-chain-key")
+
+import pytest  # noqa: E402
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated database under a temporary working directory."""
+    database.flush_audit_log()
+    database.close_pool()
+    monkeypatch.chdir(tmp_path)
+    database._user_cache.clear()
+    database.init_db(seed=False)
+    yield database
+    database.flush_audit_log()
+    database.close_pool()
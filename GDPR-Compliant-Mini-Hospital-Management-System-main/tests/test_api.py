@@ -0,0 +1,99 @@
+import pytest
+from starlette.testclient import TestClient
+
+import api
+
+PASSWORD = "correct horse battery"
+
+
+@pytest.fixture
+def client(db):
+    for role in ("admin", "doctor", "receptionist"):
+        db.create_user(role, PASSWORD, role)
+    # No lifespan: the db fixture has already migrated a fresh database.
+    return TestClient(api.app)
+
+
+def auth(role, password=PASSWORD):
+    return (role, password)
+
+
+def _audited(db, action):
+    db.flush_audit_log()
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT role, details FROM logs WHERE action = ? ORDER BY log_id", (action,))
+        return [tuple(row) for row in rows]
+
+
+def test_requests_without_valid_credentials_are_rejected(client, db):
+    response = client.get("/patients")
+    assert response.status_code == 401
+    assert response.headers["www-authenticate"].startswith("Basic")
+    assert client.get("/patients", auth=auth("admin", "wrong")).status_code == 401
+    assert _audited(db, "login_failed") == [("unauthorized", "username=admin, via=api")]
+
+
+def test_role_gates(client):
+    assert client.get("/logs", auth=auth("doctor")).status_code == 403
+    assert client.get("/patients?sensitive=1", auth=auth("doctor")).status_code == 403
+    assert client.get("/patients/export.csv", auth=auth("receptionist")).status_code == 403
+    assert client.get("/logs", auth=auth("admin")).status_code == 200
+
+
+def test_sensitive_fields_are_opt_in(client):
+    patient = {"name": "Mary Major", "contact": "555-222-3333", "diagnosis": "Bronchitis"}
+    created = client.post("/patients", json=patient, auth=auth("receptionist"))
+    assert created.status_code == 201
+    patient_id = created.json()["patient_id"]
+
+    masked = client.get(f"/patients/{patient_id}", auth=auth("admin")).json()
+    assert "name" not in masked and masked["anonymized_name"] == f"ANON_{patient_id:04d}"
+    plain = client.get(f"/patients/{patient_id}?sensitive=1", auth=auth("admin")).json()
+    assert plain["name"] == "Mary Major"
+
+
+def test_error_paths(client):
+    assert client.patch("/patients/999", json={"diagnosis": "Flu"}, auth=auth("admin")).status_code == 404
+    assert client.delete("/patients/999", auth=auth("admin")).status_code == 404
+    assert client.get("/patients/999", auth=auth("doctor")).status_code == 404
+    assert client.post("/patients", json={"name": "Only"}, auth=auth("admin")).status_code == 400
+    assert client.patch("/patients/1", content=b"not json", auth=auth("admin")).status_code == 400
+    assert client.get("/patients?after=notadate,5", auth=auth("doctor")).status_code == 400
+    assert client.get("/patients?page_size=0", auth=auth("doctor")).status_code == 400
+    assert client.get('/patients/search?q="*(', auth=auth("doctor")).status_code == 400
+    assert client.get("/patients/search?added_after=yesterday", auth=auth("doctor")).status_code == 400
+
+
+def test_paging_follows_next(client):
+    for i in range(5):
+        body = {"name": f"Patient {i}", "contact": f"555-000-000{i}", "diagnosis": "Checkup"}
+        client.post("/patients", json=body, auth=auth("receptionist"))
+    seen, url = [], "/patients?page_size=2"
+    while url:
+        page = client.get(url, auth=auth("doctor")).json()
+        seen.extend(p["patient_id"] for p in page["patients"])
+        url = f"/patients?page_size=2&after={page['next']}" if page["next"] else None
+    assert sorted(seen) == [1, 2, 3, 4, 5] and len(seen) == 5
+
+
+def test_every_request_is_audited(client, db):
+    body = {"name": "Sam Poe", "contact": "555-444-1212", "diagnosis": "Angina"}
+    patient_id = client.post("/patients", json=body, auth=auth("receptionist")).json()["patient_id"]
+    client.get("/patients", auth=auth("doctor"))
+    client.get(f"/patients/{patient_id}?sensitive=1", auth=auth("admin"))
+    client.get("/patients/search?q=ang", auth=auth("doctor"))
+    client.get("/patients/find?name=Sam%20Poe", auth=auth("doctor"))
+    client.patch(f"/patients/{patient_id}", json={"diagnosis": "Stable angina"}, auth=auth("receptionist"))
+    client.get("/logs", auth=auth("admin"))
+    client.get("/patients/export.csv", auth=auth("admin")).read()
+    client.delete(f"/patients/{patient_id}", auth=auth("admin"))
+
+    assert _audited(db, "add_patient") == [("receptionist", f"patient_id={patient_id}, via=api")]
+    assert _audited(db, "view_patients") == [("doctor", "count=1, sensitive=False, via=api")]
+    assert _audited(db, "view_patient") == [("admin", f"patient_id={patient_id}, sensitive=True, via=api")]
+    assert _audited(db, "search_patients") == [("doctor", "results=1, sensitive=False, via=api")]
+    assert _audited(db, "find_patient") == [("doctor", "matches=1, via=api")]
+    assert _audited(db, "update_patient") == [("receptionist", f"patient_id={patient_id}, via=api")]
+    assert _audited(db, "view_logs") == [("admin", "Audit trail read via api")]
+    assert _audited(db, "export") == [("admin", "Patient export via api, sensitive=True")]
+    assert _audited(db, "delete_patient") == [("admin", f"patient_id={patient_id}, via=api")]
@@ -0,0 +1,61 @@
+import gzip
+
+import pytest
+
+import archive
+import audit_chain
+
+
+def _old_events(db, month, count):
+    db.insert_logs_many(
+        (None, "system", "test_event", f"{month}-{day + 1:02d}T12:00:00", f"event {day}") for day in range(count)
+    )
+
+
+def _archive(db, tmp_path):
+    return archive.archive_logs(30, directory=tmp_path / "archive", batch_size=4)
+
+
+def test_archive_moves_old_entries_and_keeps_the_chain(db, tmp_path):
+    _old_events(db, "2020-01", 6)
+    _old_events(db, "2020-02", 3)
+    assert _archive(db, tmp_path) == 9
+    assert [segment["rows"] for segment in archive.list_segments()] == [6, 3]
+
+    entries = list(archive.iter_archived_entries(tmp_path / "archive"))
+    assert sorted(entry["details"] for entry in entries if entry["timestamp"] < "2020-02") == [
+        f"event {day}" for day in range(6)
+    ]
+    report = audit_chain.verify_audit_chain(full=True, archived=archive.iter_archived_entries(tmp_path / "archive"))
+    assert report["ok"], report["error"]
+
+
+def test_recover_truncates_appends_that_never_committed(db, tmp_path):
+    _old_events(db, "2020-01", 3)
+    _archive(db, tmp_path)
+    segment = tmp_path / "archive" / "logs-2020-01.jsonl.gz"
+    committed = segment.stat().st_size
+    # A run that crashed after appending its gzip member but before its commit.
+    with segment.open("ab") as handle:
+        handle.write(gzip.compress(b'{"log_id": 999, "details": "uncommitted"}\n'))
+
+    _old_events(db, "2020-01", 2)
+    assert _archive(db, tmp_path) == 2
+    assert segment.stat().st_size > committed
+    details = [entry["details"] for entry in archive.iter_archived_entries(tmp_path / "archive")]
+    assert "uncommitted" not in details
+    assert len(details) == 5
+    report = audit_chain.verify_audit_chain(full=True, archived=archive.iter_archived_entries(tmp_path / "archive"))
+    assert report["ok"], report["error"]
+
+
+def test_truncated_segment_is_refused(db, tmp_path):
+    _old_events(db, "2020-01", 3)
+    _archive(db, tmp_path)
+    segment = tmp_path / "archive" / "logs-2020-01.jsonl.gz"
+    with segment.open("r+b") as handle:
+        handle.truncate(segment.stat().st_size - 1)
+
+    _old_events(db, "2020-01", 1)
+    with pytest.raises(archive.ArchiveError, match="shorter than its index entry"):
+        _archive(db, tmp_path)
@@ -0,0 +1,127 @@
+import pytest
+
+import audit_chain
+from config import MissingKeyError
+
+
+def _write_events(db, count):
+    for i in range(count):
+        db.log_action(None, "system", "test_event", f"event {i}")
+    db.flush_audit_log()
+
+
+def test_checkpoints_need_an_external_key(db, monkeypatch, tmp_path):
+    _write_events(db, 3)
+    monkeypatch.delenv("AUDIT_CHAIN_KEY")
+    with pytest.raises(MissingKeyError):
+        audit_chain.verify_audit_chain()
+    assert not (tmp_path / ".env").exists()
+    assert audit_chain.chain_status()["checkpoint"] is None
+
+
+def test_incremental_walks_the_checkpoint_chain(db):
+    _write_events(db, 3)
+    assert audit_chain.verify_audit_chain()["ok"]
+    _write_events(db, 3)
+    assert audit_chain.verify_audit_chain(min_entries=1)["ok"]
+    _write_events(db, 3)
+    audit_chain._trusted.clear()  # as in a freshly started process
+    with db.get_connection() as conn:
+        first = conn.execute("SELECT MIN(checkpoint_id) FROM audit_checkpoints").fetchone()[0]
+        conn.execute("DELETE FROM audit_checkpoints WHERE checkpoint_id = ?", (first,))
+        conn.commit()
+
+    report = audit_chain.verify_audit_chain()
+    assert not report["ok"]
+    assert "invalid signature" in report["error"]
+
+
+def _tamper(db, sql, *params):
+    with db.get_connection() as conn:
+        conn.execute(sql, params)
+        conn.commit()
+
+
+def test_incremental_detects_tampering_after_the_checkpoint(db):
+    _write_events(db, 5)
+    assert audit_chain.verify_audit_chain()["ok"]
+    _write_events(db, 5)
+    last = audit_chain.chain_status()["last_log_id"]
+    _tamper(db, "UPDATE logs SET details = 'edited' WHERE log_id = ?", last - 2)
+
+    report = audit_chain.verify_audit_chain()
+    assert not report["ok"]
+    assert report["broken_log_id"] == last - 2
+
+
+def test_incremental_detects_removed_newest_entries(db):
+    _write_events(db, 5)
+    last = audit_chain.chain_status()["last_log_id"]
+    _tamper(db, "DELETE FROM logs WHERE log_id = ?", last)
+
+    report = audit_chain.verify_audit_chain()
+    assert not report["ok"]
+    assert "newer entries were removed" in report["error"]
+
+
+def test_only_full_mode_detects_rewrites_behind_the_checkpoint(db):
+    _write_events(db, 5)
+    assert audit_chain.verify_audit_chain()["ok"]
+    first = audit_chain.chain_status()["genesis_log_id"]
+    _tamper(db, "UPDATE logs SET action = 'forged' WHERE log_id = ?", first + 1)
+
+    assert audit_chain.verify_audit_chain()["ok"]
+    report = audit_chain.verify_audit_chain(full=True)
+    assert not report["ok"]
+    assert report["broken_log_id"] == first + 1
+
+
+def test_breaks_are_logged_once(db, monkeypatch):
+    monkeypatch.setattr(audit_chain, "_reported", None)
+    _write_events(db, 3)
+    _tamper(db, "UPDATE logs SET details = 'edited' WHERE log_id = ?", audit_chain.chain_status()["genesis_log_id"])
+    audit_chain.verify_audit_chain()
+    audit_chain.verify_audit_chain()
+    db.flush_audit_log()
+    with db.get_connection() as conn:
+        logged = conn.execute("SELECT COUNT(*) FROM logs WHERE action = 'audit_chain_broken'").fetchone()[0]
+    assert logged == 1
+
+
+def test_checkpoints_wait_for_enough_new_entries(db):
+    _write_events(db, 3)
+    first = audit_chain.verify_audit_chain(min_entries=5)["checkpoint"]
+    _write_events(db, 3)
+    assert audit_chain.verify_audit_chain(min_entries=5)["checkpoint"] == first
+    _write_events(db, 3)
+    assert audit_chain.verify_audit_chain(min_entries=5)["checkpoint"]["log_id"] > first["log_id"]
+    assert audit_chain.chain_status()["checkpoints"] == 2
+
+
+def test_incremental_checks_only_new_checkpoints(db, monkeypatch):
+    for _ in range(4):
+        _write_events(db, 2)
+        assert audit_chain.verify_audit_chain(min_entries=1)["ok"]
+    checked = []
+    signed = audit_chain._signed
+
+    def counting(checkpoint):
+        checked.append(checkpoint["checkpoint_id"])
+        return signed(checkpoint)
+
+    monkeypatch.setattr(audit_chain, "_signed", counting)
+    _write_events(db, 2)
+    assert audit_chain.verify_audit_chain(min_entries=1)["ok"]
+    assert checked == []
+    audit_chain._trusted.clear()
+    _write_events(db, 2)
+    assert audit_chain.verify_audit_chain(min_entries=1)["ok"]
+    assert len(checked) == 5
+
+
+def test_verify_job_does_not_start_without_a_key(db, monkeypatch, capsys):
+    monkeypatch.delenv("AUDIT_CHAIN_KEY")
+    monkeypatch.setattr(audit_chain, "_verify_thread", None)
+    audit_chain.start_verify_job(60)
+    assert audit_chain._verify_thread is None
+    assert "AUDIT_CHAIN_KEY is not set" in capsys.readouterr().err
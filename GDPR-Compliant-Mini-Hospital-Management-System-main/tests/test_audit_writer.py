@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+
+import database
+
+
+def _rows(n, details="event"):
+    return [(None, "system", "test", f"2026-01-01T00:00:{i:02d}", f"{details} {i}") for i in range(n)]
+
+
+def _logged(action="test"):
+    with database.get_connection() as conn:
+        return [row["details"] for row in conn.execute("SELECT details FROM logs WHERE action = ? ORDER BY log_id", (action,))]
+
+
+def test_batch_is_committed(db):
+    writer = database.AuditWriter(flush_interval=0.01)
+    for row in _rows(5):
+        writer.submit(row)
+    writer.flush()
+    writer.close()
+    assert _logged() == [f"event {i}" for i in range(5)]
+
+
+def test_poison_row_is_set_aside_and_the_rest_committed(db, tmp_path, monkeypatch):
+    insert = database._insert_logs
+
+    def failing(conn, rows):
+        if any(row[4] == "event 2" for row in rows):
+            raise sqlite3.IntegrityError("poison")
+        insert(conn, rows)
+
+    monkeypatch.setattr(database, "_insert_logs", failing)
+    writer = database.AuditWriter(flush_interval=0.01, dead_letter=tmp_path / "dead.jsonl")
+    for row in _rows(5):
+        writer.submit(row)
+    writer.flush()
+    writer.close()
+    assert _logged() == ["event 0", "event 1", "event 3", "event 4"]
+    assert "event 2" in (tmp_path / "dead.jsonl").read_text()
+
+    monkeypatch.setattr(database, "_insert_logs", insert)
+    assert database.replay_audit_dead_letter(tmp_path / "dead.jsonl") == 1
+    assert not (tmp_path / "dead.jsonl").exists()
+    assert sorted(_logged()) == [f"event {i}" for i in range(5)]
+
+
+def test_unexpected_error_does_not_stop_the_writer(db, tmp_path, monkeypatch):
+    calls = []
+    insert = database._insert_logs
+
+    def crash_once(conn, rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        insert(conn, rows)
+
+    monkeypatch.setattr(database, "_insert_logs", crash_once)
+    writer = database.AuditWriter(flush_interval=0.01, dead_letter=tmp_path / "dead.jsonl")
+    writer.submit(_rows(1)[0])
+    writer.flush()
+    writer.submit(_rows(2, "later")[1])
+    writer.flush()
+    writer.close()
+    assert _logged() == ["later 1"]
+    assert "boom" in (tmp_path / "dead.jsonl").read_text()
+
+
+def test_locked_database_gives_up_after_bounded_retries(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(database.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(
+        database, "_insert_logs", lambda conn, rows: (_ for _ in ()).throw(sqlite3.OperationalError("database is locked"))
+    )
+    writer = database.AuditWriter(flush_interval=0.01, max_attempts=3, dead_letter=tmp_path / "dead.jsonl")
+    for row in _rows(3):
+        writer.submit(row)
+    done = threading.Event()
+    threading.Thread(target=lambda: (writer.flush(), done.set()), daemon=True).start()
+    assert done.wait(10), "flush() must return even when every write fails"
+    writer.close()
+    assert (tmp_path / "dead.jsonl").read_text().count("database is locked") == 3
@@ -0,0 +1,52 @@
+import sqlite3
+import threading
+
+import pytest
+
+import backup
+
+
+def test_snapshot_verify_restore_round_trip(db, tmp_path):
+    kept = db.insert_patient("Ada Lovelace", "555-010-0001", "Migraine")
+    manifest = backup.create_backup(tmp_path / "backups", pages=1, pause=0)
+    assert backup.verify_backup(directory=tmp_path / "backups")["sha256"] == manifest["sha256"]
+
+    db.insert_patient("Added Later", "555-010-0002", "Fracture")
+    db.delete_patient(kept)
+    backup.restore_backup(directory=tmp_path / "backups")
+
+    patients = db.fetch_patients(True)
+    assert [(p["patient_id"], p["name"]) for p in patients] == [(kept, "Ada Lovelace")]
+
+
+def test_snapshot_completes_while_the_app_writes(db, tmp_path):
+    db.insert_patients_many([(f"Patient {i}", f"555-{i:07d}", "Checkup") for i in range(2000)])
+    stop = threading.Event()
+    writes = []
+
+    def writer():
+        while not stop.is_set():
+            writes.append(db.insert_patient("Writer", "555-999-0000", "Flu"))
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        manifest = backup.create_backup(tmp_path / "backups", pages=4, pause=0.001)
+    finally:
+        stop.set()
+        thread.join()
+    assert writes
+    assert manifest["steps"] >= 1
+    backup.verify_backup(directory=tmp_path / "backups", into=tmp_path / "check.db")
+    with sqlite3.connect(tmp_path / "check.db") as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        assert conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0] >= 2000
+
+
+def test_tampered_snapshot_is_rejected(db, tmp_path):
+    manifest = backup.create_backup(tmp_path / "backups")
+    with open(manifest["path"], "r+b") as handle:
+        handle.seek(-8, 2)
+        handle.write(b"\0" * 8)
+    with pytest.raises(backup.BackupError, match="Checksum mismatch"):
+        backup.verify_backup(directory=tmp_path / "backups")
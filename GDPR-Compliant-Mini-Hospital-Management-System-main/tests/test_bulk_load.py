@@ -0,0 +1,54 @@
+from datetime import date
+
+import pytest
+
+import db_setup
+
+
+def _patient_schema(db):
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'patients' ORDER BY name")
+        return [tuple(row) for row in rows]
+
+
+def test_bulk_load_restores_indexes_triggers_and_search(db):
+    schema = _patient_schema(db)
+    version = db.change_version()
+    with db.bulk_patient_load():
+        db.insert_patients_many([("Grace Hopper", "555-123-0000", "Pneumonia")] * 50, batch_size=7)
+    assert _patient_schema(db) == schema
+    assert db.change_version() == version + 1
+    assert db.patient_count() == 50
+    assert len(db.search_patients("PNE", 100)) == 50
+    assert len(db.find_patients(name="Grace Hopper")) == 50
+
+    # The triggers are back: a normal insert reaches the search index and the counter.
+    db.insert_patient("Alan Turing", "555-123-1111", "Sepsis")
+    assert [p["anonymized_diagnosis"] for p in db.search_patients("SEP", 10)] == ["SEP***"]
+    assert db.change_version() > version + 1
+
+
+def test_bulk_load_rolls_back_as_a_whole(db):
+    schema = _patient_schema(db)
+    with pytest.raises(RuntimeError):
+        with db.bulk_patient_load():
+            db.insert_patients_many([("Grace Hopper", "555-123-0000", "Pneumonia")] * 20, batch_size=7)
+            raise RuntimeError("interrupted")
+    assert _patient_schema(db) == schema
+    assert db.patient_count() == 0
+
+
+def test_synth_is_deterministic(db, tmp_path, monkeypatch):
+    db_setup.synthesize(300, 500, 30, seed=7, batch_size=64, until=date(2026, 1, 1))
+    with db.get_connection() as conn:
+        first = conn.execute("SELECT anonymized_name, anonymized_diagnosis, date_added FROM patients").fetchall()
+    assert len(first) == 300
+    assert db.fetch_patients(True, page_size=1)[0]["name"]
+
+    db.close_pool()
+    (tmp_path / "again").mkdir()
+    monkeypatch.chdir(tmp_path / "again")
+    db_setup.synthesize(300, 500, 30, seed=7, batch_size=64, until=date(2026, 1, 1))
+    with db.get_connection() as conn:
+        again = conn.execute("SELECT anonymized_name, anonymized_diagnosis, date_added FROM patients").fetchall()
+    assert [tuple(row) for row in again] == [tuple(row) for row in first]
@@ -0,0 +1,59 @@
+import pytest
+from cryptography.fernet import Fernet
+
+import security
+
+
+@pytest.fixture
+def switch_primary(monkeypatch):
+    """Make a new key the primary; the conftest FERNET_KEY stays readable as the legacy key."""
+
+    def switch():
+        monkeypatch.setenv("FERNET_KEYS", f"k2:{Fernet.generate_key().decode()}")
+        security.reload_keys()
+        return "k2"
+
+    yield switch
+    monkeypatch.undo()
+    security.reload_keys()
+
+
+def _key_ids(db):
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT name, contact, diagnosis FROM patients").fetchall()
+    return {security.key_id_of(value) for row in rows for value in row}
+
+
+def test_rotation_reencrypts_and_resumes(db, switch_primary):
+    db.insert_patients_many([(f"Patient {i}", f"555-{i:07d}", "Checkup") for i in range(25)])
+    new_primary = switch_primary()
+    assert new_primary not in _key_ids(db)
+
+    assert db.rotate_patient_keys(batch_size=10, workers=0) == 25
+    assert _key_ids(db) == {new_primary}
+    assert db.get_rotation_progress()["completed_at"] is not None
+    assert db.rotate_patient_keys(batch_size=10, workers=0) == 0
+    assert db.get_patient(1, include_sensitive=True)["name"] == "Patient 0"
+
+
+def test_rotation_does_not_overwrite_concurrent_updates(db, switch_primary, monkeypatch):
+    db.insert_patients_many([(f"Patient {i}", f"555-{i:07d}", "Checkup") for i in range(3)])
+    new_primary = switch_primary()
+    reencrypt = db.reencrypt_many
+    calls = []
+
+    def reencrypt_while_the_app_writes(values, **options):
+        tokens = reencrypt(values, **options)
+        if not calls:
+            # The app edits patient 2 after the rotation read it but before the write-back.
+            db.update_patient(2, diagnosis="Updated meanwhile")
+        calls.append(len(values))
+        return tokens
+
+    monkeypatch.setattr(db, "reencrypt_many", reencrypt_while_the_app_writes)
+    assert db.rotate_patient_keys(batch_size=10, workers=0) == 3
+    # The conflicting batch was read again; only patient 2's untouched name and contact were left.
+    assert calls == [9, 3]
+    assert db.get_patient(2, include_sensitive=True)["diagnosis"] == "Updated meanwhile"
+    assert db.get_patient(1, include_sensitive=True)["diagnosis"] == "Checkup"
+    assert _key_ids(db) == {new_primary}
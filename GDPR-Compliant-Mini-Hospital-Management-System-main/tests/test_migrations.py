@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+
+def _schema(conn):
+    objects = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY name")
+    return [tuple(row) for row in objects]
+
+
+def _versions(conn):
+    return [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    return conn
+
+
+def test_migrate_twice_is_a_no_op(db):
+    with db.get_connection() as conn:
+        schema, versions = _schema(conn), _versions(conn)
+        assert db.migrate(conn) == db.SCHEMA_VERSION
+        assert _schema(conn) == schema
+        assert _versions(conn) == versions == [version for version, _, _ in db.MIGRATIONS]
+
+
+def test_partially_migrated_file_catches_up(db, tmp_path, monkeypatch):
+    conn = _connect(tmp_path / "old.db")
+    try:
+        monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS[:5])
+        assert db.migrate(conn) == 5
+        monkeypatch.undo()
+        assert db.migrate(conn) == db.SCHEMA_VERSION
+        assert db.migrate(conn) == db.SCHEMA_VERSION
+        with db.get_connection() as fresh:
+            assert _schema(conn) == _schema(fresh)
+    finally:
+        conn.close()
+
+
+def test_failed_step_leaves_the_previous_version(db, tmp_path, monkeypatch):
+    def broken(conn):
+        conn.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("boom")
+
+    conn = _connect(tmp_path / "failing.db")
+    try:
+        monkeypatch.setattr(db, "MIGRATIONS", [*db.MIGRATIONS, (db.SCHEMA_VERSION + 1, "broken", broken)])
+        with pytest.raises(RuntimeError, match="boom"):
+            db.migrate(conn)
+        assert _versions(conn)[-1] == db.SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
+    finally:
+        conn.close()
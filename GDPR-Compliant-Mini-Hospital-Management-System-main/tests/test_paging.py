@@ -0,0 +1,42 @@
+def _seed(db, count):
+    # Three records per timestamp, so pages have to break ties on patient_id.
+    db.insert_patients_many(
+        (f"Patient {i}", f"555-{i:07d}", "Checkup", f"2024-01-{i // 3 + 1:02d}T09:00:00") for i in range(count)
+    )
+
+
+def _order(db):
+    return [(p["date_added"], p["patient_id"]) for p in db.fetch_patients()]
+
+
+def test_pages_cover_every_record_once_in_order(db):
+    _seed(db, 23)
+    expected = _order(db)
+    assert expected == sorted(expected, reverse=True)
+
+    seen, cursor = [], None
+    while True:
+        page = db.fetch_patients(page_size=5, after=cursor)
+        seen.extend((p["date_added"], p["patient_id"]) for p in page)
+        if len(page) < 5:
+            break
+        cursor = db.patient_cursor(page[-1])
+    assert seen == expected
+
+
+def test_before_walks_back_to_the_previous_page(db):
+    _seed(db, 12)
+    first = db.fetch_patients(page_size=4)
+    second = db.fetch_patients(page_size=4, after=db.patient_cursor(first[-1]))
+    back = db.fetch_patients(page_size=4, before=db.patient_cursor(second[0]))
+    assert [p["patient_id"] for p in back] == [p["patient_id"] for p in first]
+
+
+def test_inserts_between_pages_do_not_shift_them(db):
+    _seed(db, 10)
+    first = db.fetch_patients(page_size=4)
+    db.insert_patient("Newcomer", "555-111-2222", "Flu")
+    second = db.fetch_patients(page_size=4, after=db.patient_cursor(first[-1]))
+    ids = [p["patient_id"] for p in first + second]
+    assert len(set(ids)) == 8
+    assert [(p["date_added"], p["patient_id"]) for p in first + second] == _order(db)[1:9]
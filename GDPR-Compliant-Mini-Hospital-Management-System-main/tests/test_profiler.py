@@ -0,0 +1,26 @@
+import sqlite3
+
+import pytest
+
+from profiler import ProfiledConnection, sql_profiler
+
+
+@pytest.fixture
+def profiled():
+    sql_profiler.reset()
+    conn = sqlite3.connect(":memory:", factory=ProfiledConnection)
+    yield conn
+    conn.close()
+    sql_profiler.reset()
+
+
+def test_executemany_mean_is_per_call(profiled):
+    profiled.execute("CREATE TABLE t (x INTEGER)")
+    profiled.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(5)])
+    profiled.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(3)])
+
+    (row,) = [row for row in sql_profiler.snapshot() if row["statement"].startswith("INSERT")]
+    assert row["calls"] == 8
+    assert row["executions"] == 2
+    assert row["mean_ms"] * row["calls"] == pytest.approx(row["total_ms"])
+    assert row["max_ms"] <= row["total_ms"]
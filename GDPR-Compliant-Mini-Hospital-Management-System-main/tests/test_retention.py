@@ -0,0 +1,83 @@
+import threading
+import time
+
+from security import MASK_RULES_VERSION
+
+
+def _expire(db, patient_id):
+    with db.get_connection() as conn:
+        conn.execute("UPDATE patients SET date_added = '2000-01-01T00:00:00' WHERE patient_id = ?", (patient_id,))
+        conn.commit()
+
+
+def _masks(db, patient_id):
+    with db.get_connection() as conn:
+        row = conn.execute(
+            """
+            SELECT anonymized_name, anonymized_contact, anonymized_diagnosis, mask_version, anonymized_at
+              FROM patients WHERE patient_id = ?
+            """,
+            (patient_id,),
+        ).fetchone()
+    return dict(row)
+
+
+def test_anonymize_sets_masks_that_refresh_reproduces(db):
+    patient_id = db.insert_patient("Jane Roe", "555-123-4567", "Influenza A")
+    _expire(db, patient_id)
+
+    assert db.purge_expired_patients(30, mode="anonymize", pause=0) == 1
+    masks = _masks(db, patient_id)
+    assert masks["anonymized_at"] is not None
+    assert masks["mask_version"] == MASK_RULES_VERSION
+    assert masks["anonymized_name"] == f"ANON_{patient_id:04d}"
+    assert "555" not in masks["anonymized_contact"]
+    assert masks["anonymized_diagnosis"] == "INF***"
+
+    db.refresh_anonymized_fields(force=True)
+    assert _masks(db, patient_id) == masks
+    assert db.count_stale_masks() == 0
+
+
+def test_run_retention_now_runs_in_background(db):
+    patient_id = db.insert_patient("John Doe", "555-000-1111", "Asthma")
+    _expire(db, patient_id)
+
+    assert db.run_retention_now(30, "erase")
+    deadline = time.monotonic() + 10
+    while db.retention_run_status()["running"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    status = db.retention_run_status()
+    assert not status["running"]
+    assert status["error"] is None
+    assert status["processed"] == 1
+    assert db.patient_count() == 0
+
+
+def test_retention_runs_share_one_running_flag(db, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_purge(*args, progress=None, **kwargs):
+        started.set()
+        release.wait(10)
+        progress(3)
+        return 3
+
+    monkeypatch.setattr(db, "purge_expired_patients", slow_purge)
+    assert db.run_retention_now(30, "erase")
+    assert started.wait(10)
+    try:
+        # A second manual run and the scheduled pass both have to wait their turn.
+        assert not db.run_retention_now(30, "erase")
+        assert not db._claim_retention_run()
+        assert db.retention_run_status()["running"]
+    finally:
+        release.set()
+    deadline = time.monotonic() + 10
+    while db.retention_run_status()["running"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert db.retention_run_status()["processed"] == 3
+
+    assert db._claim_retention_run()
+    db._retention_pass(30, "erase", None, "system", "retention-job")
+    assert not db.retention_run_status()["running"]